@@ -0,0 +1,599 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import time
+import logging
+import tempfile
+import os
+import sys
+import json
+import resource
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import shutil
+import multiprocessing
+from sklearn.tree import DecisionTreeClassifier
+from sklearn import svm
+from topology import Topology
+from simulation import Simulation
+from simulation import SIMULATION_ENGINES
+from vectorized import VectorizedSimulation
+from vectorized import SF_LIST
+from vectorized import evaluate_events
+from packet import PacketSf
+from packet import Packet
+from location import Location
+from tracing import TraceRecorder
+from eventstore import EventStore
+from eventlog import EventLog
+from eventlog import ColumnarEventLogWriter
+from node import TrafficType
+from experiment import seed_all
+from experiment import ExperimentRunner
+from experiment import ReplicationController
+from traffic import TrafficTrace
+from traffic import run_sf_policies
+from replay import TraceReplay
+from packet import PhyModel
+from whatif import WhatIfEvaluator
+from online import OnlineSfLearner
+from modelstore import ModelStore
+
+
+def benchmark_topology(number_of_nodes_list):
+    print('Topology generation:')
+    for number_of_nodes in number_of_nodes_list:
+        random.seed(42)
+        start = time.perf_counter()
+        topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=4, node_traffic_proportions=(0.2, 0.8))
+        elapsed = time.perf_counter() - start
+        print('  nodes={:>8} time={:>7.3f} s'.format(len(topology.node_list), elapsed))
+
+
+def benchmark_gateways(number_of_nodes, number_of_gws_list, radius, simulation_duration):
+    # City scale deployments with hexagonal gateway grids, events are only
+    # checked at gateways in range of the transmitting node
+    print('Gateway scaling:')
+    for number_of_gws in number_of_gws_list:
+        random.seed(42)
+        topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=radius, number_of_gws=number_of_gws, gw_placement='hex', node_traffic_proportions=(1, 0))
+        start = time.perf_counter()
+        link_budget = topology.get_link_budget()
+        link_budget_elapsed = time.perf_counter() - start
+        audible = sum(len(gws) for gws in link_budget.audibleGateways) / number_of_nodes
+        simulation = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Lowest)
+        start = time.perf_counter()
+        simulation_result = simulation.run()
+        elapsed = time.perf_counter() - start
+        print('  gws={:>4} audible gws per node={:>6.1f} link budget={:>6.3f} s events={:>7} pdr={:>6.2f} % time={:>7.3f} s'.format(number_of_gws, audible, link_budget_elapsed, simulation_result.totalPacket, simulation_result.pdr, elapsed))
+
+
+def benchmark_scheduler(number_of_nodes_list, network_packet_rate, simulation_duration):
+    # Network wide offered load is kept constant, so the number of events and
+    # the interference work stay the same while the pending queue grows with
+    # the number of nodes
+    print('Scheduler scaling:')
+    for number_of_nodes in number_of_nodes_list:
+        random.seed(42)
+        topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=1, node_traffic_proportions=(1, 0))
+        simulation = Simulation(topology=topology, packet_rate=network_packet_rate / number_of_nodes, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Lowest)
+        start = time.perf_counter()
+        simulation_result = simulation.run()
+        elapsed = time.perf_counter() - start
+        print('  nodes={:>6} events={:>7} time={:>8.3f} s events/sec={:>10.0f}'.format(number_of_nodes, simulation_result.totalPacket, elapsed, simulation_result.totalPacket / elapsed))
+
+
+def benchmark_link_budget(number_of_nodes, number_of_events):
+    # Reception stage cost per event, computing link budgets from locations
+    # versus looking them up from the topology link budget matrix
+    print('Reception stage cost per event:')
+    for number_of_gws in range(1, 5):
+        random.seed(42)
+        topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=number_of_gws, node_traffic_proportions=(1, 0))
+        events = [(random.randrange(number_of_nodes), PacketSf.get_random()) for _ in range(number_of_events)]
+
+        start = time.perf_counter()
+        for node_index, sf in events:
+            tx_node = topology.node_list[node_index]
+            for gw in topology.gateway_list:
+                distance_to_gw = Location.get_distance(tx_node.location, gw.location)
+                rx_sensitivity_dbm = Packet.get_receive_sensitivity(sf)
+                rx_signal_dbm = 14 - Packet.calculate_propagation_loss(distance_to_gw)
+                received = rx_signal_dbm >= rx_sensitivity_dbm
+        computed_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rx_power_dbm_matrix = topology.get_link_budget().rx_power_dbm.tolist()
+        rx_sensitivity_dbm_table = {sf: Packet.get_receive_sensitivity(sf) for sf in PacketSf if sf.value >= 7}
+        for node_index, sf in events:
+            rx_sensitivity_dbm = rx_sensitivity_dbm_table[sf]
+            for rx_signal_dbm in rx_power_dbm_matrix[node_index]:
+                received = rx_signal_dbm >= rx_sensitivity_dbm
+        lookup_elapsed = time.perf_counter() - start
+
+        print('  gws={} computed={:>6.2f} us lookup={:>6.2f} us per event'.format(number_of_gws, 1e6 * computed_elapsed / number_of_events, 1e6 * lookup_elapsed / number_of_events))
+
+
+def benchmark_engines(number_of_nodes, number_of_gws, sf_list, simulation_duration):
+    print('Event by event and vectorized engines:')
+    for sf in sf_list:
+        for engine in [Simulation, VectorizedSimulation]:
+            random.seed(42)
+            topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=number_of_gws, node_traffic_proportions=(0.8, 0.2))
+            simulation = engine(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=sf)
+            start = time.perf_counter()
+            simulation_result = simulation.run()
+            elapsed = time.perf_counter() - start
+            print('  {:<20} {:<9} events={:>7} pdr={:>6.2f} % time={:>8.3f} s'.format(engine.__name__, sf.name, simulation_result.totalPacket, simulation_result.pdr, elapsed))
+
+
+def benchmark_incremental_engine(number_of_nodes_list, number_of_gws, network_packet_rate, simulation_duration):
+    print('Event by event and incremental interference engines:')
+    for number_of_nodes in number_of_nodes_list:
+        for engine in SIMULATION_ENGINES:
+            random.seed(42)
+            topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=number_of_gws, node_traffic_proportions=(0.5, 0.5))
+            simulation = Simulation(topology=topology, packet_rate=network_packet_rate / number_of_nodes, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Random, streaming=True, engine=engine)
+            start = time.perf_counter()
+            simulation_result = simulation.run()
+            elapsed = time.perf_counter() - start
+            print('  nodes={:>6} {:<12} events={:>7} pdr={:>6.2f} % time={:>8.3f} s'.format(number_of_nodes, engine, simulation_result.totalPacket, simulation_result.pdr, elapsed))
+
+
+def benchmark_checkpoint(number_of_nodes, simulation_duration, checkpoint_interval):
+    print('Checkpoint cost:')
+    with tempfile.TemporaryDirectory() as directory:
+        checkpoint_file = os.path.join(directory, 'checkpoint.pkl')
+        for streaming in [False, True]:
+            elapsed = {}
+            for checkpoint in [None, checkpoint_file]:
+                random.seed(42)
+                topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=3, node_traffic_proportions=(0.8, 0.2))
+                simulation = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Random, streaming=streaming, checkpoint=checkpoint, checkpoint_interval=checkpoint_interval)
+                start = time.perf_counter()
+                simulation.run()
+                elapsed[checkpoint] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            Simulation.load_checkpoint(checkpoint_file)
+            load_elapsed = time.perf_counter() - start
+            checkpoints = max(simulation.savedCheckpoints, 1)
+            print('  streaming={:<5} checkpoints={:>3} size={:>8.2f} MB save={:>7.3f} s load={:>7.3f} s'.format(str(streaming), simulation.savedCheckpoints, os.path.getsize(checkpoint_file) / 1024 ** 2, (elapsed[checkpoint_file] - elapsed[None]) / checkpoints, load_elapsed))
+
+
+def replication_job(point, point_seed, replica_seed):
+    topology = Topology.create_random_topology(number_of_nodes=point['number_of_nodes'], radius=3000, node_traffic_proportions=(1, 0))
+    return VectorizedSimulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=3600, sf=point['sf']).run()
+
+
+def benchmark_replication(number_of_nodes_list, sf_list, averaging, controller):
+    print('Fixed and sequential replicas:')
+    runner = ExperimentRunner(workers=1, seed=42)
+    points = [dict(number_of_nodes=number_of_nodes, sf=sf) for sf in sf_list for number_of_nodes in number_of_nodes_list]
+    for name, run in [('fixed', lambda: runner.run(replication_job, points, averaging, name='replication')), ('sequential', lambda: runner.run_until(replication_job, points, controller, name='replication'))]:
+        start = time.perf_counter()
+        results = run()
+        elapsed = time.perf_counter() - start
+        pdr_half_widths = [controller.get_intervals(point_results)[(None, 'pdr')].halfWidth for point_results in results]
+        print('  {:<10} replicas={:>4} pdr half width mean={:>6.3f} max={:>6.3f} time={:>7.3f} s'.format(name, sum(len(point_results) for point_results in results), sum(pdr_half_widths) / len(pdr_half_widths), max(pdr_half_widths), elapsed))
+
+
+def benchmark_common_random_numbers(number_of_nodes, replicas, simulation_duration):
+    print('Independent and common traffic for SF_Smart vs SF_Lowest PDR difference:')
+    seed_all(42)
+    topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=2, node_traffic_proportions=(0.5, 0.5))
+    simulation = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Random)
+    simulation.run()
+    X_train, _, y_train, _ = simulation.get_training_data(test_size=0)
+    classifier = DecisionTreeClassifier(class_weight='balanced').fit(X_train, y_train)
+    policies = {PacketSf.SF_Smart.name: (PacketSf.SF_Smart, classifier.predict), PacketSf.SF_Lowest.name: (PacketSf.SF_Lowest, None)}
+
+    for common in [False, True]:
+        differences = []
+        start = time.perf_counter()
+        for replica in range(replicas):
+            seed_all(replica)
+            if common:
+                traffic = TrafficTrace.generate(topology, 0.01, simulation_duration)
+                results = run_sf_policies(topology, traffic, policies, packet_size=60)
+            else:
+                results = {name: Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=sf, sfPredictor=sf_predictor).run() for name, (sf, sf_predictor) in policies.items()}
+            differences.append(results[PacketSf.SF_Smart.name].pdr - results[PacketSf.SF_Lowest.name].pdr)
+        elapsed = time.perf_counter() - start
+        mean = sum(differences) / replicas
+        deviation = (sum((difference - mean) ** 2 for difference in differences) / (replicas - 1)) ** 0.5
+        print('  {:<11} difference mean={:>6.3f} std={:>6.3f} time={:>7.3f} s'.format('common' if common else 'independent', mean, deviation, elapsed))
+
+
+def benchmark_online_learning(number_of_nodes, simulation_duration, warmup_list):
+    # Training run with random SFs and smart SF run on the same traffic
+    # versus a single run with online learning
+    print('Offline and online smart SF learning:')
+    seed_all(42)
+    topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=3, node_traffic_proportions=(1, 0))
+    traffic = TrafficTrace.generate(topology, 0.01, simulation_duration)
+    start = time.perf_counter()
+    simulation = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Random, traffic=traffic)
+    simulation.run()
+    X_train, _, y_train, _ = simulation.get_training_data(test_size=0)
+    classifier = DecisionTreeClassifier(class_weight='balanced').fit(X_train, y_train)
+    simulation_result = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Smart, sfPredictor=classifier.predict, traffic=traffic).run()
+    elapsed = time.perf_counter() - start
+    print('  {:<24} pdr={:>6.2f} % time={:>7.3f} s'.format('offline', simulation_result.pdr, elapsed))
+
+    for switch, warmup in [('time', warmup) for warmup in warmup_list] + [('accuracy', warmup_list[0])]:
+        learner = OnlineSfLearner(DecisionTreeClassifier(class_weight='balanced'), warmup=warmup, switch=switch, min_accuracy=0.8)
+        start = time.perf_counter()
+        simulation_result = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Smart, traffic=traffic, learner=learner).run()
+        elapsed = time.perf_counter() - start
+        print('  online {:<8} warmup={:<5} pdr={:>6.2f} % time={:>7.3f} s switch at {:.1f} s, {} fits'.format(switch, warmup, simulation_result.pdr, elapsed, simulation_result.sfSwitchTime, learner.fits))
+
+
+def benchmark_model_store(number_of_nodes, simulation_duration):
+    # Training simulation and SVC fit versus loading the stored classifier
+    print('Trained classifier store:')
+    with tempfile.TemporaryDirectory() as directory:
+        model_store = ModelStore(directory)
+        for attempt in ['train', 'load']:
+            seed_all(42)
+            topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=3, node_traffic_proportions=(1, 0))
+
+            def train():
+                simulation = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Random)
+                simulation.run()
+                X_train, _, y_train, _ = simulation.get_training_data(test_size=0)
+                return svm.SVC(class_weight='balanced', gamma='auto').fit(X_train, y_train)
+
+            start = time.perf_counter()
+            key = ModelStore.get_key(topology, [svm.SVC(class_weight='balanced', gamma='auto')], simulation_duration=simulation_duration)
+            classifier = model_store.get_or_train(key, train)
+            elapsed = time.perf_counter() - start
+            print('  {:<5} support vectors={:>6} time={:>8.3f} s'.format(attempt, len(classifier.support_), elapsed))
+        assert model_store.hits == 1, 'stored classifier is not reused'
+
+
+def benchmark_replay(number_of_nodes, simulation_duration, path_loss_exponent_list, batch_size):
+    print('Trace replay under other PHY models:')
+    random.seed(42)
+    topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=3, node_traffic_proportions=(0.8, 0.2))
+    with tempfile.TemporaryDirectory() as directory:
+        writer = ColumnarEventLogWriter(directory)
+        simulation = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Random, streaming=True, sinks=[writer])
+        writer.write_header(simulation)
+        start = time.perf_counter()
+        simulation_result = simulation.run()
+        elapsed = time.perf_counter() - start
+        writer.write_results(simulation_result)
+        print('  simulation            events={:>8} pdr={:>6.2f} % time={:>7.3f} s'.format(simulation_result.totalPacket, simulation_result.pdr, elapsed))
+
+        phy_list = [PhyModel(path_loss_exponent=path_loss_exponent) for path_loss_exponent in path_loss_exponent_list]
+        start = time.perf_counter()
+        replay_results = TraceReplay(directory, batch_size=batch_size).run(phy_list)
+        elapsed = time.perf_counter() - start
+        for phy, replay_result in zip(phy_list, replay_results):
+            print('  path loss exponent={:<4} pdr={:>6.2f} %'.format(phy.pathLossExponent, replay_result.pdr))
+        print('  replay of {} PHY models time={:>7.3f} s, {:.0f} events/s per model'.format(len(phy_list), elapsed, len(phy_list) * simulation_result.totalPacket / elapsed))
+
+
+def benchmark_what_if(number_of_nodes, simulation_duration, number_of_candidates):
+    # Greedy local search over node SFs, each candidate changes one node and
+    # is kept if PDR improves
+    print('Incremental what-if evaluation of SF changes:')
+    random.seed(42)
+    topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=3, node_traffic_proportions=(0.8, 0.2))
+    traffic = TrafficTrace.generate(topology, packet_rate=0.01, simulation_duration=simulation_duration)
+    simulation = VectorizedSimulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Lowest, traffic=traffic)
+    simulation.run()
+    evaluator = WhatIfEvaluator.from_simulation(simulation)
+    start = time.perf_counter()
+    status = evaluate_events(evaluator.time, evaluator.duration, evaluator.sf, evaluator.nodeIndex, evaluator.linkBudget)
+    full_elapsed = time.perf_counter() - start
+    print('  full evaluation       events={:>8} pdr={:>6.2f} % time={:>7.3f} s'.format(len(status), evaluator.simulationResult.pdr, full_elapsed))
+
+    accepted = 0
+    start = time.perf_counter()
+    for _ in range(number_of_candidates):
+        sf_changes = {random.randrange(number_of_nodes): random.choice(SF_LIST)}
+        if evaluator.evaluate(sf_changes).pdr > evaluator.simulationResult.pdr:
+            evaluator.evaluate(sf_changes, commit=True)
+            accepted += 1
+    elapsed = time.perf_counter() - start
+    print('  {} candidates, {} accepted pdr={:>6.2f} % time={:>7.3f} s, {:.4f} s per candidate, {:.0f}x faster than full evaluation'.format(
+        number_of_candidates, accepted, evaluator.simulationResult.pdr, elapsed, elapsed / number_of_candidates, full_elapsed * number_of_candidates / elapsed))
+
+
+def benchmark_tracing(number_of_nodes, simulation_duration):
+    print('Logging and tracing overhead:')
+    trace_file = tempfile.NamedTemporaryFile(suffix='.trace', delete=False)
+    trace_file.close()
+    for name, level, trace in [('ERROR', logging.ERROR, None), ('ERROR+trace', logging.ERROR, TraceRecorder(file_name=trace_file.name)), ('INFO', logging.INFO, None)]:
+        random.seed(42)
+        topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=3, node_traffic_proportions=(1, 0))
+        simulation = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Random, trace=trace)
+        logger = logging.getLogger()
+        handler = logging.FileHandler(os.devnull)
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        start = time.perf_counter()
+        simulation_result = simulation.run()
+        elapsed = time.perf_counter() - start
+        logger.removeHandler(handler)
+        logger.setLevel(logging.WARNING)
+        records = 0
+        if trace is not None:
+            trace.close()
+            records = len(trace.get_records())
+        print('  {:<12} events={:>7} trace records={:>8} time={:>8.3f} s'.format(name, simulation_result.totalPacket, records, elapsed))
+    os.remove(trace_file.name)
+
+
+def benchmark_event_store(number_of_nodes, simulation_duration):
+    # Memory taken by executed events kept as Packet objects versus the
+    # event store, events are taken from a vectorized run
+    print('Event storage memory:')
+    random.seed(42)
+    topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=1, node_traffic_proportions=(1, 0))
+    simulation = VectorizedSimulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Random)
+    simulation.run()
+    events = list(zip(simulation.time.tolist(), simulation.sfCode.tolist(), (simulation.nodeIndex + 2).tolist()))
+
+    for name in ['Packet list', 'EventStore']:
+        tracemalloc.start()
+        start = time.perf_counter()
+        event_queue = [] if name == 'Packet list' else EventStore()
+        for event_time, sf_value, source in events:
+            event_queue.append(Packet(event_time, PacketSf(sf_value), source, size=60))
+        elapsed = time.perf_counter() - start
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('  {:<12} nodes={:>7} events={:>8} memory={:>8.1f} MB peak={:>8.1f} MB bytes/event={:>6.1f} time={:>7.3f} s'.format(name, number_of_nodes, len(event_queue), size / 1e6, peak / 1e6, size / len(event_queue), elapsed))
+        del event_queue
+
+
+def get_path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, file_name)) for file_name in os.listdir(path))
+
+
+def benchmark_event_log(number_of_nodes, simulation_duration):
+    print('Event log write and load:')
+    random.seed(42)
+    topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=1, node_traffic_proportions=(1, 0))
+    simulation = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Random)
+    simulation.run()
+    directory = tempfile.mkdtemp()
+    for format in ['text', 'columnar']:
+        file_name = os.path.join(directory, format)
+        start = time.perf_counter()
+        simulation.write_to_file(file_name, format=format)
+        write_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        if format == 'text':
+            with open(file_name) as file:
+                number_of_events = sum(1 for line in file if line.startswith('(t='))
+        else:
+            number_of_events = len(EventLog(file_name).get_column('status'))
+        load_elapsed = time.perf_counter() - start
+        print('  {:<9} events={:>7} size={:>8.2f} MB write={:>7.3f} s load={:>7.3f} s'.format(format, number_of_events, get_path_size(file_name) / 1e6, write_elapsed, load_elapsed))
+    shutil.rmtree(directory)
+
+
+def benchmark_training_data(number_of_nodes, simulation_duration, cap_list):
+    print('Smart SF training data extraction:')
+    random.seed(42)
+    topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=5000, number_of_gws=1, node_traffic_proportions=(1, 0))
+    simulation = VectorizedSimulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=simulation_duration, sf=PacketSf.SF_Random)
+    simulation.run()
+    for cap in cap_list:
+        tracemalloc.start()
+        start = time.perf_counter()
+        X_train, X_test, y_train, y_test = simulation.get_training_data(test_size=0.2, max_samples_per_node_sf=cap)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('  cap={:>5} events={:>8} samples={:>8} peak={:>7.1f} MB time={:>7.3f} s'.format(str(cap), len(simulation.time), len(X_train) + len(X_test), peak / 1e6, elapsed))
+
+
+SUITE_NODES = [100, 1000, 10000, 100000]
+SUITE_GWS = [1, 4]
+SUITE_SFS = [PacketSf.SF_Lowest, PacketSf.SF_Random, PacketSf.SF_12, PacketSf.SF_Smart]
+SUITE_TRAFFIC = [TrafficType.Poisson, TrafficType.Periodic]
+SUITE_NETWORK_PACKET_RATE = 10  # packets per second for the whole network
+SUITE_DURATION = 1800
+SUITE_SEED = 42
+SUITE_REPEAT = 3
+
+
+def get_scenarios(nodes=None, gws=None, sfs=None, traffic=None):
+    # Fixed scenarios, the network packet rate is kept constant so the number
+    # of events does not explode with the number of nodes
+    scenarios = []
+    for number_of_nodes in nodes or SUITE_NODES:
+        for number_of_gws in gws or SUITE_GWS:
+            for sf in sfs or SUITE_SFS:
+                for traffic_type in traffic or SUITE_TRAFFIC:
+                    scenarios.append({
+                        'name': 'n{}-g{}-{}-{}'.format(number_of_nodes, number_of_gws, sf.name, traffic_type.name),
+                        'number_of_nodes': number_of_nodes,
+                        'number_of_gws': number_of_gws,
+                        'sf': sf.name,
+                        'traffic': traffic_type.name,
+                        'packet_rate': max(0.0001, SUITE_NETWORK_PACKET_RATE / number_of_nodes),
+                        'simulation_duration': SUITE_DURATION,
+                    })
+    return scenarios
+
+
+def run_scenario(scenario, repeat=SUITE_REPEAT):
+    # Runs in a fresh process, so peak RSS belongs to this scenario only.
+    # Timings are the best of repeated runs with the same seed.
+    timings = [run_scenario_once(scenario) for _ in range(repeat)]
+    result = min(timings, key=lambda timing: timing['wall_time'])
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return result
+
+
+def run_scenario_once(scenario):
+    seed_all(SUITE_SEED)
+    node_traffic_proportions = (1, 0) if scenario['traffic'] == TrafficType.Poisson.name else (0, 1)
+    start = time.perf_counter()
+    topology = Topology.create_random_topology(number_of_nodes=scenario['number_of_nodes'], radius=5000, number_of_gws=scenario['number_of_gws'], node_traffic_proportions=node_traffic_proportions)
+    topology_time = time.perf_counter() - start
+
+    sf_predictor = None
+    training_time = 0
+    if PacketSf[scenario['sf']] == PacketSf.SF_Smart:
+        start = time.perf_counter()
+        simulation = Simulation(topology=topology, packet_rate=scenario['packet_rate'], packet_size=60, simulation_duration=scenario['simulation_duration'], sf=PacketSf.SF_Random)
+        simulation.run()
+        X_train, _, y_train, _ = simulation.get_training_data(test_size=0)
+        sf_predictor = DecisionTreeClassifier(class_weight='balanced').fit(X_train, y_train).predict
+        training_time = time.perf_counter() - start
+
+    simulation = Simulation(topology=topology, packet_rate=scenario['packet_rate'], packet_size=60, simulation_duration=scenario['simulation_duration'], sf=PacketSf[scenario['sf']], sfPredictor=sf_predictor)
+    start = time.perf_counter()
+    simulation_result = simulation.run()
+    run_time = time.perf_counter() - start
+
+    return {
+        'events': simulation_result.totalPacket,
+        'pdr': simulation_result.pdr,
+        'topology_time': topology_time,
+        'training_time': training_time,
+        'run_time': run_time,
+        'wall_time': topology_time + training_time + run_time,
+        'events_per_sec': simulation_result.totalPacket / run_time if run_time > 0 else 0,
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(history_file):
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file) as file:
+        return json.load(file)
+
+
+def run_suite(scenarios, history_file, label=None):
+    print('Benchmark suite:')
+    results = {}
+    # A new interpreter per scenario keeps peak RSS and caches independent
+    context = multiprocessing.get_context('spawn')
+    for scenario in scenarios:
+        with context.Pool(processes=1, maxtasksperchild=1) as pool:
+            result = pool.apply(run_scenario, (scenario,))
+        results[scenario['name']] = result
+        print('  {:<32} events={:>7} events/sec={:>9.0f} wall={:>8.3f} s rss={:>7.1f} MB'.format(scenario['name'], result['events'], result['events_per_sec'], result['wall_time'], result['peak_rss_mb']))
+
+    history = load_history(history_file)
+    history.append({
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'label': label,
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'results': results,
+    })
+    directory = os.path.dirname(history_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(history_file, 'w') as file:
+        json.dump(history, file, indent=1)
+    print('Results are appended to {} as run {}'.format(history_file, len(history) - 1))
+
+
+def compare_runs(history_file, base, head, threshold):
+    # Flags scenarios that got slower or use more memory than threshold
+    # ratio, returns the number of regressions
+    history = load_history(history_file)
+    assert len(history) >= 2, 'at least two runs are needed in {}'.format(history_file)
+    base_run = history[base]
+    head_run = history[head]
+    print('Comparing run {} ({}) to run {} ({}):'.format(base, base_run['commit'], head, head_run['commit']))
+    regressions = 0
+    for name, head_result in head_run['results'].items():
+        base_result = base_run['results'].get(name)
+        if base_result is None:
+            continue
+        changes = {
+            'events/sec': head_result['events_per_sec'] / base_result['events_per_sec'] - 1 if base_result['events_per_sec'] > 0 else 0,
+            'wall': head_result['wall_time'] / base_result['wall_time'] - 1 if base_result['wall_time'] > 0 else 0,
+            'rss': head_result['peak_rss_mb'] / base_result['peak_rss_mb'] - 1 if base_result['peak_rss_mb'] > 0 else 0,
+        }
+        # Lower events per second, higher wall time or RSS are regressions
+        regressed = [metric for metric, change in changes.items() if (-change if metric == 'events/sec' else change) > threshold]
+        regressions += len(regressed) > 0
+        print('  {:<32} events/sec {:>+7.1%} wall {:>+7.1%} rss {:>+7.1%} {}'.format(name, changes['events/sec'], changes['wall'], changes['rss'], 'REGRESSION ' + ','.join(regressed) if regressed else ''))
+    print('{} regressions beyond {:.0%}'.format(regressions, threshold))
+    return regressions
+
+
+def run_micro_benchmarks():
+    benchmark_topology(number_of_nodes_list=[1000, 100000, 1000000])
+    benchmark_gateways(number_of_nodes=10000, number_of_gws_list=[1, 16, 128, 512], radius=20000, simulation_duration=600)
+    benchmark_engines(number_of_nodes=1000, number_of_gws=3, sf_list=[PacketSf.SF_Lowest, PacketSf.SF_Random, PacketSf.SF_7], simulation_duration=3600)
+    benchmark_incremental_engine(number_of_nodes_list=[100, 1000, 10000], number_of_gws=4, network_packet_rate=20, simulation_duration=600)
+    benchmark_checkpoint(number_of_nodes=5000, simulation_duration=3600, checkpoint_interval=2)
+    benchmark_replication(number_of_nodes_list=[50, 300, 600, 1000], sf_list=[PacketSf.SF_7, PacketSf.SF_12, PacketSf.SF_Lowest, PacketSf.SF_Random], averaging=5, controller=ReplicationController(min_replicas=3, max_replicas=15, targets={'pdr': 2.0}, relative_targets={'throughput': 0.1, 'txEnergyConsumption': 0.1}))
+    benchmark_common_random_numbers(number_of_nodes=500, replicas=10, simulation_duration=3600)
+    benchmark_online_learning(number_of_nodes=1000, simulation_duration=3600, warmup_list=[300, 600, 1200])
+    benchmark_model_store(number_of_nodes=1000, simulation_duration=3600)
+    benchmark_replay(number_of_nodes=5000, simulation_duration=3600, path_loss_exponent_list=[34.0, 35.0, 36.0, 37.6, 39.0, 40.0], batch_size=65536)
+    benchmark_what_if(number_of_nodes=5000, simulation_duration=3600, number_of_candidates=1000)
+    benchmark_tracing(number_of_nodes=500, simulation_duration=3600)
+    benchmark_event_store(number_of_nodes=100000, simulation_duration=600)
+    benchmark_event_log(number_of_nodes=1000, simulation_duration=3600)
+    benchmark_training_data(number_of_nodes=10000, simulation_duration=3600, cap_list=[None, 10, 3])
+    benchmark_link_budget(number_of_nodes=1000, number_of_events=100000)
+    benchmark_scheduler(number_of_nodes_list=[1000, 10000, 100000], network_packet_rate=10, simulation_duration=3600)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='LoRa SF simulator benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('micro', help='component benchmarks, default')
+    suite_parser = subparsers.add_parser('suite', help='scenario suite, results are appended to the history file')
+    suite_parser.add_argument('-n', '--node', type=int, nargs='+', choices=SUITE_NODES, help='numbers of nodes, all by default')
+    suite_parser.add_argument('-g', '--gateway', type=int, nargs='+', choices=SUITE_GWS, help='numbers of gateways, all by default')
+    suite_parser.add_argument('-s', '--sf', nargs='+', choices=[sf.name for sf in SUITE_SFS], help='SF assignment methods, all by default')
+    suite_parser.add_argument('-o', '--traffic', nargs='+', choices=[type.name for type in SUITE_TRAFFIC], help='node traffic types, all by default')
+    suite_parser.add_argument('-l', '--label', help='label of the run in the history')
+    suite_parser.add_argument('-f', '--history', default='output/benchmark_history.json', help='history file path')
+    compare_parser = subparsers.add_parser('compare', help='compare two runs in the history file')
+    compare_parser.add_argument('-b', '--base', type=int, default=-2, help='base run index, previous run by default')
+    compare_parser.add_argument('-c', '--head', type=int, default=-1, help='compared run index, last run by default')
+    compare_parser.add_argument('-t', '--threshold', type=float, default=0.2, help='regression threshold ratio')
+    compare_parser.add_argument('-f', '--history', default='output/benchmark_history.json', help='history file path')
+    args = parser.parse_args()
+
+    if args.command == 'suite':
+        scenarios = get_scenarios(nodes=args.node, gws=args.gateway, sfs=[PacketSf[sf] for sf in args.sf] if args.sf else None, traffic=[TrafficType[type] for type in args.traffic] if args.traffic else None)
+        run_suite(scenarios, args.history, label=args.label)
+    elif args.command == 'compare':
+        sys.exit(1 if compare_runs(args.history, args.base, args.head, args.threshold) > 0 else 0)
+    else:
+        run_micro_benchmarks()
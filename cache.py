@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import pickle
+import hashlib
+import inspect
+import tempfile
+
+
+CODE_MODULES = ['eventlog.py', 'eventstore.py', 'experiment.py', 'location.py', 'node.py', 'online.py', 'packet.py', 'scheduler.py', 'simulation.py', 'topology.py', 'traffic.py', 'vectorized.py']
+
+_code_version = None
+
+
+def get_code_version():
+    # Hash of simulator sources, results of other code versions are not reused
+    global _code_version
+    if _code_version is None:
+        code_hash = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for module in CODE_MODULES:
+            with open(os.path.join(directory, module), 'rb') as file:
+                code_hash.update(file.read())
+        _code_version = code_hash.hexdigest()
+    return _code_version
+
+
+def get_source_version(function):
+    # Hash of the source file a function is defined in, e.g. an experiment
+    # job and the constants it uses
+    with open(inspect.getsourcefile(function), 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def get_model_fingerprint(model):
+    if model is None:
+        return None
+    return hashlib.sha256(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+def atomic_write(file_name, data):
+    # Readers see either the old file or the complete new one, never a partial
+    # write, so several processes can share a directory
+    directory = os.path.dirname(os.path.abspath(file_name))
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temporary_name = tempfile.mkstemp(dir=directory, prefix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(data)
+        os.replace(temporary_name, file_name)
+    except BaseException:
+        os.remove(temporary_name)
+        raise
+
+
+class ResultCache:
+    # Content addressed on disk cache of simulation results. Keys are hashes
+    # of the simulation parameters, seed, model fingerprint and code version.
+    # Least recently used entries are evicted when the total size exceeds
+    # max_size bytes, access time is tracked with file modification times.
+    def __init__(self, directory, max_size=1024 ** 3):
+        self.directory = directory
+        self.maxSize = max_size
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(**parameters):
+        parameters['code_version'] = get_code_version()
+        # Objects with a fingerprint, e.g. traffic traces, are keyed by content
+        text = json.dumps(parameters, sort_keys=True, default=lambda value: value.get_fingerprint() if hasattr(value, 'get_fingerprint') else str(value))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def __get_file_name(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pkl')
+
+    def get(self, key):
+        file_name = self.__get_file_name(key)
+        try:
+            with open(file_name, 'rb') as file:
+                value = pickle.load(file)
+            os.utime(file_name)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        atomic_write(self.__get_file_name(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for root, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                if not file_name.endswith('.pkl'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, file_name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, file_name)))
+                total_size += stat.st_size
+
+        entries.sort()
+        for _, size, file_name in entries:
+            if total_size <= self.maxSize:
+                break
+            try:
+                os.remove(file_name)
+            except OSError:
+                pass
+            total_size -= size
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import glob
+import json
+import array
+import numpy as np
+from eventstore import EVENT_COLUMNS
+from eventstore import event_dtype
+from node import Gateway
+
+
+node_dtype = np.dtype([
+    ('id', np.int32),
+    ('x', np.float64),
+    ('y', np.float64),
+    ('gateway', np.bool_),
+    ('lowest_sf', np.int8),  # 0 for gateways
+    ('traffic', np.int8),  # -1 for gateways
+])
+
+
+class ColumnarEventLogWriter:
+    # Binary event log directory, self describing and loadable without parsing:
+    #   header.json       simulation parameters
+    #   nodes.npy         node table, gateways first
+    #   events-NNNNN.npy  event chunks as structured arrays, in time order
+    #   results.json      simulation results, written last
+    # Events are written in chunks of chunk_size as the run proceeds, the
+    # writer can be used as a streaming mode sink.
+    def __init__(self, directory, chunk_size=65536):
+        self.directory = directory
+        self.chunkSize = chunk_size
+        self.numberOfChunks = 0
+        self.numberOfEvents = 0
+        os.makedirs(directory, exist_ok=True)
+        for file_name in glob.glob(os.path.join(directory, 'events-*.npy')):
+            os.remove(file_name)
+        self.__reset_buffer()
+
+    def __reset_buffer(self):
+        self.buffer = {name: array.array(typecode) for name, typecode, _ in EVENT_COLUMNS}
+
+    def write_header(self, simulation):
+        with open(os.path.join(self.directory, 'header.json'), 'w') as file:
+            json.dump(simulation.get_parameters(), file, indent=1)
+
+        topology = simulation.topology
+        nodes = np.zeros(len(topology.gateway_list) + len(topology.node_list), dtype=node_dtype)
+        for index, node in enumerate(topology.gateway_list + topology.node_list):
+            is_gateway = isinstance(node, Gateway)
+            nodes[index] = (node.id, node.location.x, node.location.y, is_gateway, 0 if is_gateway else node.lowestSf.value, -1 if is_gateway else node.trafficType.value)
+        np.save(os.path.join(self.directory, 'nodes.npy'), nodes)
+
+    def __call__(self, event):
+        buffer = self.buffer
+        buffer['time'].append(event.time)
+        buffer['duration'].append(event.duration)
+        buffer['sf'].append(event.sf.value)
+        buffer['source'].append(event.source)
+        buffer['size'].append(event.size)
+        buffer['status'].append(event.status.value)
+        buffer['energy'].append(event.tx_energy_j)
+        if len(buffer['time']) >= self.chunkSize:
+            self.flush()
+
+    def write_events(self, event_store):
+        self.flush()
+        columns = {name: event_store.get_column(name) for name, _, _ in EVENT_COLUMNS}
+        for start in range(0, len(event_store), self.chunkSize):
+            self.__write_chunk({name: column[start:start + self.chunkSize] for name, column in columns.items()})
+
+    def __write_chunk(self, columns):
+        chunk = np.empty(len(columns['time']), dtype=event_dtype)
+        for name, _, _ in EVENT_COLUMNS:
+            chunk[name] = columns[name]
+        np.save(os.path.join(self.directory, 'events-{:05d}.npy'.format(self.numberOfChunks)), chunk)
+        self.numberOfChunks += 1
+        self.numberOfEvents += len(chunk)
+
+    def flush(self):
+        if len(self.buffer['time']) == 0:
+            return
+        self.__write_chunk({name: np.frombuffer(self.buffer[name], dtype=dtype) for name, _, dtype in EVENT_COLUMNS})
+        self.__reset_buffer()
+
+    def write_results(self, simulation_result):
+        self.flush()
+        # Profile of profiled runs is written with its phase times and counters
+        results = dict(vars(simulation_result))
+        if simulation_result.profile is not None:
+            results['profile'] = vars(simulation_result.profile)
+        text = json.dumps(results, indent=1)
+        with open(os.path.join(self.directory, 'results.json'), 'w') as file:
+            file.write(text)
+
+
+class EventLog:
+    # Columnar event log loaded back, event chunks are memory mapped
+    def __init__(self, directory, mmap=True):
+        self.directory = directory
+        mmap_mode = 'r' if mmap else None
+        with open(os.path.join(directory, 'header.json')) as file:
+            self.header = json.load(file)
+        self.nodes = np.load(os.path.join(directory, 'nodes.npy'))
+        self.chunks = [np.load(file_name, mmap_mode=mmap_mode) for file_name in sorted(glob.glob(os.path.join(directory, 'events-*.npy')))]
+        self.results = None
+        if os.path.exists(os.path.join(directory, 'results.json')):
+            with open(os.path.join(directory, 'results.json')) as file:
+                self.results = json.load(file)
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks)
+
+    def get_column(self, name):
+        if len(self.chunks) == 1:
+            return self.chunks[0][name]
+        if len(self.chunks) == 0:
+            return np.empty(0, dtype=event_dtype[name])
+        return np.concatenate([chunk[name] for chunk in self.chunks])
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import glob
+import array
+import numpy as np
+from packet import PacketStatus
+from packet import PacketSf
+from packet import default_phy
+
+
+# Column name, array typecode and NumPy type of event columns
+EVENT_COLUMNS = [
+    ('time', 'd', np.float64),
+    ('duration', 'd', np.float64),
+    ('sf', 'b', np.int8),
+    ('source', 'i', np.int32),
+    ('size', 'h', np.int16),
+    ('status', 'b', np.int8),
+    ('energy', 'd', np.float64),
+]
+
+event_dtype = np.dtype([(name, dtype) for name, _, dtype in EVENT_COLUMNS])
+
+
+class EventView:
+    # Lightweight read only view of a stored event with Packet attributes
+    __slots__ = ('store', 'index')
+
+    destination = 0
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def time(self):
+        return self.store.get_value('time', self.index)
+
+    @property
+    def duration(self):
+        return self.store.get_value('duration', self.index)
+
+    @property
+    def sf(self):
+        return PacketSf(self.store.get_value('sf', self.index))
+
+    @property
+    def source(self):
+        return self.store.get_value('source', self.index)
+
+    @property
+    def size(self):
+        return self.store.get_value('size', self.index)
+
+    @property
+    def status(self):
+        return PacketStatus(self.store.get_value('status', self.index))
+
+    @property
+    def bandwidth(self):
+        return self.store.phy.bandwidth
+
+    @property
+    def tx_power_dbm(self):
+        return self.store.phy.txPowerDbm
+
+    @property
+    def tx_energy_j(self):
+        return self.store.get_value('energy', self.index)
+
+    def __repr__(self):
+        return '(t={:.3f},src={},dst={},sf={},bw={},dur={:.3f},p={},e={:.4f},stat={})'.format(self.time, self.source, self.destination, self.sf.name, self.bandwidth, self.duration, self.tx_power_dbm, self.tx_energy_j, self.status.name)
+
+
+class EventStore:
+    # Array backed store of executed events. Events are appended to typed
+    # array columns, which are moved to NumPy chunks of chunk_size events,
+    # so an event takes 32 bytes instead of a Packet object. Bandwidth and
+    # transmit power of events are taken from the PHY model. With a directory,
+    # every chunk is also written to it once as an events-NNNNN.npy structured
+    # array, and a pickled store holds only the buffer and the number of
+    # written chunks, which are loaded back when it is unpickled.
+    def __init__(self, chunk_size=65536, phy=default_phy, directory=None):
+        self.chunkSize = chunk_size
+        self.phy = phy
+        self.directory = directory
+        self.chunks = {name: [] for name, _, _ in EVENT_COLUMNS}
+        self.numberOfChunkedEvents = 0
+        self.numberOfChunkFiles = 0
+        self.__columnCache = {}
+        self.__reset_buffer()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.__remove_chunk_files(0)
+
+    def __get_chunk_file_name(self, index):
+        return os.path.join(self.directory, 'events-{:05d}.npy'.format(index))
+
+    def __remove_chunk_files(self, first_index):
+        for file_name in glob.glob(os.path.join(self.directory, 'events-*.npy')):
+            if int(os.path.basename(file_name)[7:-4]) >= first_index:
+                os.remove(file_name)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_EventStore__columnCache'] = {}
+        if self.directory is not None:
+            state['chunks'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.directory is None:
+            return
+        # Chunks written after the store was pickled are discarded
+        self.__remove_chunk_files(self.numberOfChunkFiles)
+        self.chunks = {name: [] for name, _, _ in EVENT_COLUMNS}
+        for index in range(self.numberOfChunkFiles):
+            chunk = np.load(self.__get_chunk_file_name(index))
+            for name, _, _ in EVENT_COLUMNS:
+                self.chunks[name].append(np.ascontiguousarray(chunk[name]))
+
+    def __reset_buffer(self):
+        self.buffer = {name: array.array(typecode) for name, typecode, _ in EVENT_COLUMNS}
+
+    @staticmethod
+    def from_columns(phy=default_phy, **columns):
+        store = EventStore(phy=phy)
+        for name, _, dtype in EVENT_COLUMNS:
+            store.chunks[name].append(np.ascontiguousarray(columns[name], dtype=dtype))
+        store.numberOfChunkedEvents = len(columns['time'])
+        return store
+
+    def __len__(self):
+        return self.numberOfChunkedEvents + len(self.buffer['time'])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('event index out of range')
+        return EventView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield EventView(self, index)
+
+    def append(self, packet):
+        buffer = self.buffer
+        buffer['time'].append(packet.time)
+        buffer['duration'].append(packet.duration)
+        buffer['sf'].append(packet.sf.value)
+        buffer['source'].append(packet.source)
+        buffer['size'].append(packet.size)
+        buffer['status'].append(packet.status.value)
+        buffer['energy'].append(packet.tx_energy_j)
+        if len(buffer['time']) >= self.chunkSize:
+            self.__flush_buffer()
+
+    def __flush_buffer(self):
+        for name, _, dtype in EVENT_COLUMNS:
+            self.chunks[name].append(np.frombuffer(self.buffer[name], dtype=dtype).copy())
+        if self.directory is not None:
+            chunk = np.empty(len(self.buffer['time']), dtype=event_dtype)
+            for name, _, _ in EVENT_COLUMNS:
+                chunk[name] = self.chunks[name][-1]
+            np.save(self.__get_chunk_file_name(self.numberOfChunkFiles), chunk)
+            self.numberOfChunkFiles += 1
+        self.numberOfChunkedEvents += len(self.buffer['time'])
+        self.__columnCache = {}
+        self.__reset_buffer()
+
+    def get_column(self, name):
+        # Whole column as a contiguous NumPy array
+        if len(self.buffer['time']) > 0:
+            self.__flush_buffer()
+        if name not in self.__columnCache:
+            chunks = self.chunks[name]
+            if len(chunks) == 0:
+                dtype = [column_dtype for column_name, _, column_dtype in EVENT_COLUMNS if column_name == name][0]
+                self.__columnCache[name] = np.empty(0, dtype=dtype)
+            elif len(chunks) == 1:
+                self.__columnCache[name] = chunks[0]
+            else:
+                self.chunks[name] = [np.concatenate(chunks)]
+                self.__columnCache[name] = self.chunks[name][0]
+        return self.__columnCache[name]
+
+    def get_value(self, name, index):
+        if index >= self.numberOfChunkedEvents:
+            return self.buffer[name][index - self.numberOfChunkedEvents]
+        return self.get_column(name)[index].item()
+
+    @property
+    def nbytes(self):
+        chunked = sum(chunk.nbytes for chunks in self.chunks.values() for chunk in chunks)
+        buffered = sum(column.buffer_info()[1] * column.itemsize for column in self.buffer.values())
+        return chunked + buffered
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import math
+import random
+import hashlib
+import numpy as np
+from scipy import stats
+from concurrent.futures import ProcessPoolExecutor
+from cache import get_source_version
+
+
+def derive_seed(seed, *keys):
+    # Deterministic seed for a job, independent of the order jobs are run in
+    digest = hashlib.sha256(':'.join(str(key) for key in (seed,) + keys).encode()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def seed_all(seed):
+    random.seed(seed)
+    np.random.seed(seed % (2 ** 32))
+
+
+def _run_job(job, point, point_seed, replica_seed, cache):
+    if cache is not None:
+        key = cache.get_key(job=job.__qualname__, job_version=get_source_version(job), point=point, point_seed=point_seed, replica_seed=replica_seed)
+        result = cache.get(key)
+        if result is not None:
+            return result
+
+    seed_all(replica_seed)
+    result = job(point, point_seed, replica_seed)
+
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+class RunningStatistics:
+    # Running mean and variance of a sample, updated with Welford's method
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    def get_half_width(self, confidence):
+        # Half width of the Student t confidence interval of the mean
+        if self.count < 2:
+            return math.inf
+        return stats.t.ppf((1 + confidence) / 2, self.count - 1) * math.sqrt(self.variance / self.count)
+
+
+class ConfidenceInterval:
+    def __init__(self, mean, half_width, count):
+        self.mean = mean
+        self.halfWidth = half_width
+        self.count = count
+
+    def __repr__(self):
+        return '{:.3f} +- {:.3f} (n={})'.format(self.mean, self.halfWidth, self.count)
+
+
+class ReplicationController:
+    # Sequential stopping rule for replicas of a parameter point. Running
+    # statistics of result metrics are tracked and replicas are added until
+    # the confidence interval half width of every metric is within its target,
+    # between min_replicas and max_replicas replicas. Targets are absolute half
+    # widths, relative_targets are fractions of the mean. Results are
+    # SimulationResult objects or dicts of them, e.g. one per SF assignment
+    # method, every series must converge.
+    def __init__(self, min_replicas=3, max_replicas=20, confidence=0.95, targets=None, relative_targets=None, batch_size=1):
+        assert 2 <= min_replicas <= max_replicas, 'unsupported replica bounds {} {}'.format(min_replicas, max_replicas)
+        assert 0 < confidence < 1, 'unsupported confidence {}'.format(confidence)
+        self.minReplicas = min_replicas
+        self.maxReplicas = max_replicas
+        self.confidence = confidence
+        self.targets = targets if targets is not None else {'pdr': 1.0}
+        self.relativeTargets = relative_targets if relative_targets is not None else {'throughput': 0.05, 'txEnergyConsumption': 0.05}
+        self.batchSize = batch_size
+
+    def get_statistics(self, results):
+        # Running statistics of every (series, metric) of the results
+        statistics = {}
+        for result in results:
+            series = result if isinstance(result, dict) else {None: result}
+            for series_name, series_result in series.items():
+                for metric in list(self.targets) + list(self.relativeTargets):
+                    statistics.setdefault((series_name, metric), RunningStatistics()).add(getattr(series_result, metric))
+        return statistics
+
+    def get_intervals(self, results):
+        return {key: ConfidenceInterval(statistic.mean, statistic.get_half_width(self.confidence), statistic.count) for key, statistic in self.get_statistics(results).items()}
+
+    def is_converged(self, results):
+        for (_, metric), statistic in self.get_statistics(results).items():
+            target = self.targets[metric] if metric in self.targets else self.relativeTargets[metric] * abs(statistic.mean)
+            if statistic.get_half_width(self.confidence) > target:
+                return False
+        return True
+
+    def get_next_replicas(self, results):
+        # Number of replicas to add to a point, 0 when it is done
+        if len(results) < self.minReplicas:
+            return self.minReplicas - len(results)
+        if len(results) >= self.maxReplicas or self.is_converged(results):
+            return 0
+        return min(self.batchSize, self.maxReplicas - len(results))
+
+    def run(self, simulation_factory):
+        # Replicas of a single point, simulation_factory returns a new
+        # Simulation for every replica
+        results = []
+        while True:
+            replicas = self.get_next_replicas(results)
+            if replicas == 0:
+                return results, self.get_intervals(results)
+            for _ in range(replicas):
+                results.append(simulation_factory().run())
+
+
+class ExperimentRunner:
+    # Runs independent (parameter point, replica) jobs over a process pool.
+    # Every job gets its own seeds derived from the runner seed, the point
+    # index and the replica index, so results do not depend on the number of
+    # workers or on scheduling. A job is called as job(point, point_seed,
+    # replica_seed) after the global generators are seeded with replica_seed,
+    # point_seed is shared by the replicas of a point (e.g. for the topology).
+    # If a ResultCache is given, results of jobs with the same name, point and
+    # seeds are reused.
+    def __init__(self, workers=None, seed=42, cache=None):
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.seed = seed
+        self.cache = cache
+
+    def run(self, job, points, replicas, name=''):
+        # Returns results of every replica for every point, in order
+        tasks = []
+        for point_index, point in enumerate(points):
+            point_seed = derive_seed(self.seed, name, point_index)
+            for replica in range(replicas):
+                tasks.append((point, point_seed, derive_seed(self.seed, name, point_index, replica)))
+
+        if self.workers <= 1:
+            results = [_run_job(job, *task, self.cache) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(_run_job, job, *task, self.cache) for task in tasks]
+                results = [future.result() for future in futures]
+
+        return [results[point_index * replicas:(point_index + 1) * replicas] for point_index in range(len(points))]
+
+    def run_until(self, job, points, controller, name=''):
+        # Returns results of every point with as many replicas as the
+        # ReplicationController asks for. Replicas of all unfinished points
+        # are run in rounds, replica seeds are the same as with run, so fixed
+        # and sequential runs share cached results.
+        results = [[] for _ in points]
+        point_seeds = [derive_seed(self.seed, name, point_index) for point_index in range(len(points))]
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            while True:
+                tasks = []
+                for point_index, point in enumerate(points):
+                    start = len(results[point_index])
+                    for replica in range(start, start + controller.get_next_replicas(results[point_index])):
+                        tasks.append((point_index, (point, point_seeds[point_index], derive_seed(self.seed, name, point_index, replica))))
+                if not tasks:
+                    return results
+
+                if executor is None:
+                    round_results = [_run_job(job, *task, self.cache) for _, task in tasks]
+                else:
+                    futures = [executor.submit(_run_job, job, *task, self.cache) for _, task in tasks]
+                    round_results = [future.result() for future in futures]
+                for (point_index, _), result in zip(tasks, round_results):
+                    results[point_index].append(result)
+        finally:
+            if executor is not None:
+                executor.shutdown()
@@ -15,42 +15,132 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; If not, see <http://www.gnu.org/licenses/>.
 
-import random
+import sys
 import logging
 import argparse
 from sklearn.tree import DecisionTreeClassifier
 from sklearn import svm
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 from topology import Topology
+from topology import GATEWAY_PLACEMENTS
+from topology import SYMMETRIC_MAX_GWS
 from simulation import Simulation
+from simulation import TrainingDataSink
+from simulation import EventLogSink
+from simulation import SIMULATION_ENGINES
+from eventlog import ColumnarEventLogWriter
+from online import OnlineSfLearner
+from online import ONLINE_SWITCH_POLICIES
+from tracing import TraceRecorder
+from experiment import seed_all
+from cache import ResultCache
+from cache import get_model_fingerprint
+from modelstore import ModelStore
 from packet import PacketSf
 from node import TrafficType
 
 
+def run_simulation(simulation, args):
+    simulation.run()
+    simulation.show_results()
+    for sink in simulation.sinks:
+        if isinstance(sink, EventLogSink):
+            simulation.write_results_to_file(sink.file)
+            sink.file.close()
+        elif isinstance(sink, ColumnarEventLogWriter):
+            sink.write_results(simulation.simulationResult)
+    if not simulation.streaming and args.event:
+        simulation.write_to_file(file_name=args.event, format=args.eventFormat)
+    if simulation.learner is not None:
+        print('Online learning: {}'.format(simulation.learner))
+    if args.profile:
+        print('Profile:')
+        print('{}'.format(simulation.simulationResult.profile))
+    if simulation.trace is not None:
+        simulation.trace.close()
+
+
+def train_classifier(topology, classifier, args):
+    # Fits the classifier on a random SF simulation, returns it with the
+    # test labels and predictions
+    if args.streaming:
+        training_data_sink = TrainingDataSink(topology)
+        simulation = Simulation(topology=topology, packet_rate=args.packetRate, packet_size=args.packetSize, simulation_duration=args.duration, sf=PacketSf.SF_Random, streaming=True, sinks=[training_data_sink])
+        simulation.run()
+        X_train, X_test, y_train, y_test = training_data_sink.get_training_data(test_size=0.2, max_samples_per_node_sf=args.trainingCap)
+    else:
+        simulation = Simulation(topology=topology, packet_rate=args.packetRate, packet_size=args.packetSize, simulation_duration=args.duration, sf=PacketSf.SF_Random)
+        simulation.run()
+        X_train, X_test, y_train, y_test = simulation.get_training_data(test_size=0.2, max_samples_per_node_sf=args.trainingCap)
+
+    classifier.fit(X_train, y_train)
+    return classifier, y_test, classifier.predict(X_test)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='LoRa SF simulator')
     parser.add_argument('-r', '--radius', type=int, default=5000, help='topology radius in meter')
     parser.add_argument('-g', '--gateway', type=int, default=1, help='number of gateways')
+    parser.add_argument('-w', '--gwPlacement', choices=GATEWAY_PLACEMENTS, default='symmetric', help='gateway placement, symmetric supports up to {} gateways'.format(SYMMETRIC_MAX_GWS))
+    parser.add_argument('-i', '--gwFile', help='gateway locations file with x,y in meters per line, overrides number of gateways and placement')
     parser.add_argument('-n', '--node', type=int, default=100, help='number of nodes')
     parser.add_argument('-s', '--sf', choices=[sf.name for sf in PacketSf], default='SF_Lowest', help='spreading factor assignment method')
     parser.add_argument('-c', '--classifier', choices=['DTC', 'SVM'], default='DTC', help='smart spreading factor assignment classifier')
+    parser.add_argument('-k', '--trainingCap', type=int, help='smart spreading factor training samples per node, SF and status')
+    parser.add_argument('--online', action='store_true', help='train the smart spreading factor classifier during the simulation, nodes use random SFs until the switch')
+    parser.add_argument('--warmup', type=float, default=600, help='online learning warm-up in seconds of simulation time')
+    parser.add_argument('--switch', choices=ONLINE_SWITCH_POLICIES, default='time', help='online learning switch policy, at the end of warm-up or when accuracy reaches minAccuracy after it')
+    parser.add_argument('--minAccuracy', type=float, default=0.9, help='online learning accuracy needed to switch with the accuracy policy')
     parser.add_argument('-d', '--duration', type=int, default=3600, help='simulation duration in second')
     parser.add_argument('-p', '--packetRate', type=float, default=0.01, help='packet rate in packet per second')
     parser.add_argument('-z', '--packetSize', type=int, default=60, help='packet size in byte')
     parser.add_argument('-o', '--nodeTraffic', type=float, nargs=len(TrafficType), default=(1, 0), metavar=' '.join([type.name for type in TrafficType]), help='proportions of different traffic generator type nodes')
     parser.add_argument('-e', '--seed', type=int, help='random number generator seed')
-    parser.add_argument('-l', '--event', help='events log file path')
+    parser.add_argument('-l', '--event', help='events log path, a directory for columnar format')
+    parser.add_argument('-f', '--eventFormat', choices=['columnar', 'text'], default='columnar', help='events log format, binary columnar or human readable text')
+    parser.add_argument('-t', '--trace', help='structured reception trace file path')
+    parser.add_argument('--engine', choices=SIMULATION_ENGINES, default='event', help='interference engine, incremental keeps running per gateway and SF energy sums')
+    parser.add_argument('-m', '--streaming', action='store_true', help='bounded memory streaming mode, finished events are not kept')
+    parser.add_argument('-a', '--cache', default='output/cache', help='simulation result cache directory, used when seed is given')
+    parser.add_argument('--no-cache', dest='cache', action='store_const', const=None, help='do not use the simulation result cache')
+    parser.add_argument('--modelStore', default='output/models', help='trained smart SF classifier store directory, used when seed is given')
+    parser.add_argument('--no-model-store', dest='modelStore', action='store_const', const=None, help='do not use the trained classifier store')
+    parser.add_argument('--checkpoint', help='checkpoint file path, the complete simulation state is saved to it periodically')
+    parser.add_argument('--checkpointInterval', type=float, default=300, help='checkpoint interval in seconds of wall clock time')
+    parser.add_argument('--resume', action='store_true', help='continue the simulation saved in the checkpoint file, simulation parameters are restored from it')
+    parser.add_argument('--profile', action='store_true', help='print simulation phase times and counters')
     parser.add_argument('-v', '--verbose', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='ERROR', help='verbose level')
     args = parser.parse_args()
     logging.basicConfig(level=logging.getLevelName(args.verbose), format='%(asctime)s %(levelname)s [%(filename)s:%(funcName)s:%(lineno)d] %(message)s')
+    if args.resume and not args.checkpoint:
+        parser.error('--resume requires --checkpoint')
+    if args.online and (PacketSf[args.sf] != PacketSf.SF_Smart or args.engine != 'event'):
+        parser.error('--online requires SF_Smart and the event engine')
+    if not args.resume and not args.gwFile and args.gwPlacement == 'symmetric' and args.gateway > SYMMETRIC_MAX_GWS:
+        parser.error('symmetric gateway placement supports up to {} gateways, use -w hex or -w random'.format(SYMMETRIC_MAX_GWS))
+
+    if args.resume:
+        # Topology, SF predictor, sinks and generator states are restored
+        simulation = Simulation.load_checkpoint(args.checkpoint)
+        print('Resuming from checkpoint {} after {} events:'.format(args.checkpoint, simulation.simulationResult.totalPacket))
+        for name, value in simulation.get_parameters().items():
+            print('  {}: {}'.format(name, value))
+        run_simulation(simulation, args)
+        sys.exit(0)
 
     print('Parameters:')
     print('  Radius: {} meters'.format(args.radius))
     print('  Number of gateways: {}'.format(args.gateway))
+    print('  Gateway placement: {}'.format(args.gwFile if args.gwFile else args.gwPlacement))
     print('  Number of nodes: {}'.format(args.node))
     print('  SF assignment method: {}'.format(args.sf))
     if PacketSf[args.sf] == PacketSf.SF_Smart:
         print('  Smart SF classifier: {}'.format(args.classifier))
+        print('  Smart SF training samples cap: {}'.format(args.trainingCap))
+        print('  Smart SF online learning: {}'.format(args.online))
+        if args.online:
+            print('  Online learning warm-up: {} seconds'.format(args.warmup))
+            print('  Online learning switch policy: {}'.format(args.switch))
     print('  Simulation duration: {} seconds'.format(args.duration))
     print('  Packet rate: {} packet per second'.format(args.packetRate))
     print('  Packet interval: {} seconds'.format(1/args.packetRate))
@@ -58,27 +148,47 @@ if __name__ == "__main__":
     print('  Percentage of periodic nodes {}: {}'.format([type.name for type in TrafficType], args.nodeTraffic))
     print('  Random number generator seed: {}'.format(args.seed))
     print('  Events log path: {}'.format(args.event))
+    print('  Events log format: {}'.format(args.eventFormat))
+    print('  Trace path: {}'.format(args.trace))
+    print('  Engine: {}'.format(args.engine))
+    print('  Streaming mode: {}'.format(args.streaming))
+    print('  Result cache: {}'.format(args.cache))
+    print('  Model store: {}'.format(args.modelStore))
+    print('  Checkpoint: {}'.format(args.checkpoint))
+    print('  Profile: {}'.format(args.profile))
     print('  Verbose level: {}'.format(args.verbose))
 
     if args.seed:
-        random.seed(args.seed)
+        seed_all(args.seed)
 
-    topology = Topology.create_random_topology(number_of_nodes=args.node, radius=args.radius, number_of_gws=args.gateway, node_traffic_proportions=args.nodeTraffic)
+    gw_locations = Topology.load_gateway_locations(args.gwFile) if args.gwFile else None
+    topology = Topology.create_random_topology(number_of_nodes=args.node, radius=args.radius, number_of_gws=args.gateway, gw_placement=args.gwPlacement, gw_locations=gw_locations, node_traffic_proportions=args.nodeTraffic)
 
     sfPredictor = None
-    if PacketSf[args.sf] == PacketSf.SF_Smart:
-        simulation = Simulation(topology=topology, packet_rate=args.packetRate, packet_size=args.packetSize, simulation_duration=args.duration, sf=PacketSf.SF_Random)
-        simulation.run()
-        X_train, X_test, y_train, y_test = simulation.get_training_data(test_size=0.2)
-
-        classifier = None
+    classifier = None
+    learner = None
+    if PacketSf[args.sf] == PacketSf.SF_Smart and args.online:
+        # Classifier is trained in the warm-up window of the same run
+        if args.classifier == 'DTC':
+            classifier = DecisionTreeClassifier(class_weight='balanced')
+        elif args.classifier == 'SVM':
+            classifier = svm.SVC(class_weight='balanced', gamma='auto')
+        learner = OnlineSfLearner(classifier, warmup=args.warmup, switch=args.switch, min_accuracy=args.minAccuracy)
+    elif PacketSf[args.sf] == PacketSf.SF_Smart:
         if args.classifier == 'DTC':
             classifier = DecisionTreeClassifier(class_weight='balanced')
         elif args.classifier == 'SVM':
             classifier = svm.SVC(class_weight='balanced', gamma='auto')
 
-        classifier.fit(X_train, y_train)
-        y_pred = classifier.predict(X_test)
+        if args.modelStore and args.seed:
+            # Training is deterministic for a given seed, so classifiers can be reused
+            model_store = ModelStore(args.modelStore)
+            model_key = ModelStore.get_key(topology, [classifier], packet_rate=args.packetRate, packet_size=args.packetSize, duration=args.duration, training_cap=args.trainingCap, streaming=args.streaming)
+            classifier, y_test, y_pred = model_store.get_or_train(model_key, lambda: train_classifier(topology, classifier, args))
+            if model_store.hits:
+                print('Smart SF classifier loaded from model store {}'.format(args.modelStore))
+        else:
+            classifier, y_test, y_pred = train_classifier(topology, classifier, args)
         print('Training classification report:')
         print(classification_report(y_test, y_pred))
         print('Training confusion matrix:')
@@ -86,8 +196,36 @@ if __name__ == "__main__":
         print('Training accuracy is {:.3f} %'.format(accuracy_score(y_test, y_pred) * 100))
         sfPredictor = classifier.predict
 
-    simulation = Simulation(topology=topology, packet_rate=args.packetRate, packet_size=args.packetSize, simulation_duration=args.duration, sf=PacketSf[args.sf], sfPredictor=sfPredictor)
-    simulation.run()
-    simulation.show_results()
-    if args.event:
-        simulation.write_to_file(file_name=args.event)
+    simulation_result = None
+    cache = None
+    if args.cache and args.seed and not args.event and not args.trace and not args.profile and not args.checkpoint:
+        # Runs are deterministic for a given seed, so results can be reused
+        cache = ResultCache(args.cache)
+        cache_key = ResultCache.get_key(radius=args.radius, gateway=args.gateway, gw_placement=args.gwPlacement, gw_locations=[(location.x, location.y) for location in gw_locations] if gw_locations else None, node=args.node, sf=args.sf, training_cap=args.trainingCap, duration=args.duration, packet_rate=args.packetRate, packet_size=args.packetSize, node_traffic=args.nodeTraffic, engine=args.engine, online=(args.warmup, args.switch, args.minAccuracy) if args.online else None, seed=args.seed, model=get_model_fingerprint(classifier))
+        simulation_result = cache.get(cache_key)
+
+    if simulation_result is not None:
+        print('Results (cached):')
+        print('{}'.format(simulation_result))
+    else:
+        trace = TraceRecorder(file_name=args.trace) if args.trace else None
+        if args.streaming:
+            event_file = None
+            event_writer = None
+            sinks = []
+            if args.event and args.eventFormat == 'text':
+                event_file = open(args.event, 'w')
+                sinks.append(EventLogSink(event_file))
+            elif args.event:
+                event_writer = ColumnarEventLogWriter(args.event)
+                sinks.append(event_writer)
+            simulation = Simulation(topology=topology, packet_rate=args.packetRate, packet_size=args.packetSize, simulation_duration=args.duration, sf=PacketSf[args.sf], sfPredictor=sfPredictor, streaming=True, sinks=sinks, trace=trace, profile=args.profile, engine=args.engine, checkpoint=args.checkpoint, checkpoint_interval=args.checkpointInterval, learner=learner)
+            if event_file:
+                simulation.write_header_to_file(event_file)
+            if event_writer:
+                event_writer.write_header(simulation)
+        else:
+            simulation = Simulation(topology=topology, packet_rate=args.packetRate, packet_size=args.packetSize, simulation_duration=args.duration, sf=PacketSf[args.sf], sfPredictor=sfPredictor, trace=trace, profile=args.profile, engine=args.engine, checkpoint=args.checkpoint, checkpoint_interval=args.checkpointInterval, learner=learner)
+        run_simulation(simulation, args)
+        if cache:
+            cache.put(cache_key, simulation.simulationResult)
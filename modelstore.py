@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import pickle
+import hashlib
+import numpy as np
+import sklearn
+from cache import ResultCache
+from simulation import TRAINING_FEATURES
+
+
+def get_random_state_fingerprint():
+    random_state = (random.getstate(), np.random.get_state())
+    return hashlib.sha256(pickle.dumps(random_state, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+class ModelStore(ResultCache):
+    # On disk store of fitted smart SF classifiers, so training simulations
+    # are not run again for the same scenario. Keys are hashes of the
+    # topology fingerprint, traffic trace, random generator states before
+    # training, training parameters, feature schema, classifier parameters,
+    # and simulator and scikit-learn versions. Generator states after training
+    # are stored with the models and restored on reuse, so runs that follow
+    # are identical with or without the store. Least recently used models are
+    # evicted as in ResultCache.
+    def __init__(self, directory, max_size=256 * 1024 ** 2):
+        super().__init__(directory, max_size=max_size)
+
+    @staticmethod
+    def get_key(topology, classifiers, traffic=None, **parameters):
+        # Called before training, with the generator states training starts from
+        return ResultCache.get_key(topology=topology.get_fingerprint(), traffic=traffic.get_fingerprint() if traffic is not None else None, random_state=get_random_state_fingerprint(), features=TRAINING_FEATURES,
+                                   classifiers=[repr(classifier) for classifier in classifiers], sklearn_version=sklearn.__version__, **parameters)
+
+    def get_or_train(self, key, train):
+        # Stored value of the key, or the value returned by train which is stored
+        entry = self.get(key)
+        if entry is not None:
+            random.setstate(entry['random'])
+            np.random.set_state(entry['numpy_random'])
+            return entry['value']
+        value = train()
+        self.put(key, {'value': value, 'random': random.getstate(), 'numpy_random': np.random.get_state()})
+        return value
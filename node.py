@@ -18,6 +18,7 @@
 import random
 import enum
 from packet import Packet
+from packet import default_phy
 
 
 @enum.unique
@@ -33,7 +34,7 @@ class Node:
         self.location = location
         Node.idCounter += 1
         self.id = Node.idCounter
-        self.txList = []
+        self.lastTx = None  # last scheduled transmission
         self.lowestSf = None
         self.predictedSf = None
         self.trafficType = None
@@ -44,23 +45,26 @@ class Node:
         else:
             return 'n {:>3} {} {:>2} {}'.format(self.id, self.location, self.lowestSf.name, self.trafficType.name)
 
-    def schedule_tx(self, packet_rate, packet_size, simulation_duration, sf):
-        # Poisson interval
-        if len(self.txList) == 0:
+    def schedule_tx(self, packet_rate, packet_size, simulation_duration, sf, phy=default_phy, interval=None):
+        # Interval is drawn for the traffic type unless it is given, e.g. from
+        # a traffic trace
+        if self.lastTx is None:
             # initial transmissions are poisson
-            next_time = self.__generatePoissonInterval(packet_rate)
+            next_time = self.__generatePoissonInterval(packet_rate) if interval is None else interval
         else:
-            if self.trafficType == TrafficType.Poisson:
+            if interval is not None:
+                next_interval = interval
+            elif self.trafficType == TrafficType.Poisson:
                 next_interval = self.__generatePoissonInterval(packet_rate)
             elif self.trafficType == TrafficType.Periodic:
                 next_interval = self.__generatePeriodicInterval(packet_rate)
-            next_time = self.txList[-1].time + self.txList[-1].duration + next_interval
+            next_time = self.lastTx.time + self.lastTx.duration + next_interval
 
         if next_time > simulation_duration:
             return None
 
-        new_packet = Packet(time=next_time, sf=sf, source=self.id, size=packet_size)
-        self.txList.append(new_packet)
+        new_packet = Packet(time=next_time, sf=sf, source=self.id, size=packet_size, phy=phy)
+        self.lastTx = new_packet
 
         return new_packet
 
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import array
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score
+from packet import PacketStatus
+
+
+ONLINE_SWITCH_POLICIES = ['time', 'accuracy']
+
+STATUS_CLASSES = np.array([PacketStatus.transmitted.value, PacketStatus.under_sensitivity.value, PacketStatus.interfered.value])
+
+
+class OnlineSfLearner:
+    # Smart SF classifier trained during the simulation that uses it. Nodes
+    # use random SFs in a warm-up window, statuses of processed events are
+    # collected as training samples and a copy of the classifier is trained
+    # every fit_interval seconds of simulation time, with partial_fit if the
+    # classifier supports it or refit on a buffer of the last buffer_size
+    # samples otherwise. At the switch smart SFs of all nodes are predicted
+    # with the model and used for the rest of the run. Switch policies:
+    #   time      at warmup seconds
+    #   accuracy  at the first fit after warmup whose accuracy on the samples
+    #             collected since the previous fit is at least min_accuracy,
+    #             at max_warmup seconds at the latest
+    def __init__(self, classifier, warmup=600, switch='time', min_accuracy=0.9, max_warmup=None, fit_interval=60, buffer_size=100000):
+        assert switch in ONLINE_SWITCH_POLICIES, 'unsupported switch policy {}'.format(switch)
+        assert 0 < warmup and 0 < fit_interval, 'unsupported warm-up {} or fit interval {}'.format(warmup, fit_interval)
+        assert max_warmup is None or warmup <= max_warmup, 'unsupported maximum warm-up {}'.format(max_warmup)
+        self.classifier = classifier
+        self.warmup = warmup
+        self.switch = switch
+        self.minAccuracy = min_accuracy
+        self.maxWarmup = max_warmup if max_warmup is not None else 2 * warmup
+        self.fitInterval = fit_interval
+        self.bufferSize = buffer_size
+        self.partialFit = hasattr(classifier, 'partial_fit')
+        self.reset(np.empty(0), np.empty(0))
+
+    def reset(self, node_x, node_y):
+        # Called at the start of a run with node locations, features are node
+        # location and SF as in build_training_data
+        self.nodeX = node_x
+        self.nodeY = node_y
+        self.model = None
+        self.nodeIndex = array.array('i')
+        self.sf = array.array('b')
+        self.status = array.array('b')
+        self.bufferX = np.empty((self.bufferSize, 3))
+        self.bufferY = np.empty(self.bufferSize, dtype=np.int8)
+        self.bufferCount = 0  # samples added to the ring buffer
+        self.fits = 0
+        self.samples = 0
+        self.accuracy = None  # on the samples collected since the previous fit
+        self.switchTime = None
+        self.nextFitTime = self.fitInterval if self.switch == 'accuracy' else self.warmup
+
+    def add(self, node_index, sf, status):
+        self.nodeIndex.append(node_index)
+        self.sf.append(sf)
+        self.status.append(status)
+
+    def __add_to_buffer(self, X, y):
+        X, y = X[-self.bufferSize:], y[-self.bufferSize:]
+        position = (self.bufferCount + np.arange(len(y))) % self.bufferSize
+        self.bufferX[position] = X
+        self.bufferY[position] = y
+        self.bufferCount += len(y)
+
+    def fit(self, time):
+        # Trains on the samples collected since the previous fit, returns
+        # True at the switch
+        node_index = np.frombuffer(self.nodeIndex, dtype=np.int32)
+        X = np.column_stack((self.nodeX[node_index], self.nodeY[node_index], np.frombuffer(self.sf, dtype=np.int8)))
+        y = np.frombuffer(self.status, dtype=np.int8).copy()
+        self.nodeIndex = array.array('i')
+        self.sf = array.array('b')
+        self.status = array.array('b')
+        self.samples += len(y)
+        self.nextFitTime = time + self.fitInterval
+
+        if len(y) > 0:
+            if self.model is not None:
+                self.accuracy = accuracy_score(y, self.model.predict(X))
+            if self.partialFit:
+                if self.model is None:
+                    self.model = clone(self.classifier)
+                self.model.partial_fit(X, y, classes=STATUS_CLASSES)
+            else:
+                self.__add_to_buffer(X, y)
+                count = min(self.bufferCount, self.bufferSize)
+                self.model = clone(self.classifier)
+                self.model.fit(self.bufferX[:count], self.bufferY[:count])
+            self.fits += 1
+
+        if self.model is None:
+            return False
+        if self.switch == 'time':
+            switched = time >= self.warmup
+        else:
+            switched = time >= self.maxWarmup or (time >= self.warmup and self.accuracy is not None and self.accuracy >= self.minAccuracy)
+        if switched:
+            self.switchTime = time
+        return switched
+
+    def predict(self, X):
+        return self.model.predict(X)
+
+    def __repr__(self):
+        return 'OnlineSfLearner(switch={},switch_time={},fits={},samples={},accuracy={})'.format(
+            self.switch, None if self.switchTime is None else round(self.switchTime, 3), self.fits, self.samples, None if self.accuracy is None else round(self.accuracy, 3))
@@ -18,6 +18,7 @@
 import math
 import random
 import enum
+import numpy as np
 
 
 collision_snir = [
@@ -56,18 +57,126 @@ class PacketSf(enum.Enum):
         return PacketSf(random.randint(7, 12))
 
 
+PHY_SF_LIST = [PacketSf.SF_7, PacketSf.SF_8, PacketSf.SF_9, PacketSf.SF_10, PacketSf.SF_11, PacketSf.SF_12]
+
+
+class PhyModel:
+    # LoRa PHY parameters with tables indexed by SF value (7 to 12). Every
+    # function has a scalar version taking PacketSf or SF values and an array
+    # version taking NumPy arrays of SF values. A model is passed to the
+    # topology and the simulation to try alternative parameter sets.
+    def __init__(self, bit_rates=(5470.0, 3125.0, 1760.0, 980.0, 440.0, 250.0), sensitivities=(-123, -126, -129, -132, -133, -136), snir_table=collision_snir, system_gain=system_gain, tx_power_dbm=14, bandwidth=125, path_loss_constant=120.5, path_loss_exponent=37.6):
+        # Bit rates in bps and receive sensitivities in dBm are given for SF7
+        # to SF12, https://www.semtech.com/uploads/documents/DS_SX1276-7-8-9_W_APP_V5.pdf
+        assert len(bit_rates) == 6 and len(sensitivities) == 6 and len(snir_table) == 6, 'unsupported PHY tables'
+        self.systemGain = system_gain
+        self.txPowerDbm = tx_power_dbm
+        self.txPowerW = PhyModel.dbm_to_watt(tx_power_dbm)
+        self.bandwidth = bandwidth
+        self.pathLossConstant = path_loss_constant
+        self.pathLossExponent = path_loss_exponent
+
+        # Lists are used by scalar functions and arrays by array functions
+        self.bitRate = [math.nan] * 7 + list(bit_rates)
+        self.sensitivityDbm = [math.nan] * 7 + [sensitivity - system_gain for sensitivity in sensitivities]
+        self.snirThreshold = [[math.nan] * 13 for _ in range(7)] + [[math.nan] * 7 + list(row) for row in snir_table]
+        self.bitRateArray = np.array(self.bitRate)
+        self.sensitivityDbmArray = np.array(self.sensitivityDbm)
+        self.snirThresholdArray = np.array(self.snirThreshold)
+
+    def __repr__(self):
+        return 'PhyModel(bit_rates={},sensitivities={},snir={},system_gain={},tx_power_dbm={},bandwidth={},path_loss=({},{}))'.format(self.bitRate[7:], self.sensitivityDbm[7:], [row[7:] for row in self.snirThreshold[7:]], self.systemGain, self.txPowerDbm, self.bandwidth, self.pathLossConstant, self.pathLossExponent)
+
+    def get_airtime(self, sf, size):
+        return (size * 8) / self.bitRate[PhyModel.__get_sf_value(sf)]
+
+    def get_airtime_array(self, sf, size):
+        return (np.asarray(size) * 8) / self.bitRateArray[sf]
+
+    def get_sensitivity(self, sf):
+        return self.sensitivityDbm[PhyModel.__get_sf_value(sf)]
+
+    def get_sensitivity_array(self, sf):
+        return self.sensitivityDbmArray[sf]
+
+    def get_snir_threshold(self, sf, interferer_sf):
+        return self.snirThreshold[PhyModel.__get_sf_value(sf)][PhyModel.__get_sf_value(interferer_sf)]
+
+    def get_snir_threshold_array(self, sf, interferer_sf):
+        return self.snirThresholdArray[sf, interferer_sf]
+
+    def get_path_loss(self, distance):
+        # Assuming f = 868 MHz and h = 15 m
+        return self.pathLossConstant + self.pathLossExponent * math.log10(distance/1000)
+
+    def get_path_loss_array(self, distance):
+        return self.pathLossConstant + self.pathLossExponent * np.log10(np.asarray(distance) / 1000)
+
+    def get_rx_power_dbm(self, distance):
+        return self.txPowerDbm - self.get_path_loss(distance)
+
+    def get_rx_power_dbm_array(self, distance):
+        return self.txPowerDbm - self.get_path_loss_array(distance)
+
+    def get_max_range(self):
+        # Distance where received power drops to the SF12 sensitivity
+        return 1000 * 10 ** ((self.txPowerDbm - self.sensitivityDbm[12] - self.pathLossConstant) / self.pathLossExponent)
+
+    def get_lowest_sf(self, distance, tx_power_dbm=None):
+        # Model TX power is used unless another one is given
+        rx_signal_dbm = (tx_power_dbm if tx_power_dbm is not None else self.txPowerDbm) - self.get_path_loss(distance)
+        for sf, sensitivity_dbm in zip(PHY_SF_LIST, self.sensitivityDbm[7:12]):
+            if rx_signal_dbm > sensitivity_dbm:
+                return sf
+        return PacketSf.SF_12
+
+    def get_lowest_sf_array(self, distance, tx_power_dbm=None):
+        rx_signal_dbm = (tx_power_dbm if tx_power_dbm is not None else self.txPowerDbm) - self.get_path_loss_array(distance)
+        lowest_sf = np.full(rx_signal_dbm.shape, PacketSf.SF_7.value, dtype=np.int8)
+        for sf_value in range(7, 12):
+            lowest_sf += rx_signal_dbm <= self.sensitivityDbm[sf_value]
+        return lowest_sf
+
+    def get_tx_energy(self, sf, size):
+        return self.txPowerW * self.get_airtime(sf, size)
+
+    def get_tx_energy_array(self, sf, size):
+        return self.txPowerW * self.get_airtime_array(sf, size)
+
+    @staticmethod
+    def __get_sf_value(sf):
+        value = sf.value if isinstance(sf, PacketSf) else sf
+        if not 7 <= value <= 12:
+            raise Exception('unsupported sf {}'.format(sf))
+        return value
+
+    @staticmethod
+    def dbm_to_watt(dbm):
+        return (10 ** (dbm/10)) / 1000.0
+
+    @staticmethod
+    def dbm_to_watt_array(dbm):
+        return (10 ** (np.asarray(dbm) / 10)) / 1000.0
+
+
+default_phy = PhyModel()
+
+
 class Packet:
-    def __init__(self, time, sf, source, size, destination=0):
+    __slots__ = ('id', 'time', 'sf', 'source', 'destination', 'status', 'size', 'duration', 'bandwidth', 'tx_power_dbm', 'tx_energy_j')
+
+    def __init__(self, time, sf, source, size, destination=0, phy=default_phy):
+        self.id = None  # assigned when scheduled
         self.time = time
         self.sf = sf
         self.source = source
         self.destination = destination
         self.status = PacketStatus.pending
         self.size = size
-        self.duration = Packet.calculate_transmission_duration(sf, size)
-        self.bandwidth = 125  # TODO
-        self.tx_power_dbm = 14  # dBm TODO
-        self.tx_energy_j = Packet.calculate_energy(power_dbm=self.tx_power_dbm, duration=self.duration)
+        self.duration = phy.get_airtime(sf, size)
+        self.bandwidth = phy.bandwidth
+        self.tx_power_dbm = phy.txPowerDbm
+        self.tx_energy_j = phy.txPowerW * self.duration
 
     def __lt__(self, other):
         return self.time < other.time
@@ -75,63 +184,26 @@ class Packet:
     def __repr__(self):
         return '(t={:.3f},src={},dst={},sf={},bw={},dur={:.3f},p={},e={:.4f},stat={})'.format(self.time, self.source, self.destination, self.sf.name, self.bandwidth, self.duration, self.tx_power_dbm, self.tx_energy_j, self.status.name)
 
+    # Functions of the default PHY model
     @staticmethod
     def calculate_transmission_duration(sf, size):
-        # TODO, consider BW
-        if sf == PacketSf.SF_7:
-            return (size * 8) / 5470.0
-        elif sf == PacketSf.SF_8:
-            return (size * 8) / 3125.0
-        elif sf == PacketSf.SF_9:
-            return (size * 8) / 1760.0
-        elif sf == PacketSf.SF_10:
-            return (size * 8) / 980.0
-        elif sf == PacketSf.SF_11:
-            return (size * 8) / 440.0
-        elif sf == PacketSf.SF_12:
-            return (size * 8) / 250.0
-        else:
-            raise Exception()
+        return default_phy.get_airtime(sf, size)
 
     @staticmethod
     def get_receive_sensitivity(sf):
-        # https://www.semtech.com/uploads/documents/DS_SX1276-7-8-9_W_APP_V5.pdf
-        if sf == PacketSf.SF_7:
-            return -123 - system_gain
-        elif sf == PacketSf.SF_8:
-            return -126 - system_gain
-        elif sf == PacketSf.SF_9:
-            return -129 - system_gain
-        elif sf == PacketSf.SF_10:
-            return -132 - system_gain
-        elif sf == PacketSf.SF_11:
-            return -133 - system_gain
-        elif sf == PacketSf.SF_12:
-            return -136 - system_gain
-        else:
-            raise Exception()
+        return default_phy.get_sensitivity(sf)
 
     @staticmethod
     def calculate_propagation_loss(distance):
-        # Assuming f = 868 MHz and h = 15 m
-        return 120.5 + 37.6 * math.log10(distance/1000)
+        return default_phy.get_path_loss(distance)
 
     @staticmethod
     def get_lowest_sf(distance, erp=14):
-        # TODO erp
-        propagation_loss = Packet.calculate_propagation_loss(distance)
-        if erp - propagation_loss > Packet.get_receive_sensitivity(PacketSf.SF_7):
-            return PacketSf.SF_7
-        elif erp - propagation_loss > Packet.get_receive_sensitivity(PacketSf.SF_8):
-            return PacketSf.SF_8
-        elif erp - propagation_loss > Packet.get_receive_sensitivity(PacketSf.SF_9):
-            return PacketSf.SF_9
-        elif erp - propagation_loss > Packet.get_receive_sensitivity(PacketSf.SF_10):
-            return PacketSf.SF_10
-        elif erp - propagation_loss > Packet.get_receive_sensitivity(PacketSf.SF_11):
-            return PacketSf.SF_11
-        else:
-            return PacketSf.SF_12
+        return default_phy.get_lowest_sf(distance, tx_power_dbm=erp)
+
+    @staticmethod
+    def get_lowest_sf_array(distance, erp=14):
+        return default_phy.get_lowest_sf_array(distance, tx_power_dbm=erp)
 
     @staticmethod
     def calculate_energy(power_dbm, duration):
@@ -139,8 +211,4 @@ class Packet:
 
     @staticmethod
     def dbm_to_watt(dbm):
-        if dbm == 14:
-            # Pre calculated value for commonly used tx_power_dbm
-            return 0.025118864315095794
-        else:
-            return (10 ** (dbm/10)) / 1000.0
+        return PhyModel.dbm_to_watt(dbm)
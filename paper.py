@@ -15,8 +15,6 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; If not, see <http://www.gnu.org/licenses/>.
 
-import random
-import sys
 from matplotlib import rcParams
 rcParams['font.family'] = 'serif'
 import matplotlib.pyplot as plt
@@ -26,9 +24,27 @@ from sklearn.metrics import classification_report, confusion_matrix, accuracy_sc
 from topology import Topology
 from simulation import Simulation
 from simulation import SimulationResult
+from vectorized import VectorizedSimulation
 from packet import PacketSf
-
-random.seed(42)  # for now seed is constant
+from experiment import ExperimentRunner
+from experiment import ReplicationController
+from experiment import seed_all
+from traffic import TrafficTrace
+from traffic import run_sf_policies
+from online import OnlineSfLearner
+from cache import ResultCache
+from modelstore import ModelStore
+
+# Independent (parameter point, replica) jobs are run over all cores, every
+# job has its own seed derived from this constant seed, so figures do not
+# depend on the number of workers. Results of already computed jobs are
+# reused from the on disk cache.
+RUNNER = ExperimentRunner(seed=42, cache=ResultCache('output/cache'))
+MODEL_STORE = ModelStore('output/models')
+
+# Sweeps with state independent SF assignment methods use the vectorized
+# engine, set to Simulation to use the event by event engine instead
+SweepSimulation = VectorizedSimulation
 
 
 class SimulationFigure():
@@ -58,118 +74,129 @@ class SimulationFigure():
         plt.tight_layout()
 
 
-def prediction_accuracy(averaging, number_of_gws, packet_rate, packet_size, simulation_duration, traffic_type):
-    for radius in [3000, 5000, 7000, 10000]:
-        for number_of_nodes in [100, 500, 1000]:
-            prediction_dt_acc_averaging_sum = 0
-            prediction_svm_acc_averaging_sum = 0
-            topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=radius, number_of_gws=number_of_gws, node_traffic_proportions=traffic_type)
-
-            for repeat in range(averaging):
-                simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Random)
-                simulation_result = simulation.run()
-                # simulation.show_results()
-                # simulation.write_to_file('output/sim_r{}_n{}_g{}_p{}_s{}.png'.format(radius, number_of_nodes, number_of_gws, packet_rate, simulation_duration))
-
-                X_train, X_test, y_train, y_test = simulation.get_training_data(test_size=0.2)
-
-                DT_classifier = DecisionTreeClassifier(class_weight='balanced')
-                DT_classifier.fit(X_train, y_train)
-                y_pred = DT_classifier.predict(X_test)
-                prediction_dt_acc_averaging_sum += accuracy_score(y_test, y_pred) * 100
-                # print(classification_report(y_test, y_pred))
-                # print(confusion_matrix(y_test, y_pred, labels=[1, 2, 3]))
-
-                SVM_classifier = svm.SVC(class_weight='balanced', gamma='auto')
-                SVM_classifier.fit(X_train, y_train)
-                y_pred = SVM_classifier.predict(X_test)
-                prediction_svm_acc_averaging_sum += accuracy_score(y_test, y_pred) * 100
-                # print(classification_report(y_test, y_pred))
-                # print(confusion_matrix(y_test, y_pred, labels=[1, 2, 3]))
-
-            print('number_of_nodes={}, radius={}'.format(number_of_nodes, radius))
-            print('accuracy SVM={:.1f}, DTC={:.1f}'.format(prediction_svm_acc_averaging_sum / averaging, prediction_dt_acc_averaging_sum / averaging))
+def sum_results(simulation_result_list):
+    simulation_result_sum = SimulationResult()
+    for simulation_result in simulation_result_list:
+        simulation_result_sum += simulation_result
+    return simulation_result_sum
 
 
-def prediction_pdr(averaging, number_of_gws, packet_rate, packet_size, simulation_duration, traffic_type):
-    for radius in [3000, 5000, 7000, 10000]:
-        for number_of_nodes in [100, 500, 1000]:
-            prediction_dt_pdr_averaging_sum = 0
-            prediction_svm_pdr_averaging_sum = 0
-            lowest_pdr_averaging_sum = 0
-            topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=radius, number_of_gws=number_of_gws, node_traffic_proportions=traffic_type)
+def run_replicas(job, points, averaging, name):
+    # averaging is a fixed number of replicas per point or a
+    # ReplicationController, then achieved confidence intervals are printed
+    if not isinstance(averaging, ReplicationController):
+        return RUNNER.run(job, points, averaging, name=name)
+    results = RUNNER.run_until(job, points, averaging, name=name)
+    for point_index, point_results in enumerate(results):
+        intervals = averaging.get_intervals(point_results)
+        print('{} point {}: {} replicas, {}'.format(name, point_index, len(point_results), ', '.join('{}{}={}'.format('' if series is None else series + ' ', metric, interval) for (series, metric), interval in intervals.items())))
+    return results
 
-            for repeat in range(averaging):
-                simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Random)
-                simulation_result = simulation.run()
 
-                X_train, X_test, y_train, y_test = simulation.get_training_data(test_size=0)
+def sweep_job(point, point_seed, replica_seed):
+    topology = Topology.create_random_topology(number_of_nodes=point['number_of_nodes'], radius=point['radius'], number_of_gws=point['number_of_gws'], node_traffic_proportions=point['traffic_type'])
+    simulation = point['engine'](topology=topology, packet_rate=point['packet_rate'], packet_size=point['packet_size'], simulation_duration=point['simulation_duration'], sf=point['sf'])
+    return simulation.run()
 
-                DT_classifier = DecisionTreeClassifier(class_weight='balanced')
-                DT_classifier.fit(X_train, y_train)
 
-                SVM_classifier = svm.SVC(class_weight='balanced', gamma='auto')
-                SVM_classifier.fit(X_train, y_train)
+def train_classifiers(topology, packet_rate, packet_size, simulation_duration, test_size, max_samples_per_node_sf=None, traffic=None):
+    # Classifiers and the training run result are reused from the model store
+    # for the same topology, traffic and generator states
+    classifiers = [DecisionTreeClassifier(class_weight='balanced'), svm.SVC(class_weight='balanced', gamma='auto')]
+    key = ModelStore.get_key(topology, classifiers, traffic=traffic, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, test_size=test_size, max_samples_per_node_sf=max_samples_per_node_sf)
+    return MODEL_STORE.get_or_train(key, lambda: fit_classifiers(topology, classifiers, packet_rate, packet_size, simulation_duration, test_size, max_samples_per_node_sf, traffic))
 
-                simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Smart, sfPredictor=DT_classifier.predict)
-                simulation_result = simulation.run()
-                prediction_dt_pdr_averaging_sum += simulation_result.pdr
 
-                simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Smart, sfPredictor=SVM_classifier.predict)
-                simulation_result = simulation.run()
-                prediction_svm_pdr_averaging_sum += simulation_result.pdr
+def fit_classifiers(topology, classifiers, packet_rate, packet_size, simulation_duration, test_size, max_samples_per_node_sf, traffic):
+    simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Random, traffic=traffic)
+    simulation_result = simulation.run()
 
-                simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Lowest)
-                simulation_result = simulation.run()
-                lowest_pdr_averaging_sum += simulation_result.pdr
+    X_train, X_test, y_train, y_test = simulation.get_training_data(test_size=test_size, max_samples_per_node_sf=max_samples_per_node_sf)
 
-            print('number_of_nodes={}, radius={}'.format(number_of_nodes, radius))
-            print('pdr L={:.1f}, SWM={:.1f}, DTC={:.1f}'.format(lowest_pdr_averaging_sum / averaging, prediction_svm_pdr_averaging_sum / averaging, prediction_dt_pdr_averaging_sum / averaging))
+    DT_classifier, SVM_classifier = classifiers
+    DT_classifier.fit(X_train, y_train)
+    SVM_classifier.fit(X_train, y_train)
 
+    return simulation_result, DT_classifier, SVM_classifier, X_test, y_test
 
-def plot_prediction(number_of_nodes_list, averaging, topology_radius, number_of_gws, packet_rate, packet_size, simulation_duration, traffic_type):
-    prediction_name_list = [PacketSf.SF_Random.name, 'SF_Smart_DTC', 'SF_Smart_SVM', PacketSf.SF_Lowest.name]
-    prediction_pdr_figure = SimulationFigure(number_of_nodes_list, prediction_name_list)
-    prediction_energy_figure = SimulationFigure(number_of_nodes_list, prediction_name_list)
-    for number_of_nodes in number_of_nodes_list:
-        random_simulation_result_sum = SimulationResult()
-        prediction_dt_simulation_result_sum = SimulationResult()
-        prediction_svm_simulation_result_sum = SimulationResult()
-        lowest_simulation_result_sum = SimulationResult()
-        sys.stdout.write('.')
-        sys.stdout.flush()
-        topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=topology_radius, number_of_gws=number_of_gws, node_traffic_proportions=traffic_type)
 
-        for repeat in range(averaging):
-            simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Random)
-            random_simulation_result_sum += simulation.run()
+def prediction_accuracy_job(point, point_seed, replica_seed):
+    # Replicas of a point share the same topology
+    seed_all(point_seed)
+    topology = Topology.create_random_topology(number_of_nodes=point['number_of_nodes'], radius=point['radius'], number_of_gws=point['number_of_gws'], node_traffic_proportions=point['traffic_type'])
+    seed_all(replica_seed)
 
-            X_train, X_test, y_train, y_test = simulation.get_training_data(test_size=0)
+    _, DT_classifier, SVM_classifier, X_test, y_test = train_classifiers(topology, point['packet_rate'], point['packet_size'], point['simulation_duration'], test_size=0.2)
+    dt_accuracy = accuracy_score(y_test, DT_classifier.predict(X_test)) * 100
+    svm_accuracy = accuracy_score(y_test, SVM_classifier.predict(X_test)) * 100
+    # print(classification_report(y_test, y_pred))
+    # print(confusion_matrix(y_test, y_pred, labels=[1, 2, 3]))
+    return dt_accuracy, svm_accuracy
 
-            DT_classifier = DecisionTreeClassifier(class_weight='balanced')
-            DT_classifier.fit(X_train, y_train)
 
-            SVM_classifier = svm.SVC(class_weight='balanced', gamma='auto')
-            SVM_classifier.fit(X_train, y_train)
+def prediction_job(point, point_seed, replica_seed):
+    # Replicas of a point share the same topology
+    seed_all(point_seed)
+    topology = Topology.create_random_topology(number_of_nodes=point['number_of_nodes'], radius=point['radius'], number_of_gws=point['number_of_gws'], node_traffic_proportions=point['traffic_type'])
+    seed_all(replica_seed)
+    # SF assignment methods are compared on the same traffic
+    traffic = TrafficTrace.generate(topology, point['packet_rate'], point['simulation_duration'])
 
-            simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Smart, sfPredictor=DT_classifier.predict)
-            prediction_dt_simulation_result_sum += simulation.run()
+    random_simulation_result, DT_classifier, SVM_classifier, _, _ = train_classifiers(topology, point['packet_rate'], point['packet_size'], point['simulation_duration'], test_size=0, traffic=traffic)
+    simulation_results = {PacketSf.SF_Random.name: random_simulation_result}
+    simulation_results.update(run_sf_policies(topology, traffic, {
+        'SF_Smart_DTC': (PacketSf.SF_Smart, DT_classifier.predict),
+        'SF_Smart_SVM': (PacketSf.SF_Smart, SVM_classifier.predict),
+        PacketSf.SF_Lowest.name: (PacketSf.SF_Lowest, None),
+    }, point['packet_size']))
+    # Decision tree trained in the warm-up window of the run it is used in
+    learner = OnlineSfLearner(DecisionTreeClassifier(class_weight='balanced'), warmup=point['online_warmup'])
+    simulation = Simulation(topology=topology, packet_rate=point['packet_rate'], packet_size=point['packet_size'], simulation_duration=point['simulation_duration'], sf=PacketSf.SF_Smart, traffic=traffic, learner=learner)
+    simulation_results['SF_Smart_Online'] = simulation.run()
+    return simulation_results
 
-            simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Smart, sfPredictor=SVM_classifier.predict)
-            prediction_svm_simulation_result_sum += simulation.run()
 
-            simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Lowest)
-            lowest_simulation_result_sum += simulation.run()
-
-        prediction_pdr_figure.plot_data[PacketSf.SF_Random.name].append(float(random_simulation_result_sum.pdr) / averaging)
-        prediction_pdr_figure.plot_data['SF_Smart_DTC'].append(float(prediction_dt_simulation_result_sum.pdr) / averaging)
-        prediction_pdr_figure.plot_data['SF_Smart_SVM'].append(float(prediction_svm_simulation_result_sum.pdr) / averaging)
-        prediction_pdr_figure.plot_data[PacketSf.SF_Lowest.name].append(float(lowest_simulation_result_sum.pdr) / averaging)
+def prediction_accuracy(averaging, number_of_gws, packet_rate, packet_size, simulation_duration, traffic_type):
+    points = [dict(radius=radius, number_of_nodes=number_of_nodes, number_of_gws=number_of_gws, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, traffic_type=traffic_type)
+              for radius in [3000, 5000, 7000, 10000] for number_of_nodes in [100, 500, 1000]]
+    results = RUNNER.run(prediction_accuracy_job, points, averaging, name='prediction_accuracy')
+
+    for point, point_results in zip(points, results):
+        prediction_dt_acc_averaging_sum = sum(dt_accuracy for dt_accuracy, _ in point_results)
+        prediction_svm_acc_averaging_sum = sum(svm_accuracy for _, svm_accuracy in point_results)
+        print('number_of_nodes={}, radius={}'.format(point['number_of_nodes'], point['radius']))
+        print('accuracy SVM={:.1f}, DTC={:.1f}'.format(prediction_svm_acc_averaging_sum / averaging, prediction_dt_acc_averaging_sum / averaging))
+
+
+def prediction_pdr(averaging, number_of_gws, packet_rate, packet_size, simulation_duration, traffic_type, online_warmup):
+    points = [dict(radius=radius, number_of_nodes=number_of_nodes, number_of_gws=number_of_gws, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, traffic_type=traffic_type, online_warmup=online_warmup)
+              for radius in [3000, 5000, 7000, 10000] for number_of_nodes in [100, 500, 1000]]
+    results = run_replicas(prediction_job, points, averaging, name='prediction_pdr')
+
+    for point, point_results in zip(points, results):
+        prediction_dt_pdr_averaging_sum = sum(simulation_results['SF_Smart_DTC'].pdr for simulation_results in point_results)
+        prediction_svm_pdr_averaging_sum = sum(simulation_results['SF_Smart_SVM'].pdr for simulation_results in point_results)
+        lowest_pdr_averaging_sum = sum(simulation_results[PacketSf.SF_Lowest.name].pdr for simulation_results in point_results)
+        online_pdr_averaging_sum = sum(simulation_results['SF_Smart_Online'].pdr for simulation_results in point_results)
+        online_switch_time_sum = sum(simulation_results['SF_Smart_Online'].sfSwitchTime or 0 for simulation_results in point_results)
+        print('number_of_nodes={}, radius={}'.format(point['number_of_nodes'], point['radius']))
+        print('pdr L={:.1f}, SWM={:.1f}, DTC={:.1f}, Online DTC={:.1f} (switch at {:.0f} s)'.format(lowest_pdr_averaging_sum / len(point_results), prediction_svm_pdr_averaging_sum / len(point_results), prediction_dt_pdr_averaging_sum / len(point_results),
+                                                                                       online_pdr_averaging_sum / len(point_results), online_switch_time_sum / len(point_results)))
+
+
+def plot_prediction(number_of_nodes_list, averaging, topology_radius, number_of_gws, packet_rate, packet_size, simulation_duration, traffic_type, online_warmup):
+    prediction_name_list = [PacketSf.SF_Random.name, 'SF_Smart_DTC', 'SF_Smart_SVM', 'SF_Smart_Online', PacketSf.SF_Lowest.name]
+    prediction_pdr_figure = SimulationFigure(number_of_nodes_list, prediction_name_list)
+    prediction_energy_figure = SimulationFigure(number_of_nodes_list, prediction_name_list)
+    points = [dict(radius=topology_radius, number_of_nodes=number_of_nodes, number_of_gws=number_of_gws, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, traffic_type=traffic_type, online_warmup=online_warmup)
+              for number_of_nodes in number_of_nodes_list]
+    results = run_replicas(prediction_job, points, averaging, name='plot_prediction')
 
-        prediction_energy_figure.plot_data[PacketSf.SF_Random.name].append(float(random_simulation_result_sum.txEnergyConsumption) / averaging)
-        prediction_energy_figure.plot_data['SF_Smart_DTC'].append(float(prediction_dt_simulation_result_sum.txEnergyConsumption) / averaging)
-        prediction_energy_figure.plot_data['SF_Smart_SVM'].append(float(prediction_svm_simulation_result_sum.txEnergyConsumption) / averaging)
-        prediction_energy_figure.plot_data[PacketSf.SF_Lowest.name].append(float(lowest_simulation_result_sum.txEnergyConsumption) / averaging)
+    for point_results in results:
+        for prediction_name in prediction_name_list:
+            simulation_result_sum = sum_results(simulation_results[prediction_name] for simulation_results in point_results)
+            prediction_pdr_figure.plot_data[prediction_name].append(float(simulation_result_sum.pdr) / len(point_results))
+            prediction_energy_figure.plot_data[prediction_name].append(float(simulation_result_sum.txEnergyConsumption) / len(point_results))
 
     prediction_pdr_figure.get_plot(xlabel='Number of nodes', ylabel='PDR (%)', xlim_left=0, xlim_right=1000)
     plt.legend(loc='upper right', fontsize='small', title='SF')
@@ -180,24 +207,33 @@ def plot_prediction(number_of_nodes_list, averaging, topology_radius, number_of_
     plt.savefig('output/prediction_energy_r{}_g{}_p{}_s{}.png'.format(topology_radius, number_of_gws, packet_rate, simulation_duration), dpi=200, transparent=True)
 
 
+def plot_sweep(name, series_list, series_key, number_of_nodes_list, averaging, base_point):
+    # Runs every (series, number of nodes) point, returns averaged PDR and
+    # energy figures keyed by series
+    pdr_figure = SimulationFigure(number_of_nodes_list, [series_name for series_name, _ in series_list])
+    energy_figure = SimulationFigure(number_of_nodes_list, [series_name for series_name, _ in series_list])
+    points = []
+    for series_name, series_value in series_list:
+        for number_of_nodes in number_of_nodes_list:
+            point = dict(base_point, number_of_nodes=number_of_nodes, engine=SweepSimulation)
+            point[series_key] = series_value
+            points.append(point)
+    results = run_replicas(sweep_job, points, averaging, name=name)
+
+    point_index = 0
+    for series_name, _ in series_list:
+        for _ in number_of_nodes_list:
+            simulation_result_sum = sum_results(results[point_index])
+            pdr_figure.plot_data[series_name].append(float(simulation_result_sum.pdr) / len(results[point_index]))
+            energy_figure.plot_data[series_name].append(float(simulation_result_sum.txEnergyConsumption) / len(results[point_index]))
+            point_index += 1
+    return pdr_figure, energy_figure
+
+
 def plot_sf(number_of_nodes_list, averaging, topology_radius, number_of_gws, packet_rate, packet_size, simulation_duration, traffic_type):
     sf_list = [PacketSf.SF_7, PacketSf.SF_8, PacketSf.SF_9, PacketSf.SF_10, PacketSf.SF_11, PacketSf.SF_12, PacketSf.SF_Lowest, PacketSf.SF_Random]
-    sf_pdr_figure = SimulationFigure(number_of_nodes_list, [sf.name for sf in sf_list])
-    sf_energy_figure = SimulationFigure(number_of_nodes_list, [sf.name for sf in sf_list])
-
-    for sf in sf_list:
-        sys.stdout.write('\n{} '.format(sf))
-        sys.stdout.flush()
-        for number_of_nodes in number_of_nodes_list:
-            sys.stdout.write('.')
-            sys.stdout.flush()
-            simulation_result_sum = SimulationResult()
-            for repeat in range(averaging):
-                topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=topology_radius, number_of_gws=number_of_gws, node_traffic_proportions=traffic_type)
-                simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=sf)
-                simulation_result_sum += simulation.run()
-            sf_pdr_figure.plot_data[sf.name].append(float(simulation_result_sum.pdr) / averaging)
-            sf_energy_figure.plot_data[sf.name].append(float(simulation_result_sum.txEnergyConsumption) / averaging)
+    base_point = dict(radius=topology_radius, number_of_gws=number_of_gws, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, traffic_type=traffic_type)
+    sf_pdr_figure, sf_energy_figure = plot_sweep('plot_sf', [(sf.name, sf) for sf in sf_list], 'sf', number_of_nodes_list, averaging, base_point)
 
     sf_pdr_figure.get_plot(xlabel='Number of nodes', ylabel='PDR (%)', ylim_bottom=0, xlim_left=0, xlim_right=1000)
     plt.legend(loc='upper right', fontsize='small', title='SF', ncol=2)
@@ -210,22 +246,8 @@ def plot_sf(number_of_nodes_list, averaging, topology_radius, number_of_gws, pac
 
 def plot_gw(number_of_nodes_list, averaging, topology_radius, packet_rate, packet_size, simulation_duration, traffic_type):
     number_of_gws_list = range(1, 5)
-    gw_pdr_figure = SimulationFigure(number_of_nodes_list, number_of_gws_list)
-    gw_energy_figure = SimulationFigure(number_of_nodes_list, number_of_gws_list)
-
-    for number_of_gws in number_of_gws_list:
-        sys.stdout.write('\n{} '.format(number_of_gws))
-        sys.stdout.flush()
-        for number_of_nodes in number_of_nodes_list:
-            sys.stdout.write('.')
-            sys.stdout.flush()
-            simulation_result_sum = SimulationResult()
-            for repeat in range(averaging):
-                topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=topology_radius, number_of_gws=number_of_gws, node_traffic_proportions=traffic_type)
-                simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Lowest)
-                simulation_result_sum += simulation.run()
-            gw_pdr_figure.plot_data[number_of_gws].append(float(simulation_result_sum.pdr) / averaging)
-            gw_energy_figure.plot_data[number_of_gws].append(float(simulation_result_sum.txEnergyConsumption) / averaging)
+    base_point = dict(radius=topology_radius, sf=PacketSf.SF_Lowest, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, traffic_type=traffic_type)
+    gw_pdr_figure, gw_energy_figure = plot_sweep('plot_gw', [(number_of_gws, number_of_gws) for number_of_gws in number_of_gws_list], 'number_of_gws', number_of_nodes_list, averaging, base_point)
 
     gw_pdr_figure.get_plot(xlabel='Number of nodes', ylabel='PDR (%)', xlim_left=0, xlim_right=1000)
     plt.legend(fontsize='small', title='Number of GWs')
@@ -238,22 +260,8 @@ def plot_gw(number_of_nodes_list, averaging, topology_radius, packet_rate, packe
 
 def plot_r(number_of_nodes_list, averaging, number_of_gws, packet_rate, packet_size, simulation_duration, traffic_type):
     radius_list = range(1000, 11001, 2000)
-    r_pdr_figure = SimulationFigure(number_of_nodes_list, radius_list)
-    r_energy_figure = SimulationFigure(number_of_nodes_list, radius_list)
-
-    for radius in radius_list:
-        sys.stdout.write('\n{} '.format(radius))
-        sys.stdout.flush()
-        for number_of_nodes in number_of_nodes_list:
-            sys.stdout.write('.')
-            sys.stdout.flush()
-            simulation_result_sum = SimulationResult()
-            for repeat in range(averaging):
-                topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=radius, number_of_gws=number_of_gws, node_traffic_proportions=traffic_type)
-                simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Lowest)
-                simulation_result_sum += simulation.run()
-            r_pdr_figure.plot_data[radius].append(float(simulation_result_sum.pdr) / averaging)
-            r_energy_figure.plot_data[radius].append(float(simulation_result_sum.txEnergyConsumption) / averaging)
+    base_point = dict(number_of_gws=number_of_gws, sf=PacketSf.SF_Lowest, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, traffic_type=traffic_type)
+    r_pdr_figure, r_energy_figure = plot_sweep('plot_r', [(radius, radius) for radius in radius_list], 'radius', number_of_nodes_list, averaging, base_point)
 
     r_pdr_figure.get_plot(xlabel='Number of nodes', ylabel='PDR (%)', xlim_left=0, xlim_right=1000)
     plt.legend(fontsize='small', title='Radius (m)')
@@ -266,22 +274,8 @@ def plot_r(number_of_nodes_list, averaging, number_of_gws, packet_rate, packet_s
 
 def plot_pr(number_of_nodes_list, averaging, topology_radius, number_of_gws, packet_size, simulation_duration, traffic_type):
     packet_rate_list = [0.005, 0.01, 0.02, 0.04, 0.08]
-    pr_pdr_figure = SimulationFigure(number_of_nodes_list, packet_rate_list)
-    pr_energy_figure = SimulationFigure(number_of_nodes_list, packet_rate_list)
-
-    for packet_rate in packet_rate_list:
-        sys.stdout.write('\n{} '.format(packet_rate))
-        sys.stdout.flush()
-        for number_of_nodes in number_of_nodes_list:
-            sys.stdout.write('.')
-            sys.stdout.flush()
-            simulation_result_sum = SimulationResult()
-            for repeat in range(averaging):
-                topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=topology_radius, number_of_gws=number_of_gws, node_traffic_proportions=traffic_type)
-                simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Lowest)
-                simulation_result_sum += simulation.run()
-            pr_pdr_figure.plot_data[packet_rate].append(float(simulation_result_sum.pdr) / averaging)
-            pr_energy_figure.plot_data[packet_rate].append(float(simulation_result_sum.txEnergyConsumption) / averaging)
+    base_point = dict(radius=topology_radius, number_of_gws=number_of_gws, sf=PacketSf.SF_Lowest, packet_size=packet_size, simulation_duration=simulation_duration, traffic_type=traffic_type)
+    pr_pdr_figure, pr_energy_figure = plot_sweep('plot_pr', [(packet_rate, packet_rate) for packet_rate in packet_rate_list], 'packet_rate', number_of_nodes_list, averaging, base_point)
 
     pr_pdr_figure.get_plot(xlabel='Number of nodes', ylabel='PDR (%)', ylim_bottom=0, xlim_left=0, xlim_right=1000)
     plt.legend(fontsize='small', title='Packet Rate (pps)')
@@ -294,22 +288,8 @@ def plot_pr(number_of_nodes_list, averaging, topology_radius, number_of_gws, pac
 
 def plot_trfc(number_of_nodes_list, averaging, topology_radius, number_of_gws, packet_rate, packet_size, simulation_duration):
     traffic_type_list = [(1, 0), (0.8, 0.2), (0.5, 0.5), (0.2, 0.8), (0, 1)]
-    trfc_pdr_figure = SimulationFigure(number_of_nodes_list, traffic_type_list)
-    trfc_energy_figure = SimulationFigure(number_of_nodes_list, traffic_type_list)
-
-    for traffic_type in traffic_type_list:
-        sys.stdout.write('\n{} '.format(traffic_type))
-        sys.stdout.flush()
-        for number_of_nodes in number_of_nodes_list:
-            sys.stdout.write('.')
-            sys.stdout.flush()
-            simulation_result_sum = SimulationResult()
-            for repeat in range(averaging):
-                topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=topology_radius, number_of_gws=number_of_gws, node_traffic_proportions=traffic_type)
-                simulation = Simulation(topology=topology, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration, sf=PacketSf.SF_Lowest)
-                simulation_result_sum += simulation.run()
-            trfc_pdr_figure.plot_data[traffic_type].append(float(simulation_result_sum.pdr) / averaging)
-            trfc_energy_figure.plot_data[traffic_type].append(float(simulation_result_sum.txEnergyConsumption) / averaging)
+    base_point = dict(radius=topology_radius, number_of_gws=number_of_gws, sf=PacketSf.SF_Lowest, packet_rate=packet_rate, packet_size=packet_size, simulation_duration=simulation_duration)
+    trfc_pdr_figure, trfc_energy_figure = plot_sweep('plot_trfc', [(traffic_type, traffic_type) for traffic_type in traffic_type_list], 'traffic_type', number_of_nodes_list, averaging, base_point)
 
     trfc_pdr_figure.get_plot(xlabel='Number of nodes', ylabel='PDR (%)', xlim_left=0, xlim_right=1000)
     plt.legend(fontsize='small', title='Traffic types')
@@ -330,91 +310,98 @@ PACKET_RATE = 0.01  # per second
 PACKET_SIZE = 60  # bytes, header + payload, 13 + max(51 to 222)
 TRAFFIC_TYPE = (1, 0)  # poisson, periodic
 AVERAGING = 5
+ONLINE_WARMUP = 600  # seconds of random SFs before the online smart SF switch
+# Replicas of a point are added until the 95 % confidence intervals of PDR,
+# throughput and energy are narrow enough
+REPLICATION = ReplicationController(min_replicas=3, max_replicas=15, confidence=0.95, targets={'pdr': 2.0}, relative_targets={'throughput': 0.1, 'txEnergyConsumption': 0.1})
 NUMBER_OF_NODES_LIST = range(50, 1001, 50)
 
 
-prediction_accuracy(averaging=AVERAGING,
-        number_of_gws=PRED_NUMBER_OF_GWS,
-        packet_rate=PACKET_RATE,
-        packet_size=PACKET_SIZE,
-        simulation_duration=SIMULATION_DURATION,
-        traffic_type=TRAFFIC_TYPE)
-
-prediction_pdr(averaging=AVERAGING,
-        number_of_gws=PRED_NUMBER_OF_GWS,
-        packet_rate=PACKET_RATE,
-        packet_size=PACKET_SIZE,
-        simulation_duration=SIMULATION_DURATION,
-        traffic_type=TRAFFIC_TYPE)
-
-plot_prediction(number_of_nodes_list=NUMBER_OF_NODES_LIST,
-        averaging=AVERAGING,
-        topology_radius=PRED_TOPOLOGY_RADIUS,
-        number_of_gws=PRED_NUMBER_OF_GWS,
-        packet_rate=PACKET_RATE,
-        packet_size=PACKET_SIZE,
-        simulation_duration=SIMULATION_DURATION,
-        traffic_type=TRAFFIC_TYPE)
-
-plot_sf(number_of_nodes_list=NUMBER_OF_NODES_LIST,
-        averaging=AVERAGING,
-        topology_radius=TOPOLOGY_RADIUS,
-        number_of_gws=NUMBER_OF_GWS,
-        packet_rate=PACKET_RATE,
-        packet_size=PACKET_SIZE,
-        simulation_duration=SIMULATION_DURATION,
-        traffic_type=TRAFFIC_TYPE)
-
-plot_gw(number_of_nodes_list=NUMBER_OF_NODES_LIST,
-        averaging=AVERAGING,
-        topology_radius=TOPOLOGY_RADIUS,
-        packet_rate=PACKET_RATE,
-        packet_size=PACKET_SIZE,
-        simulation_duration=SIMULATION_DURATION,
-        traffic_type=TRAFFIC_TYPE)
-
-plot_r(number_of_nodes_list=NUMBER_OF_NODES_LIST,
-        averaging=AVERAGING,
-        number_of_gws=NUMBER_OF_GWS,
-        packet_rate=PACKET_RATE,
-        packet_size=PACKET_SIZE,
-        simulation_duration=SIMULATION_DURATION,
-        traffic_type=TRAFFIC_TYPE)
-
-plot_pr(number_of_nodes_list=NUMBER_OF_NODES_LIST,
-        averaging=AVERAGING,
-        topology_radius=TOPOLOGY_RADIUS,
-        number_of_gws=NUMBER_OF_GWS,
-        packet_size=PACKET_SIZE,
-        simulation_duration=SIMULATION_DURATION,
-        traffic_type=TRAFFIC_TYPE)
-
-plot_trfc(number_of_nodes_list=NUMBER_OF_NODES_LIST,
-        averaging=AVERAGING,
-        topology_radius=TOPOLOGY_RADIUS,
-        number_of_gws=NUMBER_OF_GWS,
-        packet_rate=PACKET_RATE,
-        packet_size=PACKET_SIZE,
-        simulation_duration=SIMULATION_DURATION)
-
-# for radius in [3000, 5000, 7000, 10000, 13000]:
-#     for gw in [3, 4]:
-#         plot_prediction(number_of_nodes_list=NUMBER_OF_NODES_LIST,
-#                 averaging=AVERAGING,
-#                 topology_radius=radius,
-#                 number_of_gws=gw,
-#                 packet_rate=PACKET_RATE,
-#                 packet_size=PACKET_SIZE,
-#                 simulation_duration=SIMULATION_DURATION,
-#                 traffic_type=TRAFFIC_TYPE)
-#
-# for radius in [3000, 5000, 7000, 10000, 13000]:
-#     for gw in [1, 2, 3]:
-#         plot_sf(number_of_nodes_list=NUMBER_OF_NODES_LIST,
-#                 averaging=AVERAGING,
-#                 topology_radius=radius,
-#                 number_of_gws=gw,
-#                 packet_rate=PACKET_RATE,
-#                 packet_size=PACKET_SIZE,
-#                 simulation_duration=SIMULATION_DURATION,
-#                 traffic_type=TRAFFIC_TYPE)
+if __name__ == "__main__":
+    prediction_accuracy(averaging=AVERAGING,
+            number_of_gws=PRED_NUMBER_OF_GWS,
+            packet_rate=PACKET_RATE,
+            packet_size=PACKET_SIZE,
+            simulation_duration=SIMULATION_DURATION,
+            traffic_type=TRAFFIC_TYPE)
+
+    prediction_pdr(averaging=REPLICATION,
+            number_of_gws=PRED_NUMBER_OF_GWS,
+            packet_rate=PACKET_RATE,
+            packet_size=PACKET_SIZE,
+            simulation_duration=SIMULATION_DURATION,
+            traffic_type=TRAFFIC_TYPE,
+            online_warmup=ONLINE_WARMUP)
+
+    plot_prediction(number_of_nodes_list=NUMBER_OF_NODES_LIST,
+            averaging=REPLICATION,
+            topology_radius=PRED_TOPOLOGY_RADIUS,
+            number_of_gws=PRED_NUMBER_OF_GWS,
+            packet_rate=PACKET_RATE,
+            packet_size=PACKET_SIZE,
+            simulation_duration=SIMULATION_DURATION,
+            traffic_type=TRAFFIC_TYPE,
+            online_warmup=ONLINE_WARMUP)
+
+    plot_sf(number_of_nodes_list=NUMBER_OF_NODES_LIST,
+            averaging=REPLICATION,
+            topology_radius=TOPOLOGY_RADIUS,
+            number_of_gws=NUMBER_OF_GWS,
+            packet_rate=PACKET_RATE,
+            packet_size=PACKET_SIZE,
+            simulation_duration=SIMULATION_DURATION,
+            traffic_type=TRAFFIC_TYPE)
+
+    plot_gw(number_of_nodes_list=NUMBER_OF_NODES_LIST,
+            averaging=REPLICATION,
+            topology_radius=TOPOLOGY_RADIUS,
+            packet_rate=PACKET_RATE,
+            packet_size=PACKET_SIZE,
+            simulation_duration=SIMULATION_DURATION,
+            traffic_type=TRAFFIC_TYPE)
+
+    plot_r(number_of_nodes_list=NUMBER_OF_NODES_LIST,
+            averaging=REPLICATION,
+            number_of_gws=NUMBER_OF_GWS,
+            packet_rate=PACKET_RATE,
+            packet_size=PACKET_SIZE,
+            simulation_duration=SIMULATION_DURATION,
+            traffic_type=TRAFFIC_TYPE)
+
+    plot_pr(number_of_nodes_list=NUMBER_OF_NODES_LIST,
+            averaging=REPLICATION,
+            topology_radius=TOPOLOGY_RADIUS,
+            number_of_gws=NUMBER_OF_GWS,
+            packet_size=PACKET_SIZE,
+            simulation_duration=SIMULATION_DURATION,
+            traffic_type=TRAFFIC_TYPE)
+
+    plot_trfc(number_of_nodes_list=NUMBER_OF_NODES_LIST,
+            averaging=REPLICATION,
+            topology_radius=TOPOLOGY_RADIUS,
+            number_of_gws=NUMBER_OF_GWS,
+            packet_rate=PACKET_RATE,
+            packet_size=PACKET_SIZE,
+            simulation_duration=SIMULATION_DURATION)
+
+    # for radius in [3000, 5000, 7000, 10000, 13000]:
+    #     for gw in [3, 4]:
+    #         plot_prediction(number_of_nodes_list=NUMBER_OF_NODES_LIST,
+    #                 averaging=REPLICATION,
+    #                 topology_radius=radius,
+    #                 number_of_gws=gw,
+    #                 packet_rate=PACKET_RATE,
+    #                 packet_size=PACKET_SIZE,
+    #                 simulation_duration=SIMULATION_DURATION,
+    #                 traffic_type=TRAFFIC_TYPE)
+    #
+    # for radius in [3000, 5000, 7000, 10000, 13000]:
+    #     for gw in [1, 2, 3]:
+    #         plot_sf(number_of_nodes_list=NUMBER_OF_NODES_LIST,
+    #                 averaging=REPLICATION,
+    #                 topology_radius=radius,
+    #                 number_of_gws=gw,
+    #                 packet_rate=PACKET_RATE,
+    #                 packet_size=PACKET_SIZE,
+    #                 simulation_duration=SIMULATION_DURATION,
+    #                 traffic_type=TRAFFIC_TYPE)
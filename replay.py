@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from packet import PacketStatus
+from topology import LinkBudget
+from eventlog import EventLog
+from simulation import SimulationResult
+from vectorized import evaluate_link_budgets
+
+
+class TraceReplay:
+    # Reception and interference stage of the transmissions in a columnar
+    # event log replayed under other PHY models, without generating traffic
+    # again. Transmission times, sources, SFs and durations are taken from
+    # the log, received powers, sensitivities and SNIR thresholds from the
+    # PHY models. Memory mapped event chunks are read once in batches of
+    # batch_size events with the transmissions around a batch that can
+    # overlap it. Overlapping pairs of a batch are searched once and every
+    # PHY model is evaluated on them, so memory is bounded by the batch size
+    # regardless of the log size.
+    def __init__(self, directory, batch_size=1048576):
+        self.eventLog = EventLog(directory, mmap=True)
+        self.batchSize = batch_size
+        nodes = self.eventLog.nodes
+        gateways = nodes[nodes['gateway']]
+        end_devices = nodes[~nodes['gateway']]
+        self.gw_x = np.ascontiguousarray(gateways['x'])
+        self.gw_y = np.ascontiguousarray(gateways['y'])
+        self.node_x = np.ascontiguousarray(end_devices['x'])
+        self.node_y = np.ascontiguousarray(end_devices['y'])
+        self.firstNodeId = len(gateways) + 1
+        self.chunkOffsets = np.cumsum([0] + [len(chunk) for chunk in self.eventLog.chunks])
+        self.maxDuration = max((float(chunk['duration'].max()) for chunk in self.eventLog.chunks if len(chunk) > 0), default=0.0)
+
+    def __len__(self):
+        return int(self.chunkOffsets[-1])
+
+    def __read(self, start, stop):
+        # Events [start, stop) of the log as one structured array
+        parts = []
+        for chunk_index, chunk in enumerate(self.eventLog.chunks):
+            chunk_start = self.chunkOffsets[chunk_index]
+            if chunk_start >= stop:
+                break
+            if chunk_start + len(chunk) > start:
+                parts.append(chunk[max(start - chunk_start, 0):stop - chunk_start])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=self.eventLog.chunks[0].dtype)
+
+    def __read_context(self, start, stop, first_time, last_time):
+        # Batch with the events before it that end after first_time and the
+        # events after it that start before last_time, step sizes grow until
+        # the context is covered
+        step = 1024
+        while True:
+            before_start = max(start - step, 0)
+            before = self.__read(before_start, start)
+            if before_start == 0 or before['time'][0] < first_time:
+                break
+            step *= 4
+        step = 1024
+        while True:
+            after_stop = min(stop + step, len(self))
+            after = self.__read(stop, after_stop)
+            if after_stop == len(self) or after['time'][-1] > last_time:
+                break
+            step *= 4
+        return before, after
+
+    def run(self, phy_list):
+        # Returns a SimulationResult for every PHY model
+        link_budgets = [LinkBudget(self.node_x, self.node_y, self.gw_x, self.gw_y, phy=phy) for phy in phy_list]
+        results = [SimulationResult() for _ in phy_list]
+        successful_size = [0] * len(phy_list)
+        total_duration = 0.0
+
+        for start in range(0, len(self), self.batchSize):
+            stop = min(start + self.batchSize, len(self))
+            batch = self.__read(start, stop)
+            before, after = self.__read_context(start, stop, batch['time'][0] - self.maxDuration, float((batch['time'] + batch['duration']).max()))
+            window = np.concatenate([before, batch, after])
+            in_batch = slice(len(before), len(before) + len(batch))
+            time = np.ascontiguousarray(window['time'])
+            duration = np.ascontiguousarray(window['duration'])
+            sf = np.ascontiguousarray(window['sf'])
+            node_index = window['source'].astype(np.intp) - self.firstNodeId
+            total_duration += float(batch['duration'].sum())
+
+            status_list = evaluate_link_budgets(time, duration, sf, node_index, link_budgets)
+            for phy_index, link_budget in enumerate(link_budgets):
+                status = status_list[phy_index][in_batch]
+                result = results[phy_index]
+                transmitted = status == PacketStatus.transmitted.value
+                result.totalPacket += len(batch)
+                result.successfulPacket += int(transmitted.sum())
+                result.underSensitivityPacket += int((status == PacketStatus.under_sensitivity.value).sum())
+                result.interferencePacket += int((status == PacketStatus.interfered.value).sum())
+                result.txEnergyConsumption += float(link_budget.phy.txPowerW * batch['duration'].sum())
+                successful_size[phy_index] += int(batch['size'][transmitted].sum())
+
+        for result, size in zip(results, successful_size):
+            if result.totalPacket > 0:
+                result.pdr = 100 * float(result.successfulPacket) / result.totalPacket
+                result.throughput = 8 * float(size) / total_duration
+        return results
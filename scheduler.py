@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import heapq
+
+
+class EventScheduler:
+    # Pending events are kept in a binary heap. Events that are looked ahead
+    # (pending events starting before the end of the current transmission)
+    # are moved to a short sorted window, which always holds the earliest
+    # pending events. Window size is bounded by the number of transmissions
+    # that can start during one airtime, so sorted insertion there is cheap.
+    def __init__(self):
+        self.__heap = []
+        self.__window = []
+        self.__sequence = 0
+
+    def __len__(self):
+        return len(self.__heap) + len(self.__window)
+
+    def push(self, event):
+        if event is None:
+            return
+        if self.__window and event.time <= self.__window[-1].time:
+            bisect.insort_left(self.__window, event)
+        else:
+            # Negative sequence number keeps the latest pushed event first among
+            # equal times, same as insort_left on a sorted list
+            self.__sequence += 1
+            heapq.heappush(self.__heap, (event.time, -self.__sequence, event))
+
+    def pop(self):
+        if self.__window:
+            return self.__window.pop(0)
+        if self.__heap:
+            return heapq.heappop(self.__heap)[2]
+        return None
+
+    def peek_time(self):
+        # Start time of the next pending event, None if there is none
+        if self.__window:
+            return self.__window[0].time
+        if self.__heap:
+            return self.__heap[0][0]
+        return None
+
+    def lookahead(self, end_time):
+        # Pending events starting not later than end_time, in time order
+        while self.__heap and self.__heap[0][0] <= end_time:
+            self.__window.append(heapq.heappop(self.__heap)[2])
+        for event in self.__window:
+            if event.time > end_time:
+                break
+            yield event
+
+
+class ActiveTransmissions:
+    # Processed transmissions keyed by end time. Transmissions are expired once
+    # the simulation time passes their end, so the remaining ones are exactly
+    # the processed transmissions overlapping the current time. Expiring and
+    # querying costs O(log n + k) for k active transmissions.
+    def __init__(self):
+        self.__heap = []
+        self.__sequence = 0
+
+    def __len__(self):
+        return len(self.__heap)
+
+    def __iter__(self):
+        return (entry[2] for entry in self.__heap)
+
+    def add(self, event):
+        self.__sequence += 1
+        heapq.heappush(self.__heap, (event.time + event.duration, self.__sequence, event))
+
+    def expire(self, time):
+        # Remove and return transmissions that ended before time
+        expired = []
+        while self.__heap and self.__heap[0][0] < time:
+            expired.append(heapq.heappop(self.__heap)[2])
+        return expired
@@ -15,16 +15,59 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; If not, see <http://www.gnu.org/licenses/>.
 
-import bisect
 import math
+import time
+import random
+import pickle
+import array
 import logging
+import heapq
+import collections
 from sklearn.model_selection import train_test_split
+import numpy as np
+from scheduler import EventScheduler
+from scheduler import ActiveTransmissions
+from tracing import TraceVerdict
+from eventstore import EventStore
+from eventlog import ColumnarEventLogWriter
+from cache import atomic_write
+from cache import get_model_fingerprint
 from packet import PacketStatus
 from packet import PacketSf
-from packet import collision_snir
-from location import Location
-from node import Node
-from packet import Packet
+
+
+SIMULATION_ENGINES = ['event', 'incremental']
+
+PROFILE_PHASES = ['smart_sf_prediction', 'initial_scheduling', 'sensitivity', 'overlap_search', 'interference', 'statistics', 'scheduling', 'retirement']
+
+
+class SimulationProfile:
+    # Cumulative time of simulation phases and counters of the work done
+    def __init__(self):
+        self.phaseTime = {phase: 0.0 for phase in PROFILE_PHASES}
+        self.events = 0
+        self.gatewayChecks = 0  # gateways in range checked for sensitivity
+        self.overlapSearches = 0  # events received by a gateway, searched for overlaps
+        self.overlapCandidates = 0  # active and expired transmissions scanned
+        self.interferers = 0
+        self.interferenceChecks = 0  # interferer and receiving gateway pairs
+        self.predictorCalls = 0
+        self.predictedSamples = 0
+
+    def __repr__(self):
+        total_time = sum(self.phaseTime.values())
+        res = ' Phase times:\n'
+        for phase in PROFILE_PHASES:
+            res += '  {:<20} {:>9.3f} s {:>6.1f} %\n'.format(phase, self.phaseTime[phase], 100 * self.phaseTime[phase] / total_time if total_time > 0 else 0)
+        res += ' Counters:\n'
+        res += '  Events: {}\n'.format(self.events)
+        res += '  Gateway sensitivity checks per event: {:.3f}\n'.format(self.gatewayChecks / max(1, self.events))
+        res += '  Overlap searches: {}\n'.format(self.overlapSearches)
+        res += '  Overlap candidates scanned per search: {:.3f}\n'.format(self.overlapCandidates / max(1, self.overlapSearches))
+        res += '  Interferers per search: {:.3f}\n'.format(self.interferers / max(1, self.overlapSearches))
+        res += '  Interference checks per search: {:.3f}\n'.format(self.interferenceChecks / max(1, self.overlapSearches))
+        res += '  Predictor calls: {} ({} samples)'.format(self.predictorCalls, self.predictedSamples)
+        return res
 
 
 class SimulationResult:
@@ -36,6 +79,8 @@ class SimulationResult:
         self.pdr = 0
         self.throughput = 0
         self.txEnergyConsumption = 0
+        self.profile = None  # SimulationProfile of profiled runs
+        self.sfSwitchTime = None  # smart SF switch time of online learning runs
 
     def __repr__(self):
         res  = ' Number of packets: {}\n'.format(self.totalPacket)
@@ -45,6 +90,8 @@ class SimulationResult:
         res += ' PDR: {:.3f} %\n'.format(self.pdr)
         res += ' Network throughput: {:.3f} bps\n'.format(self.throughput)
         res += ' Total TX energy consumption: {:.3f} Joule'.format(self.txEnergyConsumption)
+        if self.sfSwitchTime is not None:
+            res += '\n Smart SF switch time: {:.3f} seconds'.format(self.sfSwitchTime)
         return res
 
     def __add__(self, other):
@@ -59,13 +106,100 @@ class SimulationResult:
         return sumResult
 
 
+def select_training_samples(node_index, sf, status, max_samples):
+    # Indices of at most max_samples random events of every (node, SF, status)
+    # group, in event order. Training set size is bounded by the number of
+    # nodes and statuses of a node and SF stay balanced.
+    group = (node_index.astype(np.int64) * 16 + sf) * 4 + status
+    order = np.random.permutation(len(group))
+    order = order[np.argsort(group[order], kind='stable')]
+    sorted_group = group[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_group, sorted_group, side='left')
+    return np.sort(order[rank < max_samples])
+
+
+# Features of smart SF training samples, labels are event statuses
+TRAINING_FEATURES = ['x', 'y', 'sf']
+
+
+def build_training_data(topology, source, sf, status, test_size=0.2, max_samples_per_node_sf=None):
+    # Features are node location and SF, see TRAINING_FEATURES
+    assert 0 <= test_size <= 1, 'invalid test size {}'.format(test_size)
+    node_index = np.asarray(source) - len(topology.gateway_list) - 1
+    sf = np.asarray(sf)
+    status = np.asarray(status)
+    if max_samples_per_node_sf is not None:
+        selected = select_training_samples(node_index, sf, status, max_samples_per_node_sf)
+        node_index, sf, status = node_index[selected], sf[selected], status[selected]
+
+    link_budget = topology.get_link_budget()
+    X = np.column_stack((link_budget.node_x[node_index], link_budget.node_y[node_index], sf))
+    y = status
+    if test_size == 0:
+        return X, X[:0], y, y[:0]
+    return train_test_split(X, y, test_size=test_size)
+
+
+class TrainingDataSink:
+    def __init__(self, topology):
+        self.topology = topology
+        self.source = array.array('i')
+        self.sf = array.array('b')
+        self.status = array.array('b')
+
+    def __call__(self, event):
+        self.source.append(event.source)
+        self.sf.append(event.sf.value)
+        self.status.append(event.status.value)
+
+    def get_training_data(self, test_size=0.2, max_samples_per_node_sf=None):
+        return build_training_data(self.topology, np.frombuffer(self.source, dtype=np.int32), np.frombuffer(self.sf, dtype=np.int8), np.frombuffer(self.status, dtype=np.int8), test_size=test_size, max_samples_per_node_sf=max_samples_per_node_sf)
+
+
+class EventLogSink:
+    def __init__(self, file):
+        self.file = file
+
+    def __call__(self, event):
+        self.file.write('{}\n'.format(event))
+
+    def __getstate__(self):
+        # Pickled with the file name and written length, lines written after
+        # that are discarded when it is unpickled
+        self.file.flush()
+        return {'fileName': self.file.name, 'position': self.file.tell()}
+
+    def __setstate__(self, state):
+        self.file = open(state['fileName'], 'r+')
+        self.file.seek(state['position'])
+        self.file.truncate()
+
+
 class Simulation:
-    def __init__(self, topology, packet_rate, packet_size, simulation_duration, sf, sfPredictor=None):
+    def __init__(self, topology, packet_rate, packet_size, simulation_duration, sf, sfPredictor=None, streaming=False, sinks=None, trace=None, phy=None, profile=False, engine='event', checkpoint=None, checkpoint_interval=300, traffic=None, learner=None):
         assert 0.0001 <= packet_rate <= 10, 'unsupported packet rate {}'.format(packet_rate)
         assert 51 <= packet_size <= 222, 'unsupported packet size {}'.format(packet_size)
         assert 10 <= simulation_duration <= 100000, 'unsupported simulation duration {}'.format(simulation_duration)
-
-        self.eventQueue = []
+        assert streaming or not sinks, 'sinks are supported in streaming mode'
+        assert engine in SIMULATION_ENGINES, 'unsupported engine {}'.format(engine)
+        assert checkpoint is None or engine == 'event', 'checkpoints are supported by the event engine'
+        assert traffic is None or (traffic.numberOfNodes == len(topology.node_list) and traffic.packetRate == packet_rate and traffic.simulationDuration >= simulation_duration), 'unsupported traffic trace {}'.format(traffic)
+        assert learner is None or (sf == PacketSf.SF_Smart and engine == 'event'), 'online learning is supported for SF_Smart by the event engine'
+
+        # Processed events in time order, kept in an array backed event store.
+        # In streaming mode events are retired from the head of the queue to
+        # the sinks once they can not overlap any future transmission, so
+        # memory is bounded by concurrent transmissions. Event chunks of
+        # checkpointed runs are written once next to the checkpoint file
+        # instead of being pickled with every checkpoint.
+        self.eventQueue = collections.deque() if streaming else EventStore(phy=phy if phy is not None else topology.phy, directory=checkpoint + '.events' if checkpoint is not None else None)
+        self.streaming = streaming
+        self.sinks = sinks if sinks is not None else []
+        self.retiredEvents = 0
+        self.trace = trace  # optional TraceRecorder
+        self.scheduledEvents = 0
+        self.scheduler = EventScheduler()  # pending events
+        self.activeTransmissions = ActiveTransmissions()  # processed events not ended yet
         self.topology = topology
         self.packetRate = packet_rate
         self.packetSize = packet_size
@@ -73,11 +207,58 @@ class Simulation:
         self.simulationResult = SimulationResult()
         self.sf = sf
         self.sfPredictor = sfPredictor
-        Node.idCounter = 0
+        self.phy = phy if phy is not None else topology.phy
+        self.profile = profile  # record phase times and counters in simulationResult.profile
+        self.engine = engine
+        # Complete state is saved to the checkpoint file every
+        # checkpoint_interval seconds of wall clock time, a run continues from
+        # it after load_checkpoint with identical results
+        self.checkpointFile = checkpoint
+        self.checkpointInterval = checkpoint_interval
+        self.runState = None  # loop state of a checkpointed run
+        self.savedCheckpoints = 0
+        # Optional TrafficTrace, intervals of nodes are taken from it
+        self.traffic = traffic
+        self.trafficGaps = None
+        self.trafficCursor = None  # index of the next gap of every node
+        self.trafficEnd = None
+        # Optional OnlineSfLearner, SF_Smart model is trained during the run
+        # instead of by sfPredictor
+        self.learner = learner
 
     def __add_to_event_queue(self, packet):
         if packet is not None:
-            bisect.insort_left(self.eventQueue, packet)
+            packet.id = self.scheduledEvents
+            self.scheduledEvents += 1
+        self.scheduler.push(packet)
+
+    def __save_checkpoint(self, run_state):
+        self.runState = run_state
+        self.savedCheckpoints += 1
+        state = {'simulation': self, 'random': random.getstate(), 'numpy_random': np.random.get_state()}
+        atomic_write(self.checkpointFile, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+        self.runState = None
+        logging.info('Checkpoint saved to {} at {:.3f} s'.format(self.checkpointFile, run_state['time']))
+
+    @staticmethod
+    def load_checkpoint(file_name):
+        # Restores a checkpointed simulation and the random number generators,
+        # run continues from the checkpoint
+        with open(file_name, 'rb') as file:
+            state = pickle.load(file)
+        random.setstate(state['random'])
+        np.random.set_state(state['numpy_random'])
+        return state['simulation']
+
+    def __schedule_tx(self, tx_node):
+        sf = self.__get_sf(tx_node)
+        interval = None
+        if self.traffic is not None:
+            node_index = self.topology.get_node_index(tx_node.id)
+            gap_index = self.trafficCursor[node_index]
+            interval = self.trafficGaps[gap_index] if gap_index < self.trafficEnd[node_index] else math.inf
+            self.trafficCursor[node_index] = gap_index + 1
+        self.__add_to_event_queue(tx_node.schedule_tx(packet_rate=self.packetRate, packet_size=self.packetSize, simulation_duration=self.simulationDuration, sf=sf, phy=self.phy, interval=interval))
 
     def show_events(self):
         print('Events:')
@@ -92,194 +273,333 @@ class Simulation:
         print('Results:')
         print('{}'.format(self.simulationResult))
 
-    def get_training_data(self, test_size=0.2):
-        assert 0 <= test_size <= 1, 'invalid test size {}'.format(test_size)
-
-        X = []
-        y = []
-        for event in self.eventQueue:
-            tx_node = self.topology.get_node(event.source)
-            X.append([tx_node.location.x, tx_node.location.y, event.sf.value])
-            y.append(event.status.value)
-        return train_test_split(X, y, test_size=test_size)
-
-    def write_to_file(self, file_name):
+    def get_training_data(self, test_size=0.2, max_samples_per_node_sf=None):
+        assert not self.streaming, 'events are not kept in streaming mode, use TrainingDataSink'
+        return build_training_data(self.topology, self.eventQueue.get_column('source'), self.eventQueue.get_column('sf'), self.eventQueue.get_column('status'), test_size=test_size, max_samples_per_node_sf=max_samples_per_node_sf)
+
+    def write_to_file(self, file_name, format='text'):
+        # Text dump or a columnar event log directory, see ColumnarEventLogWriter
+        assert not self.streaming, 'events are not kept in streaming mode, use EventLogSink or ColumnarEventLogWriter'
+        assert format in ['text', 'columnar'], 'unsupported event log format {}'.format(format)
+        if format == 'columnar':
+            writer = ColumnarEventLogWriter(file_name)
+            writer.write_header(self)
+            writer.write_events(self.eventQueue)
+            writer.write_results(self.simulationResult)
+            return
         with open(file_name, 'w') as file:
-            file.write('Parameters:\n')
-            file.write('Topology radius: {} meters\n'.format(self.topology.radius))
-            file.write('Number of gateways: {}\n'.format(len(self.topology.gateway_list)))
-            file.write('Number of nodes: {}\n'.format(len(self.topology.node_list)))
-            file.write('SF assignment method: {}\n'.format(self.sf))
-            file.write('Simulation duration: {} seconds\n'.format(self.simulationDuration))
-            file.write('Packet rate: {} packet per second\n'.format(self.packetRate))
-            file.write('Packet size: {} bytes\n'.format(self.packetSize))
-
-            file.write('\nNodes:\n')
-            for gateway in self.topology.gateway_list:
-                file.write('{}\n'.format(gateway))
-            for node in self.topology.node_list:
-                file.write('{}\n'.format(node))
-
-            file.write('\nEvents:\n')
+            self.write_header_to_file(file)
             for event in self.eventQueue:
                 file.write('{}\n'.format(event))
-
-            file.write('\nResults:\n')
-            file.write('{}\n'.format(self.simulationResult))
-
-            # for event in self.eventQueue:
-            #     tx_node = self.topology.get_node(event.source)
-            #     file.write('{},{},{},{}\n'.format(tx_node.location.x, tx_node.location.x, event.sf.name, event.status.name))
+            self.write_results_to_file(file)
+
+    def get_parameters(self):
+        return {
+            'radius': self.topology.radius,
+            'number_of_gateways': len(self.topology.gateway_list),
+            'number_of_nodes': len(self.topology.node_list),
+            'sf': self.sf.name,
+            'simulation_duration': self.simulationDuration,
+            'packet_rate': self.packetRate,
+            'packet_size': self.packetSize,
+        }
+
+    def write_header_to_file(self, file):
+        file.write('Parameters:\n')
+        file.write('Topology radius: {} meters\n'.format(self.topology.radius))
+        file.write('Number of gateways: {}\n'.format(len(self.topology.gateway_list)))
+        file.write('Number of nodes: {}\n'.format(len(self.topology.node_list)))
+        file.write('SF assignment method: {}\n'.format(self.sf))
+        file.write('Simulation duration: {} seconds\n'.format(self.simulationDuration))
+        file.write('Packet rate: {} packet per second\n'.format(self.packetRate))
+        file.write('Packet size: {} bytes\n'.format(self.packetSize))
+
+        file.write('\nNodes:\n')
+        for gateway in self.topology.gateway_list:
+            file.write('{}\n'.format(gateway))
+        for node in self.topology.node_list:
+            file.write('{}\n'.format(node))
+
+        file.write('\nEvents:\n')
+
+    def write_results_to_file(self, file):
+        file.write('\nResults:\n')
+        file.write('{}\n'.format(self.simulationResult))
+
+        # for event in self.eventQueue:
+        #     tx_node = self.topology.get_node(event.source)
+        #     file.write('{},{},{},{}\n'.format(tx_node.location.x, tx_node.location.x, event.sf.name, event.status.name))
 
     def __get_sf(self, tx_node):
         if self.sf == PacketSf.SF_Lowest:
             return tx_node.lowestSf
         elif self.sf == PacketSf.SF_Smart:
-            # Xnew = [[tx_node.location.x, tx_node.location.y, tx_node.lowestSf.value]]
-            # ynew = self.sfPredictor(Xnew)[0]
-            # if ynew == PacketStatus.interfered.value and tx_node.lowestSf.value < 12:
-            #     return PacketSf(tx_node.lowestSf.value + 1)
-            # else:
-            #     return tx_node.lowestSf
-            for sf_pred in range(tx_node.lowestSf.value, 12+1):
-                Xnew = [[tx_node.location.x, tx_node.location.y, sf_pred]]
-                ynew = self.sfPredictor(Xnew)[0]
-                logging.debug('sf_pred={},tx_node.lowestSf={},ynew={}'.format(sf_pred, tx_node.lowestSf, ynew))
-                if ynew == PacketStatus.transmitted.value:
-                    return PacketSf(sf_pred)
-            logging.info('Suitable SF not found')
-            return tx_node.lowestSf
+            # Random until the switch of online learning runs
+            return tx_node.predictedSf if tx_node.predictedSf is not None else PacketSf.get_random()
         elif self.sf == PacketSf.SF_Random:
             return PacketSf.get_random()
         else:
             return self.sf
 
-    def run(self):
-        # Schedule initial node transmissions
+    def __get_smart_sf_list(self, predictor, profile=None):
+        # Lowest SF of every node predicted to be transmitted, with a single
+        # batched prediction
+        Xnew = []
+        for tx_node in self.topology.node_list:
+            for sf_pred in range(tx_node.lowestSf.value, 12+1):
+                Xnew.append([tx_node.location.x, tx_node.location.y, sf_pred])
+        ynew = predictor(Xnew).tolist() if len(Xnew) > 0 else []
+        if profile is not None and len(Xnew) > 0:
+            profile.predictorCalls += 1
+            profile.predictedSamples += len(Xnew)
+
+        log_debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        predicted_sf_list = []
+        prediction_index = 0
         for tx_node in self.topology.node_list:
-            tx_node.txList = []
-            sf = self.__get_sf(tx_node)
-            self.__add_to_event_queue(tx_node.schedule_tx(packet_rate=self.packetRate, packet_size=self.packetSize, simulation_duration=self.simulationDuration, sf=sf))
+            predicted_sf = None
+            for sf_pred in range(tx_node.lowestSf.value, 12+1):
+                if log_debug:
+                    logging.debug('sf_pred={},tx_node.lowestSf={},ynew={}'.format(sf_pred, tx_node.lowestSf, ynew[prediction_index]))
+                if predicted_sf is None and ynew[prediction_index] == PacketStatus.transmitted.value:
+                    predicted_sf = PacketSf(sf_pred)
+                prediction_index += 1
+            if predicted_sf is None:
+                logging.info('Suitable SF not found')
+                predicted_sf = tx_node.lowestSf
+            predicted_sf_list.append(predicted_sf)
+        return predicted_sf_list
+
+    def __predict_smart_sf(self, profile=None):
+        # Node locations are fixed, so smart SF of every node is decided once
+        # and cached in the topology for the simulations sharing the same
+        # topology and model. Cache is keyed by the model fingerprint, so a
+        # model refit in place is predicted again.
+        try:
+            key = get_model_fingerprint(self.sfPredictor)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            key = self.sfPredictor
+        if len(self.topology.predictedSfCache.get(key, [])) != len(self.topology.node_list):
+            self.topology.predictedSfCache[key] = self.__get_smart_sf_list(self.sfPredictor, profile)
+
+        for tx_node, predicted_sf in zip(self.topology.node_list, self.topology.predictedSfCache[key]):
+            tx_node.predictedSf = predicted_sf
+
+    def __switch_to_smart_sf(self, time, profile=None):
+        # Online learning model is not cached, it changes with every run
+        for tx_node, predicted_sf in zip(self.topology.node_list, self.__get_smart_sf_list(self.learner.predict, profile)):
+            tx_node.predictedSf = predicted_sf
+        self.simulationResult.sfSwitchTime = time
+        logging.info('Switched to smart SF at {:.3f} s {}'.format(time, self.learner))
 
-        for event_index, event in enumerate(self.eventQueue):
+    def run(self):
+        # Profiling adds a clock read per phase to the loop, phase times are
+        # accumulated in locals and stored at the end
+        profile = SimulationProfile() if self.profile else None
+        clock = time.perf_counter
+        if profile is not None:
+            t0 = clock()
+        run_state = self.runState
+        if run_state is None:
+            if self.learner is not None:
+                link_budget = self.topology.get_link_budget(self.phy)
+                self.learner.reset(link_budget.node_x, link_budget.node_y)
+                for tx_node in self.topology.node_list:
+                    tx_node.predictedSf = None
+            elif self.sf == PacketSf.SF_Smart:
+                self.__predict_smart_sf(profile)
+            if profile is not None:
+                t1 = clock()
+                profile.phaseTime['smart_sf_prediction'] += t1 - t0
+                t0 = t1
+
+            # Schedule initial node transmissions
+            if self.traffic is not None:
+                self.trafficGaps = self.traffic.gaps.tolist()
+                self.trafficCursor = self.traffic.offsets[:-1].tolist()
+                self.trafficEnd = self.traffic.offsets[1:].tolist()
+            for tx_node in self.topology.node_list:
+                tx_node.lastTx = None
+                self.__schedule_tx(tx_node)
+
+            if profile is not None:
+                profile.phaseTime['initial_scheduling'] += clock() - t0
+        self.runState = None
+        if self.engine == 'incremental':
+            return self.__run_incremental(profile)
+        sensitivity_time = overlap_search_time = interference_time = statistics_time = scheduling_time = retirement_time = 0.0
+
+        # Longest possible airtime, a transmission started earlier than this
+        # window can not overlap any future transmission
+        retire_window = self.phy.get_airtime(PacketSf.SF_12, self.packetSize)
+        cumulativeSuccessfulDataSize = 0 if run_state is None else run_state['successful_data_size']
+        cumulativeDataDuration = 0 if run_state is None else run_state['data_duration']
+        checkpoint_file = self.checkpointFile
+        next_checkpoint_time = clock() + self.checkpointInterval
+
+        # Node and gateway locations are fixed during the run, so link budgets
+        # are looked up from the topology. Only gateways in range of a node are
+        # considered, received power of interferers out of range of a gateway
+        # is computed when first needed.
+        link_budget = self.topology.get_link_budget(self.phy)
+        audible_gws = [gws.tolist() for gws in link_budget.audibleGateways]
+        audible_rx_power_dbm = [rx_power_dbm.tolist() for rx_power_dbm in link_budget.audibleRxPowerDbm]
+        audible_rx_power_w = [dict(zip(gws, rx_power_w.tolist())) for gws, rx_power_w in zip(audible_gws, link_budget.audibleRxPowerW)]
+        gateway_list = self.topology.gateway_list
+        rx_sensitivity_dbm_table = {sf: self.phy.get_sensitivity(sf) for sf in PacketSf if sf.value >= 7}
+        snir_threshold_table = self.phy.snirThreshold
+
+        # Log messages are formatted only if their level is enabled
+        log_info = logging.getLogger().isEnabledFor(logging.INFO)
+        log_debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        trace = self.trace
+        learner = self.learner
+
+        while True:
+            if profile is not None:
+                t0 = clock()
+            event = self.scheduler.pop()
+            if event is None:
+                break
+            if self.streaming:
+                self.eventQueue.append(event)
+            expired = self.activeTransmissions.expire(event.time)
+            if profile is not None:
+                t1 = clock()
+                scheduling_time += t1 - t0
+                t0 = t1
             tx_node = self.topology.get_node(event.source)
+            tx_node_index = self.topology.get_node_index(event.source)
 
             rx_gw_list = []
             # Check which gateways can receive
-            for gw in self.topology.gateway_list:
-                distance_to_gw = Location.get_distance(tx_node.location, gw.location)
-                rx_sensitivity_dbm = Packet.get_receive_sensitivity(event.sf)
-                propagation_loss_dbm = Packet.calculate_propagation_loss(distance_to_gw)
-                rx_signal_dbm = event.tx_power_dbm - propagation_loss_dbm
+            rx_sensitivity_dbm = rx_sensitivity_dbm_table[event.sf]
+            for gw_index, rx_signal_dbm in zip(audible_gws[tx_node_index], audible_rx_power_dbm[tx_node_index]):
+                gw = gateway_list[gw_index]
                 if rx_signal_dbm < rx_sensitivity_dbm:
-                    logging.info('Under sensitivity ({} - {:.3f}) < {} for {} at gw {}'.format(event.tx_power_dbm, propagation_loss_dbm, rx_sensitivity_dbm, event, gw.id))
-                    pass
+                    if log_info:
+                        logging.info('Under sensitivity ({} - {:.3f}) < {} for {} at gw {}'.format(event.tx_power_dbm, event.tx_power_dbm - rx_signal_dbm, rx_sensitivity_dbm, event, gw.id))
+                    if trace is not None:
+                        trace.record(event.id, gw.id, -1, 0, math.nan, math.nan, TraceVerdict.under_sensitivity.value)
                 else:
-                    rx_gw_list.append([gw, rx_signal_dbm])
+                    rx_gw_list.append([gw, rx_signal_dbm, gw_index])
+            if profile is not None:
+                t1 = clock()
+                sensitivity_time += t1 - t0
+                t0 = t1
+                profile.gatewayChecks += len(audible_gws[tx_node_index])
 
             if len(rx_gw_list) == 0:
                 # No gateway received the packet
-                logging.info('lost due to under sensitivity {}'.format(event))
+                if log_info:
+                    logging.info('lost due to under sensitivity {}'.format(event))
                 event.status = PacketStatus.under_sensitivity
             else:
                 # Check overlapping events
-                overlapping_events = []
-                for previous_event_index in range(event_index - 1, 0, -1):
-                    previous_event = self.eventQueue[previous_event_index]
-                    if (previous_event.time + previous_event.duration) < event.time:
-                        break
-                    # Events are overlapping
-                    overlapping_events.append(previous_event)
-                    logging.info('previous {} and {} are overlapping for {:.3f} s'.format(previous_event, event, previous_event.time + previous_event.duration - event.time))
-
-                for next_event_index in range(event_index + 1, len(self.eventQueue)):
-                    next_event = self.eventQueue[next_event_index]
-                    if (event.time + event.duration) < next_event.time:
-                        break
-                    # Events are overlapping
-                    overlapping_events.append(next_event)
-                    logging.info('next {} and {} are overlapping for {:.3f} s'.format(next_event, event, event.time + event.duration - next_event.time))
+                overlapping_events = list(self.activeTransmissions)
+                overlapping_events.extend(self.scheduler.lookahead(event.time + event.duration))
+                if profile is not None:
+                    t1 = clock()
+                    overlap_search_time += t1 - t0
+                    t0 = t1
+                    profile.overlapSearches += 1
+                    profile.overlapCandidates += len(expired) + len(overlapping_events)
+                    profile.interferers += len(overlapping_events)
+                    profile.interferenceChecks += len(overlapping_events) * len(rx_gw_list)
+                if log_info:
+                    for interferer_event in overlapping_events:
+                        logging.info('{} {} and {} are overlapping for {:.3f} s'.format('previous' if interferer_event.time < event.time else 'next', interferer_event, event, min(event.time + event.duration, interferer_event.time + interferer_event.duration) - max(event.time, interferer_event.time)))
 
                 if len(overlapping_events) > 0:
                     # Check interference at gateways
                     for rx_gw_index in range(len(rx_gw_list)):
                         rx_gw = rx_gw_list[rx_gw_index][0]
                         rx_signal_dbm = rx_gw_list[rx_gw_index][1]
+                        gw_index = rx_gw_list[rx_gw_index][2]
                         cumulative_interference_energy_j = [0] * 6
-                        rx_signal_energy_j = Packet.calculate_energy(rx_signal_dbm, event.duration)
-                        logging.debug('event_node={},'
-                              'event_sf={},'
-                              'rx_gw={},'
-                              'rx_signal_dbm={},'
-                              'rx_signal_energy_j={}'.format(
-                            event.source,
-                            event.sf.value,
-                            rx_gw.id,
-                            rx_signal_dbm,
-                            rx_signal_energy_j))
+                        rx_signal_energy_j = audible_rx_power_w[tx_node_index][gw_index] * event.duration
+                        if log_debug:
+                            logging.debug('event_node={},'
+                                  'event_sf={},'
+                                  'rx_gw={},'
+                                  'rx_signal_dbm={},'
+                                  'rx_signal_energy_j={}'.format(
+                                event.source,
+                                event.sf.value,
+                                rx_gw.id,
+                                rx_signal_dbm,
+                                rx_signal_energy_j))
 
                         for interferer_event in overlapping_events:
-                            if event.time > interferer_event.time:
-                                # Overlap with previous event
-                                overlap_duration = interferer_event.time + interferer_event.duration - event.time
-                            else:
-                                # Overlap with next event
-                                overlap_duration = event.time + event.duration - interferer_event.time
-                            interferer_node = self.topology.get_node(interferer_event.source)
-                            interferer_to_gw_distance = Location.get_distance(rx_gw.location, interferer_node.location)
-                            interferer_propagation_loss = Packet.calculate_propagation_loss(interferer_to_gw_distance)
-                            interferer_power_dbm = interferer_event.tx_power_dbm - interferer_propagation_loss
-                            interference_energy_j = Packet.calculate_energy(interferer_power_dbm, overlap_duration)
-
-                            logging.debug('interferer_node={},'
-                                  'interferer_sf={},'
-                                  'interferer_gw_distance={:.3f},'
-                                  'interferer_propagation_loss={:.3f},'
-                                  'overlap_duration={:.3f},'
-                                  'interferer_power_dbm={:.3f},'
-                                  'interference_energy_j={}'.format(
-                                interferer_event.source,
-                                interferer_event.sf.value,
-                                interferer_to_gw_distance,
-                                interferer_propagation_loss,
-                                overlap_duration,
-                                interferer_power_dbm,
-                                interference_energy_j))
+                            overlap_duration = min(event.time + event.duration, interferer_event.time + interferer_event.duration) - max(event.time, interferer_event.time)
+                            interferer_node_index = self.topology.get_node_index(interferer_event.source)
+                            interferer_rx_power_w = audible_rx_power_w[interferer_node_index].get(gw_index)
+                            if interferer_rx_power_w is None:
+                                interferer_rx_power_w = link_budget.get_rx_power_w(interferer_node_index, gw_index)
+                                audible_rx_power_w[interferer_node_index][gw_index] = interferer_rx_power_w
+                            interference_energy_j = interferer_rx_power_w * overlap_duration
+
+                            if log_debug:
+                                logging.debug('interferer_node={},'
+                                      'interferer_sf={},'
+                                      'interferer_gw_distance={:.3f},'
+                                      'interferer_propagation_loss={:.3f},'
+                                      'overlap_duration={:.3f},'
+                                      'interferer_power_dbm={:.3f},'
+                                      'interference_energy_j={}'.format(
+                                    interferer_event.source,
+                                    interferer_event.sf.value,
+                                    link_budget.get_distance(interferer_node_index, gw_index),
+                                    event.tx_power_dbm - 10 * math.log10(interferer_rx_power_w * 1000),
+                                    overlap_duration,
+                                    10 * math.log10(interferer_rx_power_w * 1000),
+                                    interference_energy_j))
+
+                            if trace is not None:
+                                trace.record(event.id, rx_gw.id, interferer_event.id, interferer_event.sf.value, overlap_duration, math.nan, TraceVerdict.overlapping.value)
 
                             cumulative_interference_energy_j[interferer_event.sf.value - 7] += interference_energy_j
 
                         for sf_index in range(len(cumulative_interference_energy_j)):
                             if cumulative_interference_energy_j[sf_index] != 0:
-                                logging.debug('Cumulative interference energy={} for sf={} at gw={}'.format(cumulative_interference_energy_j[sf_index], sf_index + 7, rx_gw.id))
-                                snir_isolation = collision_snir[event.sf.value-7][sf_index]
-                                logging.debug('needed isolation to survive={}'.format(snir_isolation))
+                                snir_isolation = snir_threshold_table[event.sf.value][sf_index + 7]
                                 snir = 10 * math.log10( rx_signal_energy_j / cumulative_interference_energy_j[sf_index])
-                                logging.debug('snir={}'.format(snir))
+                                if log_debug:
+                                    logging.debug('Cumulative interference energy={} for sf={} at gw={}'.format(cumulative_interference_energy_j[sf_index], sf_index + 7, rx_gw.id))
+                                    logging.debug('needed isolation to survive={}'.format(snir_isolation))
+                                    logging.debug('snir={}'.format(snir))
                                 if snir >= snir_isolation:
-                                    logging.info('survived {} from interference at gw={}'.format(event, rx_gw.id))
-                                    pass
+                                    if log_info:
+                                        logging.info('survived {} from interference at gw={}'.format(event, rx_gw.id))
+                                    if trace is not None:
+                                        trace.record(event.id, rx_gw.id, -1, sf_index + 7, math.nan, snir, TraceVerdict.survived.value)
                                 else:
-                                    logging.info('interfered {} at gw={}'.format(event, rx_gw.id))
+                                    if log_info:
+                                        logging.info('interfered {} at gw={}'.format(event, rx_gw.id))
+                                    if trace is not None:
+                                        trace.record(event.id, rx_gw.id, -1, sf_index + 7, math.nan, snir, TraceVerdict.interfered.value)
                                     rx_gw_list[rx_gw_index] = None
 
                 if all(rx_gw is None for rx_gw in rx_gw_list):
-                    logging.info('lost due to interference {}'.format(event))
+                    if log_info:
+                        logging.info('lost due to interference {}'.format(event))
                     event.status = PacketStatus.interfered
 
             # If packet is not interfered or under sensitivity, then transmitted
             if event.status == PacketStatus.pending:
                 event.status = PacketStatus.transmitted
 
-            logging.info('Event simulated {}'.format(event))
-
-            # Schedule next event for this node
-            sf = self.__get_sf(tx_node)
-            self.__add_to_event_queue(tx_node.schedule_tx(packet_rate=self.packetRate, packet_size=self.packetSize, simulation_duration=self.simulationDuration, sf=sf))
-
-        # Collect statistics
-        cumulativeSuccessfulDataSize = 0
-        cumulativeDataDuration = 0
-        for event in self.eventQueue:
+            if log_info:
+                logging.info('Event simulated {}'.format(event))
+            self.activeTransmissions.add(event)
+            if not self.streaming:
+                self.eventQueue.append(event)
+            if profile is not None:
+                t1 = clock()
+                interference_time += t1 - t0
+                t0 = t1
+
+            # Collect statistics
             self.simulationResult.txEnergyConsumption += event.tx_energy_j
             self.simulationResult.totalPacket += 1
             cumulativeDataDuration += event.duration
@@ -290,6 +610,211 @@ class Simulation:
             elif event.status == PacketStatus.transmitted:
                 self.simulationResult.successfulPacket += 1
                 cumulativeSuccessfulDataSize += event.size
+            # Training samples of online learning until the switch
+            if learner is not None and learner.switchTime is None:
+                learner.add(tx_node_index, event.sf.value, event.status.value)
+                if event.time >= learner.nextFitTime and learner.fit(event.time):
+                    self.__switch_to_smart_sf(event.time, profile)
+            if profile is not None:
+                t1 = clock()
+                statistics_time += t1 - t0
+                t0 = t1
+
+            # Schedule next event for this node
+            self.__schedule_tx(tx_node)
+            if profile is not None:
+                t1 = clock()
+                scheduling_time += t1 - t0
+                t0 = t1
+
+            if self.streaming:
+                while self.eventQueue[0].time + retire_window < event.time:
+                    self.__retire(self.eventQueue.popleft())
+                if profile is not None:
+                    retirement_time += clock() - t0
+
+            # State is consistent between events, so checkpoints are saved here
+            if checkpoint_file is not None and clock() >= next_checkpoint_time:
+                self.__save_checkpoint({'time': event.time, 'successful_data_size': cumulativeSuccessfulDataSize, 'data_duration': cumulativeDataDuration})
+                next_checkpoint_time = clock() + self.checkpointInterval
+
+        if profile is not None:
+            t0 = clock()
+        while self.streaming and self.eventQueue:
+            self.__retire(self.eventQueue.popleft())
+        if profile is not None:
+            retirement_time += clock() - t0
+            profile.phaseTime['sensitivity'] += sensitivity_time
+            profile.phaseTime['overlap_search'] += overlap_search_time
+            profile.phaseTime['interference'] += interference_time
+            profile.phaseTime['statistics'] += statistics_time
+            profile.phaseTime['scheduling'] += scheduling_time
+            profile.phaseTime['retirement'] += retirement_time
+            profile.events = self.simulationResult.totalPacket
+            self.simulationResult.profile = profile
+
         self.simulationResult.pdr = 100 * float(self.simulationResult.successfulPacket) / self.simulationResult.totalPacket
         self.simulationResult.throughput = 8 * float(cumulativeSuccessfulDataSize) / cumulativeDataDuration
         return self.simulationResult
+
+    def __run_incremental(self, profile):
+        # Interference is kept in running received power sums per gateway and
+        # interferer SF, which are integrated to energy over time as
+        # transmissions start and end. Energy of every interferer SF an event
+        # receives at a gateway is the integral difference between its end and
+        # start, less its own energy, so the cost per event is O(G) array
+        # updates instead of O(k * G) for k overlapping transmissions. Status
+        # of an event is decided when its transmission ends.
+        clock = time.perf_counter
+        sensitivity_time = interference_time = statistics_time = scheduling_time = retirement_time = 0.0
+        cumulativeSuccessfulDataSize = 0
+        cumulativeDataDuration = 0
+
+        link_budget = self.topology.get_link_budget(self.phy)
+        rx_power_w_matrix = link_budget.rx_power_w
+        audible_gws = [gws.tolist() for gws in link_budget.audibleGateways]
+        audible_rx_power_dbm = [rx_power_dbm.tolist() for rx_power_dbm in link_budget.audibleRxPowerDbm]
+        rx_sensitivity_dbm_table = {sf: self.phy.get_sensitivity(sf) for sf in PacketSf if sf.value >= 7}
+        snir_threshold_table = self.phy.snirThresholdArray[7:, 7:]
+        gateway_list = self.topology.gateway_list
+        log_info = logging.getLogger().isEnabledFor(logging.INFO)
+        trace = self.trace
+
+        power_w = np.zeros((len(gateway_list), 6))  # received power of active transmissions
+        energy_j = np.zeros((len(gateway_list), 6))  # integral of power_w since the channel was last idle
+        last_time = 0.0
+        active = 0
+        ending = []  # (end time, sequence, event, receiving gateways, energy at start)
+        sequence = 0
+        undecided = collections.deque()  # started events in time order
+
+        while True:
+            next_start = self.scheduler.peek_time()
+            if ending and (next_start is None or ending[0][0] <= next_start):
+                # A transmission ends, its status is decided
+                if profile is not None:
+                    t0 = clock()
+                end_time, _, event, rx_gws, start_energy_j = heapq.heappop(ending)
+                energy_j += power_w * (end_time - last_time)
+                last_time = end_time
+                sf_index = event.sf.value - 7
+                if rx_gws:
+                    interference_j = energy_j[rx_gws] - start_energy_j
+                    signal_energy_j = rx_power_w_matrix[event.source - len(gateway_list) - 1, rx_gws] * event.duration
+                    interference_j[:, sf_index] -= signal_energy_j
+                    # Residuals of own energy far below any SNIR threshold are ignored
+                    interfering = interference_j > signal_energy_j[:, None] * 1e-9
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        snir = 10 * np.log10(signal_energy_j[:, None] / interference_j)
+                    survived = snir >= snir_threshold_table[sf_index]
+                    if trace is not None:
+                        for row, sf_column in zip(*np.nonzero(interfering)):
+                            trace.record(event.id, gateway_list[rx_gws[row]].id, -1, sf_column + 7, math.nan, snir[row, sf_column], (TraceVerdict.survived if survived[row, sf_column] else TraceVerdict.interfered).value)
+                    if (interfering & ~survived).any(axis=1).all():
+                        if log_info:
+                            logging.info('lost due to interference {}'.format(event))
+                        event.status = PacketStatus.interfered
+                    else:
+                        event.status = PacketStatus.transmitted
+                else:
+                    if log_info:
+                        logging.info('lost due to under sensitivity {}'.format(event))
+                    event.status = PacketStatus.under_sensitivity
+
+                power_w[:, sf_index] -= rx_power_w_matrix[event.source - len(gateway_list) - 1]
+                active -= 1
+                if active == 0:
+                    # Rounding residuals are cleared when the channel is idle,
+                    # and energy is integrated from a new origin as no start
+                    # energy refers to the old one
+                    power_w[:] = 0
+                    energy_j[:] = 0
+                if profile is not None:
+                    t1 = clock()
+                    interference_time += t1 - t0
+                    t0 = t1
+
+                self.simulationResult.txEnergyConsumption += event.tx_energy_j
+                self.simulationResult.totalPacket += 1
+                cumulativeDataDuration += event.duration
+                if event.status == PacketStatus.under_sensitivity:
+                    self.simulationResult.underSensitivityPacket += 1
+                elif event.status == PacketStatus.interfered:
+                    self.simulationResult.interferencePacket += 1
+                elif event.status == PacketStatus.transmitted:
+                    self.simulationResult.successfulPacket += 1
+                    cumulativeSuccessfulDataSize += event.size
+                if log_info:
+                    logging.info('Event simulated {}'.format(event))
+                if profile is not None:
+                    t1 = clock()
+                    statistics_time += t1 - t0
+                    t0 = t1
+
+                # Decided events are kept or retired in start time order
+                while undecided and undecided[0].status != PacketStatus.pending:
+                    if self.streaming:
+                        self.__retire(undecided.popleft())
+                    else:
+                        self.eventQueue.append(undecided.popleft())
+                if profile is not None:
+                    retirement_time += clock() - t0
+
+            elif next_start is not None:
+                # A transmission starts
+                if profile is not None:
+                    t0 = clock()
+                event = self.scheduler.pop()
+                energy_j += power_w * (event.time - last_time)
+                last_time = event.time
+                tx_node = self.topology.get_node(event.source)
+                tx_node_index = self.topology.get_node_index(event.source)
+
+                rx_sensitivity_dbm = rx_sensitivity_dbm_table[event.sf]
+                rx_gws = []
+                for gw_index, rx_signal_dbm in zip(audible_gws[tx_node_index], audible_rx_power_dbm[tx_node_index]):
+                    if rx_signal_dbm < rx_sensitivity_dbm:
+                        if trace is not None:
+                            trace.record(event.id, gateway_list[gw_index].id, -1, 0, math.nan, math.nan, TraceVerdict.under_sensitivity.value)
+                    else:
+                        rx_gws.append(gw_index)
+                if profile is not None:
+                    t1 = clock()
+                    sensitivity_time += t1 - t0
+                    t0 = t1
+                    profile.gatewayChecks += len(audible_gws[tx_node_index])
+
+                power_w[:, event.sf.value - 7] += rx_power_w_matrix[tx_node_index]
+                active += 1
+                sequence += 1
+                heapq.heappush(ending, (event.time + event.duration, sequence, event, rx_gws, energy_j[rx_gws]))
+                undecided.append(event)
+                if profile is not None:
+                    t1 = clock()
+                    interference_time += t1 - t0
+                    t0 = t1
+
+                # Schedule next event for this node
+                self.__schedule_tx(tx_node)
+                if profile is not None:
+                    scheduling_time += clock() - t0
+            else:
+                break
+
+        if profile is not None:
+            profile.phaseTime['sensitivity'] += sensitivity_time
+            profile.phaseTime['interference'] += interference_time
+            profile.phaseTime['statistics'] += statistics_time
+            profile.phaseTime['scheduling'] += scheduling_time
+            profile.phaseTime['retirement'] += retirement_time
+            profile.events = self.simulationResult.totalPacket
+            self.simulationResult.profile = profile
+
+        self.simulationResult.pdr = 100 * float(self.simulationResult.successfulPacket) / self.simulationResult.totalPacket
+        self.simulationResult.throughput = 8 * float(cumulativeSuccessfulDataSize) / cumulativeDataDuration
+        return self.simulationResult
+
+    def __retire(self, event):
+        self.retiredEvents += 1
+        for sink in self.sinks:
+            sink(event)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import glob
+import pytest
+import numpy as np
+import simulation as simulation_module
+from topology import Topology
+from simulation import Simulation
+from eventstore import EVENT_COLUMNS
+from experiment import seed_all
+from packet import PacketSf
+
+
+class Interrupted(Exception):
+    pass
+
+
+def create_simulation(checkpoint):
+    seed_all(5)
+    topology = Topology.create_random_topology(number_of_nodes=40, radius=4000, number_of_gws=2, node_traffic_proportions=(0.5, 0.5))
+    simulation = Simulation(topology=topology, packet_rate=0.05, packet_size=60, simulation_duration=1200, sf=PacketSf.SF_Random, checkpoint=checkpoint, checkpoint_interval=0)
+    simulation.eventQueue.chunkSize = 200
+    return simulation
+
+
+def test_resume_non_streaming_checkpoint(tmp_path, monkeypatch):
+    uninterrupted = create_simulation(None)
+    uninterrupted.run()
+
+    # Run is interrupted after a checkpoint, and a chunk written after it
+    # is discarded on load
+    checkpoint_file = str(tmp_path / 'run.ckpt')
+    saves = []
+    write = simulation_module.atomic_write
+
+    def atomic_write(file_name, data):
+        write(file_name, data)
+        saves.append(len(data))
+        if len(saves) == 1500:
+            raise Interrupted()
+
+    monkeypatch.setattr(simulation_module, 'atomic_write', atomic_write)
+    simulation = create_simulation(checkpoint_file)
+    with pytest.raises(Interrupted):
+        simulation.run()
+    monkeypatch.undo()
+    simulation.eventQueue.get_column('time')
+
+    chunk_files = glob.glob(checkpoint_file + '.events/events-*.npy')
+    assert len(chunk_files) == simulation.eventQueue.numberOfChunkFiles > 1
+    # Pickled events are bounded by the chunk size
+    assert max(saves) - min(saves) < 200 * 32 * 2
+
+    resumed = Simulation.load_checkpoint(checkpoint_file)
+    assert len(glob.glob(checkpoint_file + '.events/events-*.npy')) == resumed.eventQueue.numberOfChunkFiles
+    assert len(resumed.eventQueue) == 1500
+    resumed.run()
+    assert vars(resumed.simulationResult) == vars(uninterrupted.simulationResult)
+    for name, _, _ in EVENT_COLUMNS:
+        assert np.array_equal(resumed.eventQueue.get_column(name), uninterrupted.eventQueue.get_column(name))
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import subprocess
+from eventlog import EventLog
+from simulation import PROFILE_PHASES
+
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+def test_profiled_run_with_columnar_log(tmp_path):
+    for streaming in [[], ['-m']]:
+        directory = str(tmp_path / 'events{}'.format(len(streaming)))
+        subprocess.run([sys.executable, MAIN, '-n', '20', '-d', '300', '-e', '3', '--no-cache', '--profile', '-l', directory] + streaming, check=True, stdout=subprocess.DEVNULL, cwd=str(tmp_path))
+        event_log = EventLog(directory)
+        assert event_log.results['totalPacket'] == len(event_log) > 0
+        assert sorted(event_log.results['profile']['phaseTime']) == sorted(PROFILE_PHASES)
+        assert event_log.results['profile']['events'] == len(event_log)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import numpy as np
+from scipy import stats
+from simulation import SimulationResult
+from experiment import ReplicationController
+
+
+def create_result(pdr, throughput=1000.0, energy=10.0):
+    result = SimulationResult()
+    result.pdr = pdr
+    result.throughput = throughput
+    result.txEnergyConsumption = energy
+    return result
+
+
+def test_min_and_max_replicas():
+    controller = ReplicationController(min_replicas=3, max_replicas=6, targets={'pdr': 0.1}, batch_size=2)
+    assert controller.get_next_replicas([]) == 3
+    assert controller.get_next_replicas([create_result(50)]) == 2
+    # Scattered results never converge, replicas are added up to the maximum
+    results = [create_result(pdr) for pdr in [10, 90, 30]]
+    assert controller.get_next_replicas(results) == 2
+    results += [create_result(70), create_result(20)]
+    assert controller.get_next_replicas(results) == 1
+    results.append(create_result(80))
+    assert controller.get_next_replicas(results) == 0
+    # Identical results converge as soon as there are enough of them
+    assert controller.get_next_replicas([create_result(50)] * 3) == 0
+
+
+def test_stops_when_half_width_within_target():
+    # Replicas are added until the Student t half width of every metric is
+    # within its absolute or relative target
+    controller = ReplicationController(min_replicas=2, max_replicas=100, confidence=0.95, targets={'pdr': 1.0}, relative_targets={'throughput': 0.05})
+    rng = np.random.default_rng(3)
+    results = []
+    while controller.get_next_replicas(results) > 0:
+        results.append(create_result(rng.normal(60, 3), throughput=rng.normal(1000, 20)))
+    assert len(results) < 100
+
+    def half_width(values):
+        return stats.t.ppf(0.975, len(values) - 1) * np.std(values, ddof=1) / math.sqrt(len(values))
+
+    pdr = [result.pdr for result in results]
+    throughput = [result.throughput for result in results]
+    assert half_width(pdr) <= 1.0 and half_width(throughput) <= 0.05 * np.mean(throughput)
+    assert half_width(pdr[:-1]) > 1.0 or half_width(throughput[:-1]) > 0.05 * np.mean(throughput[:-1])
+    interval = controller.get_intervals(results)[(None, 'pdr')]
+    assert interval.count == len(results) and math.isclose(interval.halfWidth, half_width(pdr))
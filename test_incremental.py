@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+from topology import Topology
+from simulation import Simulation
+from experiment import seed_all
+from packet import PacketSf
+
+
+def run(seed, sf, engine):
+    seed_all(seed)
+    topology = Topology.create_random_topology(number_of_nodes=100, radius=4000, number_of_gws=2, node_traffic_proportions=(0.5, 0.5))
+    simulation = Simulation(topology=topology, packet_rate=0.05, packet_size=60, simulation_duration=1800, sf=sf, engine=engine)
+    simulation.run()
+    return simulation
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+@pytest.mark.parametrize('sf', [PacketSf.SF_Lowest, PacketSf.SF_12])
+def test_fixed_sf_matches_event_engine(seed, sf):
+    # Only the incremental engine sees an interferer whose node started and
+    # ended its previous transmission within the event, which needs a shorter
+    # airtime and a short gap, so with fixed SFs both engines decide the same
+    # statuses here
+    event_simulation = run(seed, sf, 'event')
+    incremental_simulation = run(seed, sf, 'incremental')
+    for name in ['totalPacket', 'successfulPacket', 'underSensitivityPacket', 'interferencePacket']:
+        assert getattr(incremental_simulation.simulationResult, name) == getattr(event_simulation.simulationResult, name)
+    assert np.array_equal(incremental_simulation.eventQueue.get_column('status'), event_simulation.eventQueue.get_column('status'))
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_random_sf_close_to_event_engine(seed):
+    # Interferers scheduled after an event is processed are only seen by the
+    # incremental engine, which changes a few statuses
+    event_result = run(seed, PacketSf.SF_Random, 'event').simulationResult
+    incremental_result = run(seed, PacketSf.SF_Random, 'incremental').simulationResult
+    assert incremental_result.totalPacket == event_result.totalPacket
+    assert incremental_result.underSensitivityPacket == event_result.underSensitivityPacket
+    assert abs(incremental_result.successfulPacket - event_result.successfulPacket) <= 0.002 * event_result.totalPacket
+    assert abs(incremental_result.interferencePacket - event_result.interferencePacket) <= 0.002 * event_result.totalPacket
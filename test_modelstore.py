@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+from sklearn.tree import DecisionTreeClassifier
+from topology import Topology
+from simulation import Simulation
+from packet import PacketSf
+from experiment import seed_all
+from modelstore import ModelStore
+
+
+def train_and_run(model_store):
+    seed_all(7)
+    topology = Topology.create_random_topology(number_of_nodes=30, radius=3000, number_of_gws=2, node_traffic_proportions=(1, 0))
+
+    def train():
+        simulation = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=600, sf=PacketSf.SF_Random)
+        simulation.run()
+        X_train, _, y_train, _ = simulation.get_training_data(test_size=0)
+        return DecisionTreeClassifier(random_state=0).fit(X_train, y_train)
+
+    key = ModelStore.get_key(topology, [DecisionTreeClassifier(random_state=0)], simulation_duration=600)
+    classifier = model_store.get_or_train(key, train)
+    smart_result = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=600, sf=PacketSf.SF_Smart, sfPredictor=classifier.predict).run()
+
+    # A new topology after a store hit is numbered from the first id again
+    topology = Topology.create_random_topology(number_of_nodes=20, radius=3000, number_of_gws=3, node_traffic_proportions=(1, 0))
+    assert [node.id for node in topology.gateway_list + topology.node_list] == list(range(1, 24))
+    fresh_result = Simulation(topology=topology, packet_rate=0.01, packet_size=60, simulation_duration=600, sf=PacketSf.SF_Random).run()
+    return smart_result, fresh_result
+
+
+def test_store_hit_then_fresh_simulation(tmp_path):
+    model_store = ModelStore(str(tmp_path))
+    trained = train_and_run(model_store)
+    loaded = train_and_run(model_store)
+    assert model_store.hits == 1 and model_store.misses == 1
+    for trained_result, loaded_result in zip(trained, loaded):
+        assert vars(trained_result) == vars(loaded_result)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+from packet import Packet
+from packet import PacketSf
+from packet import PHY_SF_LIST
+
+
+@pytest.mark.parametrize('erp', [2, 14, 20])
+def test_lowest_sf_uses_erp(erp):
+    # Lowest SF with a received power of erp less the path loss above the
+    # sensitivity, SF12 if there is none
+    distance = np.linspace(10, 12000, 300)
+    expected = []
+    for node_distance in distance:
+        rx_signal_dbm = erp - Packet.calculate_propagation_loss(node_distance)
+        expected.append(next((sf for sf in PHY_SF_LIST[:-1] if rx_signal_dbm > Packet.get_receive_sensitivity(sf)), PacketSf.SF_12))
+    assert [Packet.get_lowest_sf(node_distance, erp) for node_distance in distance] == expected
+    assert Packet.get_lowest_sf_array(distance, erp).tolist() == [sf.value for sf in expected]
+    assert len(set(expected)) == 6
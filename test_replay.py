@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from topology import Topology
+from simulation import Simulation
+from eventlog import ColumnarEventLogWriter
+from eventlog import EventLog
+from replay import TraceReplay
+from vectorized import evaluate_events
+from experiment import seed_all
+from packet import PacketSf
+from packet import PacketStatus
+from packet import PhyModel
+
+
+def test_replay_matches_full_evaluation(tmp_path):
+    # Log chunks and replay batches are smaller than the log, so batches
+    # span chunks and read their overlapping context from neighbour chunks
+    seed_all(9)
+    topology = Topology.create_random_topology(number_of_nodes=60, radius=4000, number_of_gws=2, node_traffic_proportions=(0.5, 0.5))
+    directory = str(tmp_path / 'events')
+    writer = ColumnarEventLogWriter(directory, chunk_size=700)
+    simulation = Simulation(topology=topology, packet_rate=0.05, packet_size=60, simulation_duration=1800, sf=PacketSf.SF_Random, streaming=True, sinks=[writer])
+    writer.write_header(simulation)
+    writer.write_results(simulation.run())
+
+    event_log = EventLog(directory)
+    assert len(event_log.chunks) > 1
+    time = np.ascontiguousarray(event_log.get_column('time'))
+    duration = np.ascontiguousarray(event_log.get_column('duration'))
+    sf = np.ascontiguousarray(event_log.get_column('sf'))
+    node_index = event_log.get_column('source').astype(np.intp) - len(topology.gateway_list) - 1
+
+    phy_list = [topology.phy, PhyModel(path_loss_exponent=35.0)]
+    for batch_size in [500, len(event_log)]:
+        results = TraceReplay(directory, batch_size=batch_size).run(phy_list)
+        for phy, result in zip(phy_list, results):
+            status = evaluate_events(time, duration, sf, node_index, topology.get_link_budget(phy))
+            assert result.totalPacket == len(status)
+            assert result.successfulPacket == np.count_nonzero(status == PacketStatus.transmitted.value)
+            assert result.underSensitivityPacket == np.count_nonzero(status == PacketStatus.under_sensitivity.value)
+            assert result.interferencePacket == np.count_nonzero(status == PacketStatus.interfered.value)
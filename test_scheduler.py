@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import random
+import pytest
+from topology import Topology
+from simulation import Simulation
+from scheduler import EventScheduler
+from scheduler import ActiveTransmissions
+from tracing import TraceRecorder
+from tracing import TraceVerdict
+from experiment import seed_all
+from packet import Packet
+from packet import PacketSf
+from packet import PacketStatus
+
+
+def overlaps(event, other):
+    return other.time <= event.time + event.duration and event.time <= other.time + other.duration
+
+
+@pytest.mark.parametrize('trace_index', range(10))
+def test_interval_index_matches_brute_force(trace_index):
+    # Overlapping transmissions found by the active transmission index and the
+    # scheduler lookahead over random traces of mixed SF transmissions
+    random.seed(trace_index)
+    number_of_events = 1000
+    events = [Packet(time=random.uniform(0, number_of_events / 20.0), sf=PacketSf.get_random(), source=0, size=random.randint(51, 222)) for _ in range(number_of_events)]
+
+    scheduler = EventScheduler()
+    active_transmissions = ActiveTransmissions()
+    for event in events:
+        scheduler.push(event)
+    processed_events = []
+    while len(scheduler) > 0:
+        event = scheduler.pop()
+        active_transmissions.expire(event.time)
+        found = set(id(other) for other in active_transmissions)
+        found.update(id(other) for other in scheduler.lookahead(event.time + event.duration))
+        assert found == set(id(other) for other in events if other is not event and overlaps(event, other))
+        active_transmissions.add(event)
+        processed_events.append(event)
+    assert processed_events == sorted(events, key=lambda packet: packet.time)
+
+
+@pytest.mark.parametrize('seed, sf, radius, number_of_gws', [(1, PacketSf.SF_Random, 4000, 2), (2, PacketSf.SF_Lowest, 4000, 2), (3, PacketSf.SF_12, 4000, 2), (4, PacketSf.SF_7, 8000, 1)])
+def test_simulation_matches_brute_force(seed, sf, radius, number_of_gws):
+    # Interferers and statuses of a run are recomputed from its events. An
+    # event sees the overlapping events that were scheduled when it was
+    # processed: those processed before it and those whose previous
+    # transmission of the same node was processed before it.
+    seed_all(seed)
+    topology = Topology.create_random_topology(number_of_nodes=60, radius=radius, number_of_gws=number_of_gws, node_traffic_proportions=(0.5, 0.5))
+    events = []
+    trace = TraceRecorder()
+    simulation = Simulation(topology=topology, packet_rate=0.05, packet_size=60, simulation_duration=600, sf=sf, streaming=True, sinks=[events.append], trace=trace)
+    simulation.run()
+    assert [event.time for event in events] == sorted(event.time for event in events)
+
+    order = {event.id: index for index, event in enumerate(events)}
+    previous = {}
+    last_of_node = {}
+    for event in events:
+        previous[event.id] = last_of_node.get(event.source)
+        last_of_node[event.source] = order[event.id]
+
+    link_budget = topology.get_link_budget()
+    phy = link_budget.phy
+    found = {}
+    for record in trace.get_records():
+        if record['verdict'] == TraceVerdict.overlapping.value:
+            found.setdefault((int(record['event']), int(record['gw'])), set()).add(int(record['interferer']))
+
+    for index, event in enumerate(events):
+        interferers = [other for other in events if other is not event and overlaps(event, other) and
+                       (order[other.id] < index or previous[other.id] is None or previous[other.id] < index)]
+        node_index = topology.get_node_index(event.source)
+        survived = []
+        received = []
+        for gw_index, gateway in enumerate(topology.gateway_list):
+            if link_budget.rx_power_dbm[node_index, gw_index] < phy.get_sensitivity(event.sf):
+                continue
+            received.append(gateway)
+            if interferers:
+                assert found.get((event.id, gateway.id)) == set(other.id for other in interferers)
+            signal_energy = link_budget.get_rx_power_w(node_index, gw_index) * event.duration
+            interference_energy = [0] * 6
+            for other in interferers:
+                overlap = min(event.time + event.duration, other.time + other.duration) - max(event.time, other.time)
+                interference_energy[other.sf.value - 7] += link_budget.get_rx_power_w(topology.get_node_index(other.source), gw_index) * overlap
+            if all(energy == 0 or 10 * math.log10(signal_energy / energy) >= phy.snirThreshold[event.sf.value][sf_index + 7] for sf_index, energy in enumerate(interference_energy)):
+                survived.append(gateway)
+
+        if not received:
+            expected = PacketStatus.under_sensitivity
+        elif not survived:
+            expected = PacketStatus.interfered
+        else:
+            expected = PacketStatus.transmitted
+        assert event.status == expected
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import subprocess
+import pytest
+from topology import Topology
+from topology import SYMMETRIC_MAX_GWS
+
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+def test_symmetric_placement_gateway_limit(tmp_path):
+    assert len(Topology.create_gateway_locations('symmetric', SYMMETRIC_MAX_GWS, 4000)) == SYMMETRIC_MAX_GWS
+    with pytest.raises(ValueError):
+        Topology.create_gateway_locations('symmetric', SYMMETRIC_MAX_GWS + 1, 4000)
+
+    # Command line reports the limit as a usage error
+    process = subprocess.run([sys.executable, MAIN, '-n', '20', '-d', '300', '-g', str(SYMMETRIC_MAX_GWS + 1), '--no-cache'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, cwd=str(tmp_path))
+    assert process.returncode == 2
+    assert 'symmetric gateway placement supports up to {} gateways'.format(SYMMETRIC_MAX_GWS) in process.stderr
+    assert 'Traceback' not in process.stderr
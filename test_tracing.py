@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+from topology import Topology
+from simulation import Simulation
+from tracing import TraceRecorder
+from tracing import load_trace
+from experiment import seed_all
+from packet import PacketSf
+from main import run_simulation
+
+
+def test_run_closes_flushed_trace_file(tmp_path, capsys):
+    # Every record is flushed to the file, so the recorder has no buffered
+    # records when the run ends and must still be closed
+    seed_all(4)
+    topology = Topology.create_random_topology(number_of_nodes=30, radius=4000, number_of_gws=2, node_traffic_proportions=(0.5, 0.5))
+    trace = TraceRecorder(file_name=str(tmp_path / 'run.trace'), buffer_size=1)
+    simulation = Simulation(topology=topology, packet_rate=0.05, packet_size=60, simulation_duration=600, sf=PacketSf.SF_Random, trace=trace)
+    run_simulation(simulation, argparse.Namespace(event=None, eventFormat='columnar', profile=False))
+    assert len(trace) == 0
+    assert trace.file is None
+    assert len(load_trace(str(tmp_path / 'run.trace'))) > 0
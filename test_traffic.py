@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from topology import Topology
+from simulation import Simulation
+from traffic import TrafficTrace
+from cache import ResultCache
+from experiment import ExperimentRunner
+from experiment import seed_all
+from packet import PacketSf
+
+
+def create_topology():
+    seed_all(13)
+    return Topology.create_random_topology(number_of_nodes=40, radius=4000, number_of_gws=2, node_traffic_proportions=(0.5, 0.5))
+
+
+def get_node_gaps(simulation, topology):
+    # Gaps between the end of a transmission and the start of the next one
+    time = simulation.eventQueue.get_column('time')
+    end = time + simulation.eventQueue.get_column('duration')
+    node_index = simulation.eventQueue.get_column('source') - len(topology.gateway_list) - 1
+    gaps = []
+    for index in range(len(topology.node_list)):
+        node_events = np.nonzero(node_index == index)[0]
+        gaps.append(time[node_events] - np.concatenate([[0], end[node_events[:-1]]]))
+    return gaps
+
+
+def test_shared_trace_gives_same_arrivals():
+    topology = create_topology()
+    traffic = TrafficTrace.generate(topology, packet_rate=0.02, simulation_duration=1800)
+    policy_gaps = []
+    for sf, seed in [(PacketSf.SF_Lowest, 1), (PacketSf.SF_Random, 2)]:
+        seed_all(seed)
+        simulation = Simulation(topology=topology, packet_rate=0.02, packet_size=60, simulation_duration=1800, sf=sf, traffic=traffic)
+        simulation.run()
+        policy_gaps.append(get_node_gaps(simulation, topology))
+
+    for index, (lowest_gaps, random_gaps) in enumerate(zip(*policy_gaps)):
+        trace_gaps = traffic.get_gaps(index)
+        length = min(len(lowest_gaps), len(random_gaps))
+        assert length > 0 and length >= len(trace_gaps) - 1
+        assert np.allclose(lowest_gaps[:length], random_gaps[:length])
+        assert np.allclose(lowest_gaps, trace_gaps[:len(lowest_gaps)])
+        assert np.allclose(random_gaps, trace_gaps[:len(random_gaps)])
+
+
+def trace_job(point, point_seed, replica_seed):
+    simulation = Simulation(topology=point['topology'], packet_rate=0.02, packet_size=60, simulation_duration=900, sf=PacketSf.SF_Random, traffic=point['traffic'])
+    return simulation.run()
+
+
+def test_cached_runs_keyed_by_trace(tmp_path):
+    topology = create_topology()
+    traffic = TrafficTrace.generate(topology, packet_rate=0.02, simulation_duration=900)
+    other_traffic = TrafficTrace.generate(topology, packet_rate=0.02, simulation_duration=900)
+    assert traffic.get_fingerprint() != other_traffic.get_fingerprint()
+    cache = ResultCache(str(tmp_path))
+    runner = ExperimentRunner(workers=1, seed=5, cache=cache)
+
+    first = runner.run(trace_job, [dict(topology=topology, traffic=traffic)], 2)
+    assert (cache.hits, cache.misses) == (0, 2)
+    second = runner.run(trace_job, [dict(topology=topology, traffic=traffic)], 2)
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert [vars(result) for result in first[0]] == [vars(result) for result in second[0]]
+    # A trace with other gaps is not served from the cache
+    runner.run(trace_job, [dict(topology=topology, traffic=other_traffic)], 2)
+    assert (cache.hits, cache.misses) == (2, 4)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import pytest
+import numpy as np
+from topology import Topology
+from traffic import TrafficTrace
+from vectorized import VectorizedSimulation
+from vectorized import evaluate_events
+from vectorized import SF_LIST
+from whatif import WhatIfEvaluator
+from experiment import seed_all
+from packet import PacketSf
+from packet import PacketStatus
+
+
+@pytest.mark.parametrize('use_traffic', [False, True])
+def test_committed_changes_match_full_evaluation(use_traffic):
+    # Without a trace changed nodes keep their start times, with a trace
+    # they are rescheduled from its gaps with the new airtimes
+    seed_all(11)
+    number_of_nodes = 80
+    topology = Topology.create_random_topology(number_of_nodes=number_of_nodes, radius=4000, number_of_gws=2, node_traffic_proportions=(0.7, 0.3))
+    traffic = TrafficTrace.generate(topology, packet_rate=0.02, simulation_duration=1800) if use_traffic else None
+    simulation = VectorizedSimulation(topology=topology, packet_rate=0.02, packet_size=60, simulation_duration=1800, sf=PacketSf.SF_Lowest, traffic=traffic)
+    simulation.run()
+    evaluator = WhatIfEvaluator.from_simulation(simulation)
+    assert (evaluator.traffic is not None) == use_traffic
+
+    for _ in range(20):
+        sf_changes = {node_index: random.choice(SF_LIST) for node_index in random.sample(range(number_of_nodes), random.randint(1, 3))}
+        result = evaluator.evaluate(sf_changes)
+        committed = evaluator.evaluate(sf_changes, commit=True)
+        assert vars(result) == vars(committed)
+        for node_index, sf in sf_changes.items():
+            node_time = evaluator.time[evaluator.nodeIndex == node_index]
+            assert evaluator.get_node_sf(node_index) == (sf if len(node_time) else None)
+            if use_traffic:
+                gaps = traffic.get_gaps(node_index)
+                expected = np.cumsum(gaps) + np.arange(len(gaps)) * evaluator.airtime[sf.value - 7]
+                assert np.allclose(node_time, expected[expected <= 1800])
+
+        status = evaluate_events(evaluator.time, evaluator.duration, evaluator.sf, evaluator.nodeIndex, evaluator.linkBudget)
+        assert np.array_equal(status, evaluator.status)
+        assert committed.totalPacket == len(status)
+        assert committed.successfulPacket == np.count_nonzero(status == PacketStatus.transmitted.value)
+        assert committed.underSensitivityPacket == np.count_nonzero(status == PacketStatus.under_sensitivity.value)
+        assert committed.interferencePacket == np.count_nonzero(status == PacketStatus.interfered.value)
+        assert committed.txEnergyConsumption == pytest.approx(topology.phy.txPowerW * evaluator.duration.sum())
@@ -17,25 +17,177 @@
 
 import random
 import math
+import pickle
+import hashlib
+import numpy as np
+from scipy.spatial import cKDTree
 from location import Location
 from node import Node
 from node import Gateway
 from node import TrafficType
-from packet import Packet
+from packet import PacketSf
+from packet import default_phy
+
+
+GATEWAY_PLACEMENTS = ['symmetric', 'hex', 'random']
+
+SYMMETRIC_MAX_GWS = 4  # symmetric layouts are defined up to this number of gateways
+
+
+class GatewayIndex:
+    # KD-tree of gateway locations, nearest gateway and range queries take
+    # O(log G) per node
+    def __init__(self, gw_x, gw_y):
+        self.numberOfGateways = len(gw_x)
+        self.tree = cKDTree(np.column_stack((gw_x, gw_y)).reshape(-1, 2))
+
+    def query_nearest(self, x, y):
+        # Distances to and indices of the nearest gateways of the points
+        return self.tree.query(np.column_stack((x, y)).reshape(-1, 2))
+
+    def query_range(self, x, y, distance):
+        # Sorted indices of gateways within distance of every point
+        return self.tree.query_ball_point(np.column_stack((x, y)).reshape(-1, 2), distance, return_sorted=True)
+
+
+class LinkBudget:
+    # Link budgets of nodes to the gateways that can hear them. A gateway
+    # farther than maxRange receives a node under the SF12 sensitivity, so it
+    # can not receive the node at any SF. Audible gateway lists are kept per
+    # node index, dense node x gateway matrices are computed on first use.
+    def __init__(self, node_x, node_y, gw_x, gw_y, phy=default_phy):
+        self.node_x = node_x
+        self.node_y = node_y
+        self.gw_x = gw_x
+        self.gw_y = gw_y
+        self.phy = phy
+        self.gatewayIndex = GatewayIndex(gw_x, gw_y)
+        self.maxRange = phy.get_max_range()
+        self.__dense = {}
+
+        audible = self.gatewayIndex.query_range(node_x, node_y, self.maxRange * (1 + 1e-9))
+        counts = np.array([len(gws) for gws in audible], dtype=np.int64)
+        gw_index = np.array([gw for gws in audible for gw in gws], dtype=np.int64)
+        node_index = np.repeat(np.arange(len(node_x)), counts)
+        distance = np.sqrt((node_x[node_index] - gw_x[gw_index]) ** 2 + (node_y[node_index] - gw_y[gw_index]) ** 2)
+        rx_power_dbm = phy.get_rx_power_dbm_array(distance)
+        rx_power_w = phy.dbm_to_watt_array(rx_power_dbm)
+        splits = np.cumsum(counts)[:-1]
+        self.audibleGateways = np.split(gw_index, splits)
+        self.audibleRxPowerDbm = np.split(rx_power_dbm, splits)
+        self.audibleRxPowerW = np.split(rx_power_w, splits)
+
+    @property
+    def shape(self):
+        return len(self.node_x), len(self.gw_x)
+
+    def get_distance(self, node_index, gw_index):
+        return math.sqrt((self.node_x[node_index] - self.gw_x[gw_index]) ** 2 + (self.node_y[node_index] - self.gw_y[gw_index]) ** 2)
+
+    def get_rx_power_w(self, node_index, gw_index):
+        rx_power_dbm = self.phy.get_rx_power_dbm_array(np.float64(self.get_distance(node_index, gw_index)))
+        return float(self.phy.dbm_to_watt_array(rx_power_dbm))
+
+    def __get_dense(self, name):
+        if name not in self.__dense:
+            distance = np.sqrt((self.node_x[:, None] - self.gw_x[None, :]) ** 2 + (self.node_y[:, None] - self.gw_y[None, :]) ** 2)
+            path_loss = self.phy.get_path_loss_array(distance)
+            rx_power_dbm = self.phy.txPowerDbm - path_loss
+            self.__dense = {
+                'distance': distance,
+                'path_loss': path_loss,
+                'rx_power_dbm': rx_power_dbm,
+                'rx_power_w': self.phy.dbm_to_watt_array(rx_power_dbm),
+            }
+        return self.__dense[name]
+
+    @property
+    def distance(self):
+        return self.__get_dense('distance')
+
+    @property
+    def path_loss(self):
+        return self.__get_dense('path_loss')
+
+    @property
+    def rx_power_dbm(self):
+        return self.__get_dense('rx_power_dbm')
+
+    @property
+    def rx_power_w(self):
+        return self.__get_dense('rx_power_w')
 
 
 class Topology:
-    def __init__(self):
+    def __init__(self, phy=default_phy):
+        self.phy = phy
         self.gateway_list = []
         self.node_list = []
         self.radius = 0
+        self.__linkBudget = None
+        self.__gatewayIndex = None
+        self.predictedSfCache = {}  # smart SF of nodes per model fingerprint
 
     def get_node(self, id):
         return self.node_list[id - len(self.gateway_list) - 1]
 
+    def get_node_index(self, id):
+        return id - len(self.gateway_list) - 1
+
     def get_gateway(self, id):
         return self.gateway_list[id - 1]
 
+    def add_node(self, node):
+        self.node_list.append(node)
+        self.invalidate_link_budget()
+
+    def add_gateway(self, gateway):
+        self.gateway_list.append(gateway)
+        self.invalidate_link_budget()
+
+    def __getstate__(self):
+        # Link budget and gateway index are derived from locations, they are
+        # rebuilt when needed instead of being pickled
+        state = self.__dict__.copy()
+        state['_Topology__linkBudget'] = None
+        state['_Topology__gatewayIndex'] = None
+        return state
+
+    def invalidate_link_budget(self):
+        # Must be called if node or gateway locations are modified in place
+        self.__linkBudget = None
+        self.__gatewayIndex = None
+        self.predictedSfCache = {}
+
+    def get_link_budget(self, phy=None):
+        # Link budget with the topology PHY model unless another one is given
+        phy = phy if phy is not None else self.phy
+        if self.__linkBudget is None or self.__linkBudget.shape != (len(self.node_list), len(self.gateway_list)) or self.__linkBudget.phy is not phy:
+            node_x = np.array([node.location.x for node in self.node_list], dtype=float)
+            node_y = np.array([node.location.y for node in self.node_list], dtype=float)
+            gw_x = np.array([gateway.location.x for gateway in self.gateway_list], dtype=float)
+            gw_y = np.array([gateway.location.y for gateway in self.gateway_list], dtype=float)
+            self.__linkBudget = LinkBudget(node_x, node_y, gw_x, gw_y, phy=phy)
+        return self.__linkBudget
+
+    def get_fingerprint(self):
+        # Hash of node and gateway locations, node traffic types and the PHY
+        # model, equal for topologies that simulate the same
+        link_budget = self.get_link_budget()
+        fingerprint = hashlib.sha256()
+        for locations in [link_budget.node_x, link_budget.node_y, link_budget.gw_x, link_budget.gw_y]:
+            fingerprint.update(locations.tobytes())
+        fingerprint.update(bytes(node.trafficType.value for node in self.node_list))
+        fingerprint.update(pickle.dumps(vars(self.phy), protocol=pickle.HIGHEST_PROTOCOL))
+        return fingerprint.hexdigest()
+
+    def get_gateway_index(self):
+        if self.__gatewayIndex is None or self.__gatewayIndex.numberOfGateways != len(self.gateway_list):
+            gw_x = np.array([gateway.location.x for gateway in self.gateway_list], dtype=float)
+            gw_y = np.array([gateway.location.y for gateway in self.gateway_list], dtype=float)
+            self.__gatewayIndex = GatewayIndex(gw_x, gw_y)
+        return self.__gatewayIndex
+
     def show(self):
         print('Nodes:')
         for gateway in self.gateway_list:
@@ -44,72 +196,100 @@ class Topology:
             print(' {}'.format(node))
 
     def get_get_nearest_gw(self, location):
-        nearestGateway = None
-        nearestDistance = None
-        for gateway in self.gateway_list:
-            distance = Location.get_distance(gateway.location, location)
-            if nearestGateway is None:
-                nearestGateway = gateway
-                nearestDistance = distance
-            elif distance < nearestDistance:
-                nearestGateway = gateway
-                nearestDistance = distance
-        return nearestGateway, nearestDistance
+        if len(self.gateway_list) == 0:
+            return None, None
+        distance, index = self.get_gateway_index().query_nearest([location.x], [location.y])
+        return self.gateway_list[int(index[0])], float(distance[0])
+
+    def get_gws_in_range(self, location, distance):
+        return [self.gateway_list[index] for index in self.get_gateway_index().query_range([location.x], [location.y], distance)[0]]
 
     @staticmethod
-    def create_random_topology(number_of_nodes, node_traffic_proportions, radius, number_of_gws=1):
-        assert 1 <= number_of_nodes <= 100000, 'unsupported number of nodes {}'.format(number_of_nodes)
+    def create_gateway_locations(placement, number_of_gws, radius):
+        assert placement in GATEWAY_PLACEMENTS, 'unsupported gateway placement {}'.format(placement)
+        assert 1 <= number_of_gws, 'unsupported number of gateways {}'.format(number_of_gws)
+        if placement == 'symmetric':
+            if number_of_gws > SYMMETRIC_MAX_GWS:
+                raise ValueError('symmetric gateway placement supports up to {} gateways, got {}, use hex or random placement'.format(SYMMETRIC_MAX_GWS, number_of_gws))
+            if number_of_gws == 1:
+                return [Location(0, 0)]
+            elif number_of_gws == 2:
+                a = radius/2.0
+                return [Location(a, 0), Location(-a, 0)]
+            elif number_of_gws == 3:
+                a = radius/(2.0 + math.sqrt(3))
+                b = math.sqrt(3) * a
+                c = 2 * a
+                return [Location(-b, -a), Location(b, -a), Location(0, c)]
+            elif number_of_gws == 4:
+                a = radius/(1.0 + math.sqrt(2))
+                return [Location(a, a), Location(a, -a), Location(-a, a), Location(-a, -a)]
+        elif placement == 'hex':
+            # Hexagonal grid with a cell area of the topology area per gateway,
+            # the grid points closest to the center are used
+            spacing = math.sqrt(2 * math.pi * radius ** 2 / (math.sqrt(3) * number_of_gws))
+            k = int(math.ceil(radius / spacing)) + 2
+            i, j = np.meshgrid(np.arange(-k, k + 1), np.arange(-k, k + 1))
+            x = spacing * (i + j / 2.0).ravel()
+            y = spacing * (j * math.sqrt(3) / 2.0).ravel()
+            order = np.lexsort((np.arctan2(y, x), np.round(np.hypot(x, y), 6)))[:number_of_gws]
+            return [Location(float(x[index]), float(y[index])) for index in order]
+        elif placement == 'random':
+            rng = np.random.default_rng(random.getrandbits(64))
+            distance_to_center = radius * np.sqrt(rng.random(number_of_gws))
+            angle = 2 * math.pi * rng.random(number_of_gws)
+            return [Location(float(x), float(y)) for x, y in zip(distance_to_center * np.cos(angle), distance_to_center * np.sin(angle))]
+
+    @staticmethod
+    def load_gateway_locations(file_name):
+        # One gateway per line as x,y in meters, lines starting with # are skipped
+        locations = np.loadtxt(file_name, delimiter=',', comments='#', ndmin=2)
+        assert locations.shape[0] >= 1 and locations.shape[1] == 2, 'invalid gateway locations file {}'.format(file_name)
+        return [Location(float(x), float(y)) for x, y in locations]
+
+    @staticmethod
+    def create_random_topology(number_of_nodes, node_traffic_proportions, radius, number_of_gws=1, gw_placement='symmetric', gw_locations=None, phy=default_phy):
+        # Gateways are placed with gw_placement, or at gw_locations if given
+        assert 1 <= number_of_nodes, 'unsupported number of nodes {}'.format(number_of_nodes)
         assert 10 <= radius <= 40000, 'unsupported radius {}'.format(radius)
-        assert 1 <= number_of_gws <= 4, 'unsupported number of gateways {}'.format(number_of_gws)
         assert sum(node_traffic_proportions) == 1, 'invalid node traffic proportions {}'.format(node_traffic_proportions)
 
-        topology = Topology()
+        topology = Topology(phy=phy)
         topology.radius = radius
+        # Gateways are numbered from 1 and nodes after them in every topology
+        Node.idCounter = 0
 
-        if number_of_gws == 1:
-            topology.gateway_list.append(Gateway(location=Location(0, 0)))
-        elif number_of_gws == 2:
-            a = radius/2.0
-            topology.gateway_list.append(Gateway(location=Location(a, 0)))
-            topology.gateway_list.append(Gateway(location=Location(-a, 0)))
-        elif number_of_gws == 3:
-            a = radius/(2.0 + math.sqrt(3))
-            b = math.sqrt(3) * a
-            c = 2 * a
-            topology.gateway_list.append(Gateway(location=Location(-b, -a)))
-            topology.gateway_list.append(Gateway(location=Location(b, -a)))
-            topology.gateway_list.append(Gateway(location=Location(0, c)))
-        elif number_of_gws == 4:
-            a = radius/(1.0 + math.sqrt(2))
-            topology.gateway_list.append(Gateway(location=Location(a, a)))
-            topology.gateway_list.append(Gateway(location=Location(a, -a)))
-            topology.gateway_list.append(Gateway(location=Location(-a, a)))
-            topology.gateway_list.append(Gateway(location=Location(-a, -a)))
-
-        while len(topology.node_list) < number_of_nodes:
-            x = random.randint(-radius, radius)
-            y = random.randint(-radius, radius)
-            if (x ** 2 + y ** 2) > (radius ** 2):
-                continue
+        if gw_locations is None:
+            gw_locations = Topology.create_gateway_locations(gw_placement, number_of_gws, radius)
+        for location in gw_locations:
+            topology.add_gateway(Gateway(location=location))
 
-            node = Node(location=Location(x, y))
-            topology.node_list.append(node)
+        # Node positions are drawn uniformly in the disc and traffic types are
+        # assigned with a single permutation, all in array form
+        rng = np.random.default_rng(random.getrandbits(64))
+        distance_to_center = radius * np.sqrt(rng.random(number_of_nodes))
+        angle = 2 * math.pi * rng.random(number_of_nodes)
+        node_x = distance_to_center * np.cos(angle)
+        node_y = distance_to_center * np.sin(angle)
 
-        # Assign traffic generation types
+        traffic_type = np.full(number_of_nodes, TrafficType.Poisson.value, dtype=np.int8)
+        permutation = rng.permutation(number_of_nodes)
+        assigned = 0
         for type_index, proportion in enumerate(node_traffic_proportions):
-            assigned = 0
-            while assigned < math.floor(proportion * number_of_nodes):
-                randomIndex = random.randint(0, number_of_nodes - 1)
-                if topology.node_list[randomIndex].trafficType is None:
-                    topology.node_list[randomIndex].trafficType = TrafficType(type_index)
-                    assigned = assigned + 1
-        for tx_node in topology.node_list:
-            if tx_node.trafficType is None:
-                tx_node.trafficType = TrafficType.Poisson
-
-        # Find the lowest SF for nodes
-        for tx_node in topology.node_list:
-            _, nearestDistance = topology.get_get_nearest_gw(tx_node.location)
-            tx_node.lowestSf = Packet.get_lowest_sf(distance=nearestDistance)
+            count = math.floor(proportion * number_of_nodes)
+            traffic_type[permutation[assigned:assigned + count]] = type_index
+            assigned += count
+
+        nearest_distance, _ = topology.get_gateway_index().query_nearest(node_x, node_y)
+        lowest_sf = phy.get_lowest_sf_array(nearest_distance)
+
+        traffic_types = {type.value: type for type in TrafficType}
+        sfs = {sf.value: sf for sf in PacketSf}
+        for x, y, type_value, sf_value in zip(node_x.tolist(), node_y.tolist(), traffic_type.tolist(), lowest_sf.tolist()):
+            node = Node(location=Location(x, y))
+            node.trafficType = traffic_types[type_value]
+            node.lowestSf = sfs[sf_value]
+            topology.node_list.append(node)
+        topology.invalidate_link_budget()
 
         return topology
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import array
+import enum
+import numpy as np
+
+
+@enum.unique
+class TraceVerdict(enum.Enum):
+    under_sensitivity = 0  # gateway can not receive the event
+    overlapping = 1  # interferer overlaps the event at a receiving gateway
+    survived = 2  # SNIR against an interfering SF is enough
+    interfered = 3  # SNIR against an interfering SF is not enough
+
+
+trace_dtype = np.dtype([
+    ('event', np.int64),
+    ('gw', np.int32),
+    ('interferer', np.int64),
+    ('sf', np.int8),
+    ('overlap', np.float64),
+    ('snir', np.float64),
+    ('verdict', np.int8),
+])
+
+
+class TraceRecorder:
+    # Structured trace of reception decisions. Records are kept in typed
+    # columns and, if a file is given, flushed to it in binary chunks.
+    # Interferer is -1 for records that are not about a single interferer,
+    # sf is the interferer SF and overlap and snir are NaN where undefined.
+    def __init__(self, file_name=None, buffer_size=65536):
+        self.fileName = file_name
+        self.bufferSize = buffer_size
+        self.file = open(file_name, 'wb') if file_name is not None else None
+        self.chunks = []
+        self.__reset_columns()
+
+    def __reset_columns(self):
+        self.event = array.array('q')
+        self.gw = array.array('i')
+        self.interferer = array.array('q')
+        self.sf = array.array('b')
+        self.overlap = array.array('d')
+        self.snir = array.array('d')
+        self.verdict = array.array('b')
+
+    def __getstate__(self):
+        # A pickled recorder refers to its file by name and written length,
+        # records written after that are discarded when it is unpickled
+        self.flush()
+        state = self.__dict__.copy()
+        if self.file is not None:
+            self.file.flush()
+            state['file'] = self.file.tell()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.file is not None:
+            position = self.file
+            self.file = open(self.fileName, 'r+b')
+            self.file.seek(position)
+            self.file.truncate()
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks) + len(self.event)
+
+    def record(self, event, gw, interferer, sf, overlap, snir, verdict):
+        self.event.append(event)
+        self.gw.append(gw)
+        self.interferer.append(interferer)
+        self.sf.append(sf)
+        self.overlap.append(overlap)
+        self.snir.append(snir)
+        self.verdict.append(verdict)
+        if len(self.event) >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        if len(self.event) == 0:
+            return
+        chunk = np.empty(len(self.event), dtype=trace_dtype)
+        for name in trace_dtype.names:
+            chunk[name] = np.frombuffer(getattr(self, name), dtype=trace_dtype[name])
+        self.__reset_columns()
+        if self.file is not None:
+            np.save(self.file, chunk)
+        else:
+            self.chunks.append(chunk)
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def get_records(self):
+        self.flush()
+        if self.fileName is not None:
+            if self.file is not None:
+                self.file.flush()
+            return load_trace(self.fileName)
+        return np.concatenate(self.chunks) if self.chunks else np.empty(0, dtype=trace_dtype)
+
+
+def load_trace(file_name):
+    chunks = []
+    with open(file_name, 'rb') as file:
+        while file.peek(1):
+            chunks.append(np.load(file))
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=trace_dtype)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import random
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from node import TrafficType
+from simulation import Simulation
+from experiment import derive_seed
+from experiment import seed_all
+
+
+class TrafficTrace:
+    # Arrival process of a topology drawn once, so SF assignment methods can
+    # be compared with common random numbers. A node transmits after the end
+    # of its previous transmission plus a gap, so gaps are stored instead of
+    # times and transmission times follow from the airtimes of the evaluated
+    # SF assignment. The first gap of a node is the poisson initial
+    # transmission time. Gaps of all nodes are kept in a flat array, gaps of
+    # node i are gaps[offsets[i]:offsets[i + 1]], only gaps that can start
+    # within the simulation duration are kept.
+    def __init__(self, gaps, offsets, packet_rate, simulation_duration):
+        self.gaps = gaps
+        self.offsets = offsets
+        self.packetRate = packet_rate
+        self.simulationDuration = simulation_duration
+
+    @staticmethod
+    def generate(topology, packet_rate, simulation_duration):
+        rng = np.random.default_rng(random.getrandbits(64))
+        number_of_nodes = len(topology.node_list)
+        periodic = np.array([tx_node.trafficType == TrafficType.Periodic for tx_node in topology.node_list], dtype=bool)
+
+        # Enough columns for most nodes, rows that have not reached the end of
+        # the simulation are extended with smaller blocks
+        expected = simulation_duration * packet_rate
+        columns = int(expected + 5 * np.sqrt(expected) + 10)
+        blocks = []
+        last_time = np.zeros(number_of_nodes)
+        while True:
+            block = rng.exponential(1 / packet_rate, size=(number_of_nodes, columns))
+            # Initial transmissions are poisson for all node types
+            block[periodic, (0 if blocks else 1):] = 1 / packet_rate
+            blocks.append(block)
+            last_time += block.sum(axis=1)
+            if (last_time > simulation_duration).all():
+                break
+            columns = max(10, columns // 4)
+
+        gaps = np.concatenate(blocks, axis=1)
+        # Transmissions start no earlier than the sum of gaps before them
+        valid = np.cumsum(gaps, axis=1) <= simulation_duration
+        offsets = np.zeros(number_of_nodes + 1, dtype=np.int64)
+        np.cumsum(valid.sum(axis=1), out=offsets[1:])
+        return TrafficTrace(gaps[valid], offsets, packet_rate, simulation_duration)
+
+    @property
+    def numberOfNodes(self):
+        return len(self.offsets) - 1
+
+    def __len__(self):
+        return len(self.gaps)
+
+    @property
+    def nbytes(self):
+        return self.gaps.nbytes + self.offsets.nbytes
+
+    def get_gaps(self, node_index):
+        return self.gaps[self.offsets[node_index]:self.offsets[node_index + 1]]
+
+    def get_gap_matrix(self):
+        # Gaps as a node x columns matrix padded with at least one infinity
+        counts = np.diff(self.offsets)
+        columns = int(counts.max(initial=0)) + 1
+        matrix = np.full((self.numberOfNodes, columns), math.inf)
+        matrix[np.arange(columns) < counts[:, None]] = self.gaps
+        return matrix
+
+    def get_fingerprint(self):
+        # Hash of the gaps and parameters, equal for traces that simulate the same
+        fingerprint = hashlib.sha256()
+        fingerprint.update(self.gaps.tobytes())
+        fingerprint.update(self.offsets.tobytes())
+        fingerprint.update('{}:{}'.format(self.packetRate, self.simulationDuration).encode())
+        return fingerprint.hexdigest()
+
+    def __repr__(self):
+        return 'TrafficTrace(nodes={},gaps={},packet_rate={},simulation_duration={})'.format(self.numberOfNodes, len(self), self.packetRate, self.simulationDuration)
+
+
+def _run_sf_policy(topology, traffic, packet_size, sf, sf_predictor, seed):
+    seed_all(seed)
+    simulation = Simulation(topology=topology, packet_rate=traffic.packetRate, packet_size=packet_size, simulation_duration=traffic.simulationDuration, sf=sf, sfPredictor=sf_predictor, traffic=traffic)
+    return simulation.run()
+
+
+def run_sf_policies(topology, traffic, policies, packet_size, workers=1):
+    # Results of SF assignment policies, a dict of name to (sf, sfPredictor),
+    # against the same traffic trace. Every policy is run with its own seed
+    # derived from the global generator, so results do not depend on workers.
+    seed = random.getrandbits(64)
+    tasks = [(name, (topology, traffic, packet_size, sf, sf_predictor, derive_seed(seed, name))) for name, (sf, sf_predictor) in policies.items()]
+    if workers <= 1:
+        return {name: _run_sf_policy(*task) for name, task in tasks}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {name: executor.submit(_run_sf_policy, *task) for name, task in tasks}
+        return {name: future.result() for name, future in futures.items()}
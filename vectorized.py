@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import numpy as np
+from packet import PacketStatus
+from packet import PacketSf
+from simulation import SimulationResult
+from simulation import build_training_data
+from eventstore import EventStore
+from traffic import TrafficTrace
+
+
+SF_LIST = [PacketSf.SF_7, PacketSf.SF_8, PacketSf.SF_9, PacketSf.SF_10, PacketSf.SF_11, PacketSf.SF_12]
+
+
+def find_overlaps(time, end, max_duration, chunk_start, chunk_end):
+    # Overlapping pairs of events sorted by time with a target in
+    # [chunk_start, chunk_end), as target, interferer and overlap duration
+    # arrays. Pairs do not depend on the PHY model.
+    # Partners of chunk events start at most one longest airtime earlier and
+    # not later than the latest end in the chunk
+    window_start = np.searchsorted(time, time[chunk_start] - max_duration, side='left')
+    window_end = np.searchsorted(time, end[chunk_start:chunk_end].max(), side='right')
+    targets = []
+    interferers = []
+    overlaps = []
+
+    window_time = time[window_start:window_end]
+    window_end_time = end[window_start:window_end]
+    for offset in range(1, window_end - window_start):
+        first = np.arange(0, window_end - window_start - offset)
+        second = first + offset
+        overlapping = window_time[second] <= window_end_time[first]
+        if not overlapping.any():
+            if (window_time[offset:] - window_time[:-offset] > max_duration).all():
+                break
+            continue
+        first = first[overlapping] + window_start
+        second = second[overlapping] + window_start
+        overlap_duration = np.minimum(end[first], end[second]) - time[second]
+        for target, interferer in ((first, second), (second, first)):
+            in_chunk = (target >= chunk_start) & (target < chunk_end)
+            targets.append(target[in_chunk])
+            interferers.append(interferer[in_chunk])
+            overlaps.append(overlap_duration[in_chunk])
+
+    if not targets:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    return np.concatenate(targets), np.concatenate(interferers), np.concatenate(overlaps)
+
+
+def evaluate_link_budgets(time, duration, sf, node_index, link_budgets, chunk_size=65536, phy_list=None):
+    # Reception and interference stage for events sorted by time under every
+    # link budget. Every overlapping pair of transmissions interferes with
+    # each other, a status array of PacketStatus values is returned for each
+    # link budget. Overlapping pairs are searched once per chunk and only
+    # received powers, sensitivities and SNIR thresholds are evaluated per
+    # link budget. PHY models of the link budgets are used unless others are
+    # given.
+    number_of_events = len(time)
+    phy_list = phy_list if phy_list is not None else [link_budget.phy for link_budget in link_budgets]
+    status_list = [np.full(number_of_events, PacketStatus.transmitted.value, dtype=np.int8) for _ in link_budgets]
+    if number_of_events == 0:
+        return status_list
+
+    end = time + duration
+    max_duration = duration.max()
+    sf_index = sf.astype(np.intp) - 7
+    models = []
+    for link_budget, phy, status in zip(link_budgets, phy_list, status_list):
+        rx_sensitivity_dbm = phy.get_sensitivity_array(np.arange(7, 12 + 1))
+        received = link_budget.rx_power_dbm[node_index] >= rx_sensitivity_dbm[sf_index][:, None]
+        status[~received.any(axis=1)] = PacketStatus.under_sensitivity.value
+        models.append((link_budget.rx_power_w[node_index], received, phy.snirThresholdArray[7:, 7:]))
+
+    for chunk_start in range(0, number_of_events, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, number_of_events)
+        target, interferer, overlap = find_overlaps(time, end, max_duration, chunk_start, chunk_end)
+        flat_index = (target - chunk_start) * 6 + sf_index[interferer]
+        chunk = slice(chunk_start, chunk_end)
+        isolation_index = sf_index[chunk]
+
+        for (rx_power_w, received, snir_isolation), status in zip(models, status_list):
+            number_of_gws = rx_power_w.shape[1]
+            energy = np.zeros((chunk_end - chunk_start, number_of_gws, 6))
+            for gw_index in range(number_of_gws):
+                energy[:, gw_index, :] = np.bincount(flat_index, weights=rx_power_w[interferer, gw_index] * overlap, minlength=energy.shape[0] * 6).reshape(-1, 6)
+            signal_energy = rx_power_w[chunk] * duration[chunk][:, None]
+            with np.errstate(divide='ignore'):
+                snir = 10 * np.log10(signal_energy[:, :, None] / energy)
+            isolation = snir_isolation[isolation_index][:, None, :]
+            survived = ((energy == 0) | (snir >= isolation)).all(axis=2) & received[chunk]
+            interfered = received[chunk].any(axis=1) & ~survived.any(axis=1)
+            status[chunk][interfered] = PacketStatus.interfered.value
+
+    return status_list
+
+
+def evaluate_events(time, duration, sf, node_index, link_budget, chunk_size=65536, phy=None):
+    # Reception and interference stage for events sorted by time under one
+    # link budget. Link budget PHY model is used unless another one is given.
+    return evaluate_link_budgets(time, duration, sf, node_index, [link_budget], chunk_size=chunk_size, phy_list=[phy if phy is not None else link_budget.phy])[0]
+
+
+class VectorizedSimulation:
+    # Alternative backend for SF policies that do not depend on simulation
+    # state. All transmissions are generated up front as arrays, sorted once
+    # and evaluated with array operations. Results are statistically
+    # equivalent to the event by event engine in Simulation.
+    def __init__(self, topology, packet_rate, packet_size, simulation_duration, sf, phy=None, traffic=None):
+        assert 0.0001 <= packet_rate <= 10, 'unsupported packet rate {}'.format(packet_rate)
+        assert 51 <= packet_size <= 222, 'unsupported packet size {}'.format(packet_size)
+        assert 10 <= simulation_duration <= 100000, 'unsupported simulation duration {}'.format(simulation_duration)
+        assert sf != PacketSf.SF_Smart, 'SF_Smart depends on simulation state'
+        assert traffic is None or (traffic.numberOfNodes == len(topology.node_list) and traffic.packetRate == packet_rate and traffic.simulationDuration >= simulation_duration), 'unsupported traffic trace {}'.format(traffic)
+
+        self.topology = topology
+        self.packetRate = packet_rate
+        self.packetSize = packet_size
+        self.simulationDuration = simulation_duration
+        self.simulationResult = SimulationResult()
+        self.sf = sf
+        self.phy = phy if phy is not None else topology.phy
+        self.traffic = traffic  # optional TrafficTrace
+        self.time = None
+        self.duration = None
+        self.sfCode = None
+        self.nodeIndex = None
+        self.status = None
+        self.eventQueue = None
+
+    def show_results(self):
+        print('Results:')
+        print('{}'.format(self.simulationResult))
+
+    def get_training_data(self, test_size=0.2, max_samples_per_node_sf=None):
+        return build_training_data(self.topology, self.nodeIndex + len(self.topology.gateway_list) + 1, self.sfCode, self.status, test_size=test_size, max_samples_per_node_sf=max_samples_per_node_sf)
+
+    def __generate_sf(self, rng, shape):
+        if self.sf == PacketSf.SF_Lowest:
+            lowest_sf = np.array([tx_node.lowestSf.value for tx_node in self.topology.node_list], dtype=np.int8)
+            return np.repeat(lowest_sf[:, None], shape[1], axis=1)
+        elif self.sf == PacketSf.SF_Random:
+            return rng.integers(7, 12 + 1, size=shape, dtype=np.int8)
+        else:
+            return np.full(shape, self.sf.value, dtype=np.int8)
+
+    def __generate_transmissions(self, rng, traffic):
+        # Arrivals are taken from the traffic trace, the next transmission of
+        # a node starts a gap after the previous one ends
+        airtime = self.phy.get_airtime_array(np.arange(7, 12 + 1), self.packetSize)
+        interval = traffic.get_gap_matrix()
+        sf = self.__generate_sf(rng, interval.shape)
+        duration = airtime[sf - 7]
+        time = np.cumsum(interval, axis=1) + np.cumsum(duration, axis=1) - duration
+        valid = time <= self.simulationDuration
+        node_index = np.repeat(np.arange(interval.shape[0]), interval.shape[1]).reshape(interval.shape)
+        time = time[valid]
+        order = np.argsort(time, kind='stable')
+        return time[order], duration[valid][order], sf[valid][order], node_index[valid][order]
+
+    def run(self):
+        rng = np.random.default_rng(random.getrandbits(64))
+        traffic = self.traffic if self.traffic is not None else TrafficTrace.generate(self.topology, self.packetRate, self.simulationDuration)
+        self.time, self.duration, self.sfCode, self.nodeIndex = self.__generate_transmissions(rng, traffic)
+        self.status = evaluate_events(self.time, self.duration, self.sfCode, self.nodeIndex, self.topology.get_link_budget(self.phy))
+
+        transmitted = self.status == PacketStatus.transmitted.value
+        self.simulationResult.totalPacket = len(self.time)
+        self.simulationResult.successfulPacket = int(transmitted.sum())
+        self.simulationResult.underSensitivityPacket = int((self.status == PacketStatus.under_sensitivity.value).sum())
+        self.simulationResult.interferencePacket = int((self.status == PacketStatus.interfered.value).sum())
+        self.simulationResult.txEnergyConsumption = float((self.phy.txPowerW * self.duration).sum())
+        self.simulationResult.pdr = 100 * float(self.simulationResult.successfulPacket) / self.simulationResult.totalPacket
+        self.simulationResult.throughput = 8 * float(self.packetSize * self.simulationResult.successfulPacket) / self.duration.sum()
+
+        self.eventQueue = EventStore.from_columns(
+            phy=self.phy,
+            time=self.time, duration=self.duration, sf=self.sfCode,
+            source=self.nodeIndex + len(self.topology.gateway_list) + 1,
+            size=np.full(len(self.time), self.packetSize), status=self.status,
+            energy=self.phy.txPowerW * self.duration)
+        return self.simulationResult
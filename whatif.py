@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019  Tugrul Yatagan <tugrulyatagan@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation;
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; If not, see <http://www.gnu.org/licenses/>.
+
+import copy
+import numpy as np
+from packet import PacketStatus
+from packet import PacketSf
+from simulation import SimulationResult
+from vectorized import evaluate_events
+
+
+def expand_ranges(start, stop):
+    # Owner and value of every integer in the [start, stop) ranges
+    counts = np.maximum(stop - start, 0)
+    owner = np.repeat(np.arange(len(start)), counts)
+    value = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+    return owner, value
+
+
+class WhatIfEvaluator:
+    # Incremental evaluation of SF changes of a few nodes on a completed run,
+    # e.g. for local search over SF assignments. Transmissions of changed
+    # nodes are replaced, with the same start times or, if the run used a
+    # TrafficTrace, rescheduled from its gaps with the new airtimes. Only the
+    # statuses of the new transmissions and of the transmissions that overlap
+    # old or new transmissions of changed nodes are computed, and the result
+    # is updated by the difference. Statuses follow the interference model of
+    # evaluate_events, which the completed run is evaluated with once.
+    def __init__(self, time, duration, sf, node_index, link_budget, packet_size, simulation_duration, traffic=None):
+        order = np.argsort(time, kind='stable')
+        self.time = np.asarray(time, dtype=np.float64)[order]
+        self.duration = np.asarray(duration, dtype=np.float64)[order]
+        self.sf = np.asarray(sf, dtype=np.int8)[order]
+        self.nodeIndex = np.asarray(node_index, dtype=np.intp)[order]
+        self.linkBudget = link_budget
+        self.packetSize = packet_size
+        self.simulationDuration = simulation_duration
+        self.traffic = traffic
+        phy = link_budget.phy
+        self.airtime = phy.get_airtime_array(np.arange(7, 12 + 1), packet_size)
+        self.txPowerW = phy.txPowerW
+        self.rxPowerW = link_budget.rx_power_w
+        self.rxPowerDbm = link_budget.rx_power_dbm
+        self.rxSensitivityDbm = phy.get_sensitivity_array(np.arange(7, 12 + 1))
+        self.snirIsolation = phy.snirThresholdArray[7:, 7:]
+
+        self.status = evaluate_events(self.time, self.duration, self.sf, self.nodeIndex, link_budget)
+        self.__index_nodes()
+        self.simulationResult = SimulationResult()
+        self.successfulSize = 0
+        self.totalDuration = 0.0
+        self.__update_result(self.simulationResult, [], self.status, self.duration, apply=True)
+
+    @staticmethod
+    def from_simulation(simulation, traffic=None):
+        # Completed Simulation or VectorizedSimulation that kept its events
+        event_store = simulation.eventQueue
+        node_index = event_store.get_column('source').astype(np.intp) - len(simulation.topology.gateway_list) - 1
+        return WhatIfEvaluator(event_store.get_column('time'), event_store.get_column('duration'), event_store.get_column('sf'), node_index,
+                               simulation.topology.get_link_budget(simulation.phy), simulation.packetSize, simulation.simulationDuration,
+                               traffic=traffic if traffic is not None else getattr(simulation, 'traffic', None))
+
+    def __index_nodes(self):
+        # Events of node i are nodeEvents[nodeOffsets[i]:nodeOffsets[i + 1]]
+        self.nodeEvents = np.argsort(self.nodeIndex, kind='stable')
+        self.nodeOffsets = np.searchsorted(self.nodeIndex[self.nodeEvents], np.arange(self.linkBudget.shape[0] + 1))
+
+    def get_node_sf(self, node_index):
+        events = self.nodeEvents[self.nodeOffsets[node_index]:self.nodeOffsets[node_index + 1]]
+        return PacketSf(int(self.sf[events[0]])) if len(events) else None
+
+    def __get_transmissions(self, node_index, sf):
+        # Start times of a node transmitting with sf
+        if self.traffic is None:
+            return self.time[self.nodeEvents[self.nodeOffsets[node_index]:self.nodeOffsets[node_index + 1]]]
+        gaps = self.traffic.get_gaps(node_index)
+        time = np.cumsum(gaps) + np.arange(len(gaps)) * self.airtime[sf.value - 7]
+        return time[time <= self.simulationDuration]
+
+    def __update_result(self, result, old_status, new_status, new_duration, apply, old_duration=()):
+        counts = [(PacketStatus.transmitted.value, 'successfulPacket'), (PacketStatus.under_sensitivity.value, 'underSensitivityPacket'), (PacketStatus.interfered.value, 'interferencePacket')]
+        for value, name in counts:
+            setattr(result, name, getattr(result, name) + int(np.count_nonzero(new_status == value)) - int(np.count_nonzero(np.asarray(old_status) == value)))
+        result.totalPacket += len(new_status) - len(old_status)
+        duration_delta = float(np.sum(new_duration)) - float(np.sum(old_duration))
+        result.txEnergyConsumption += self.txPowerW * duration_delta
+        successful_size = self.successfulSize + self.packetSize * (int(np.count_nonzero(new_status == PacketStatus.transmitted.value)) - int(np.count_nonzero(np.asarray(old_status) == PacketStatus.transmitted.value)))
+        total_duration = self.totalDuration + duration_delta
+        result.pdr = 100 * float(result.successfulPacket) / result.totalPacket if result.totalPacket else 0
+        result.throughput = 8 * float(successful_size) / total_duration if total_duration else 0
+        if apply:
+            self.successfulSize = successful_size
+            self.totalDuration = total_duration
+
+    def __add_energy(self, energy, owner, partner_node, partner_sf, overlap):
+        flat_index = owner * 6 + partner_sf.astype(np.intp) - 7
+        for gw_index in range(energy.shape[1]):
+            energy[:, gw_index, :] += np.bincount(flat_index, weights=self.rxPowerW[partner_node, gw_index] * overlap, minlength=energy.shape[0] * 6).reshape(-1, 6)
+
+    def __get_status(self, time, duration, sf, node_index, self_index, removed, new_time, new_duration, new_sf, new_node_index, new_self_index, max_duration):
+        # Statuses of target transmissions against the kept and the new ones,
+        # self indices exclude a target from its own interferers
+        end = time + duration
+        energy = np.zeros((len(time), self.linkBudget.shape[1], 6))
+
+        owner, partner = expand_ranges(np.searchsorted(self.time, time - max_duration, side='left'), np.searchsorted(self.time, end, side='right'))
+        keep = (self.time[partner] + self.duration[partner] >= time[owner]) & ~removed[partner] & (partner != self_index[owner])
+        owner, partner = owner[keep], partner[keep]
+        overlap = np.minimum(self.time[partner] + self.duration[partner], end[owner]) - np.maximum(self.time[partner], time[owner])
+        self.__add_energy(energy, owner, self.nodeIndex[partner], self.sf[partner], overlap)
+
+        owner, partner = expand_ranges(np.searchsorted(new_time, time - max_duration, side='left'), np.searchsorted(new_time, end, side='right'))
+        keep = (new_time[partner] + new_duration[partner] >= time[owner]) & (partner != new_self_index[owner])
+        owner, partner = owner[keep], partner[keep]
+        overlap = np.minimum(new_time[partner] + new_duration[partner], end[owner]) - np.maximum(new_time[partner], time[owner])
+        self.__add_energy(energy, owner, new_node_index[partner], new_sf[partner], overlap)
+
+        sf_index = sf.astype(np.intp) - 7
+        received = self.rxPowerDbm[node_index] >= self.rxSensitivityDbm[sf_index][:, None]
+        signal_energy = self.rxPowerW[node_index] * duration[:, None]
+        with np.errstate(divide='ignore'):
+            snir = 10 * np.log10(signal_energy[:, :, None] / energy)
+        survived = ((energy == 0) | (snir >= self.snirIsolation[sf_index][:, None, :])).all(axis=2) & received
+        status = np.full(len(time), PacketStatus.transmitted.value, dtype=np.int8)
+        status[~received.any(axis=1)] = PacketStatus.under_sensitivity.value
+        status[received.any(axis=1) & ~survived.any(axis=1)] = PacketStatus.interfered.value
+        return status
+
+    def evaluate(self, sf_changes, commit=False):
+        # Result of the run with sf_changes, a dict of node index to PacketSf.
+        # Changes are kept for later evaluations if commit is set.
+        removed_index = np.concatenate([self.nodeEvents[self.nodeOffsets[node_index]:self.nodeOffsets[node_index + 1]] for node_index in sf_changes] + [np.empty(0, dtype=np.intp)])
+        removed = np.zeros(len(self.time), dtype=bool)
+        removed[removed_index] = True
+
+        new_time = []
+        new_node_index = []
+        new_sf = []
+        for node_index, sf in sf_changes.items():
+            time = self.__get_transmissions(node_index, sf)
+            new_time.append(time)
+            new_node_index.append(np.full(len(time), node_index, dtype=np.intp))
+            new_sf.append(np.full(len(time), sf.value, dtype=np.int8))
+        new_time = np.concatenate(new_time + [np.empty(0)])
+        order = np.argsort(new_time, kind='stable')
+        new_time = new_time[order]
+        new_node_index = np.concatenate(new_node_index + [np.empty(0, dtype=np.intp)])[order]
+        new_sf = np.concatenate(new_sf + [np.empty(0, dtype=np.int8)])[order]
+        new_duration = self.airtime[new_sf.astype(np.intp) - 7]
+        max_duration = max(self.duration.max(initial=0), new_duration.max(initial=0))
+
+        # Kept transmissions that overlap removed or new ones
+        changed_time = np.concatenate([self.time[removed_index], new_time])
+        changed_end = np.concatenate([self.time[removed_index] + self.duration[removed_index], new_time + new_duration])
+        _, candidate = expand_ranges(np.searchsorted(self.time, changed_time - max_duration, side='left'), np.searchsorted(self.time, changed_end, side='right'))
+        affected = np.zeros(len(self.time), dtype=bool)
+        affected[candidate] = True
+        affected &= ~removed
+        affected_index = np.nonzero(affected)[0]
+        overlapping = np.zeros(len(affected_index), dtype=bool)
+        if len(affected_index):
+            # Candidates are in the time windows, keep actual overlaps
+            start = self.time[affected_index]
+            end = start + self.duration[affected_index]
+            order = np.argsort(changed_time, kind='stable')
+            sorted_time = changed_time[order]
+            sorted_end = changed_end[order]
+            owner, partner = expand_ranges(np.searchsorted(sorted_time, start - max_duration, side='left'), np.searchsorted(sorted_time, end, side='right'))
+            overlapping[owner[sorted_end[partner] >= start[owner]]] = True
+        affected_index = affected_index[overlapping]
+
+        no_self = np.full(len(new_time), -1)
+        affected_status = self.__get_status(self.time[affected_index], self.duration[affected_index], self.sf[affected_index], self.nodeIndex[affected_index], affected_index, removed,
+                                            new_time, new_duration, new_sf, new_node_index, np.full(len(affected_index), -1), max_duration)
+        new_status = self.__get_status(new_time, new_duration, new_sf, new_node_index, no_self, removed,
+                                       new_time, new_duration, new_sf, new_node_index, np.arange(len(new_time)), max_duration)
+
+        result = copy.copy(self.simulationResult)
+        self.__update_result(result, np.concatenate([self.status[removed_index], self.status[affected_index]]), np.concatenate([new_status, affected_status]),
+                             new_duration, commit, old_duration=self.duration[removed_index])
+        if commit:
+            self.status[affected_index] = affected_status
+            kept = ~removed
+            time = np.concatenate([self.time[kept], new_time])
+            order = np.argsort(time, kind='stable')
+            self.time = time[order]
+            self.duration = np.concatenate([self.duration[kept], new_duration])[order]
+            self.sf = np.concatenate([self.sf[kept], new_sf])[order]
+            self.nodeIndex = np.concatenate([self.nodeIndex[kept], new_node_index])[order]
+            self.status = np.concatenate([self.status[kept], new_status])[order]
+            self.__index_nodes()
+            self.simulationResult = result
+        return result